@@ -0,0 +1,148 @@
+"""
+Generador de un corpus sintetico y determinista de documentos tecnicos para los benchmarks.
+
+Cada documento tiene un codigo propio (INT_LDX_BENCH_0001), parrafos de vocabulario tecnico y un parrafo con un dato
+unico (avance maximo, par de apriete...). Cada pregunta generada apunta a ese dato y sabe de que documento sale,
+asi se puede medir el recall de la recuperacion ademas de la latencia. La misma semilla da siempre el mismo corpus.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.corpus --output bench_corpus --docs 200 --paragraphs 20
+"""
+
+import argparse
+import json
+import os
+import random
+
+from typing import List
+
+
+
+WORDS = (
+    "taladro broca avance velocidad corte aluminio acero titanio tolerancia diametro profundidad "
+    "refrigerante viruta herramienta husillo pieza fijacion norma ensayo calidad inspeccion remache "
+    "drill feed speed cutting tolerance depth coolant chip spindle fixture standard inspection rivet "
+    "countersink reamer burr torque fastener panel skin frame stringer sealant primer"
+).split()
+
+MATERIALS = ["aluminium 2024", "aluminium 7075", "titanium Ti6Al4V", "steel 15-5PH", "CFRP laminate", "Inconel 718"]
+
+PARAMETERS = [
+    ("maximum feed", "mm/rev"),
+    ("spindle speed", "rpm"),
+    ("hole tolerance", "mm"),
+    ("installation torque", "N·m"),
+    ("countersink depth", "mm"),
+]
+
+
+def document_code(index: int) -> str:
+
+    return f"INT_LDX_BENCH_{index:04d}"
+
+
+def generate_corpus(output_dir: str,
+                    n_docs: int,
+                    paragraphs: int = 20,
+                    words_per_paragraph: int = 80,
+                    seed: int = 0) -> List[dict]:
+    """
+    Escribe n_docs documentos .txt en output_dir y devuelve sus datos (ruta, codigo y el dato unico).
+    Si los archivos ya existen con el mismo contenido no se reescriben, asi no cambia su mtime entre ejecuciones.
+
+    Params:
+        output_dir (str): Directorio de salida
+        n_docs (int): Numero de documentos
+        paragraphs (int, optional): Parrafos por documento. Por defecto 20.
+        words_per_paragraph (int, optional): Palabras por parrafo. Por defecto 80.
+        seed (int, optional): Semilla. Por defecto 0.
+
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    documents = []
+
+    for index in range(n_docs):
+        rng = random.Random(f"{seed}:{index}")
+        code = document_code(index)
+        material = rng.choice(MATERIALS)
+        parameter, unit = rng.choice(PARAMETERS)
+        value = round(rng.uniform(0.05, 50.0), 2)
+
+        body = [" ".join(rng.choice(WORDS) for _ in range(words_per_paragraph)) + "." for _ in range(paragraphs)]
+        fact = f"For {material} parts the {parameter} defined in {code} is {value} {unit}."
+        body.insert(rng.randrange(len(body) + 1), fact)
+
+        text = f"{code} - Procedure for {material}\n\n" + "\n\n".join(body) + "\n"
+        path = os.path.join(output_dir, f"{code}.txt")
+
+        if not os.path.exists(path) or open(path, encoding="utf-8").read() != text:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+        documents.append({
+            "path": path,
+            "code": code,
+            "material": material,
+            "parameter": parameter,
+            "value": value,
+            "unit": unit,
+        })
+
+    return documents
+
+
+def generate_questions(documents: List[dict], n_questions: int, seed: int = 0) -> List[dict]:
+    """
+    Genera preguntas sobre el dato unico de documentos elegidos al azar. La mitad nombran el codigo del documento
+    (consultas con identificador, donde manda BM25) y la otra mitad solo el material y el parametro.
+
+    Params:
+        documents (List[dict]): Resultado de generate_corpus
+        n_questions (int): Numero de preguntas
+        seed (int, optional): Semilla. Por defecto 0.
+
+    Returns:
+        List[dict]: {"query", "source", "answer"} por pregunta
+    """
+    rng = random.Random(seed)
+    questions = []
+
+    for i in range(n_questions):
+        document = rng.choice(documents)
+
+        if i % 2 == 0:
+            query = f"What is the {document['parameter']} in {document['code']}?"
+        else:
+            query = f"What {document['parameter']} should be used for {document['material']} parts?"
+
+        questions.append({
+            "query": query,
+            "source": document["path"],
+            "answer": f"{document['value']} {document['unit']}",
+        })
+
+    return questions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Generador de corpus sintetico para benchmarks")
+    parser.add_argument("--output", default="bench_corpus")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--words", type=int, default=80, help="Palabras por parrafo")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = generate_corpus(args.output, args.docs, args.paragraphs, args.words, args.seed)
+    questions = generate_questions(documents, args.questions, args.seed)
+
+    with open(os.path.join(args.output, "questions.json"), "w", encoding="utf-8") as f:
+        json.dump(questions, f, indent=2, ensure_ascii=False)
+
+    print(f"Wrote {len(documents)} documents and {len(questions)} questions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
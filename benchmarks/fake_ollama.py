@@ -0,0 +1,307 @@
+"""
+Servidor falso de Ollama para probar y medir el sistema sin modelos reales.
+
+Implementa /api/embed con embeddings deterministas (el mismo texto siempre da el mismo vector),
+con latencia y errores configurables para probar el batching y los reintentos de Ollama_Embedding,
+y /api/generate con respuestas deterministas (stream NDJSON o respuesta completa) con latencia hasta el
+primer token y entre tokens configurables, para medir el servidor sin el coste del modelo.
+
+Uso:
+    python benchmarks/fake_ollama.py --port 11435 --latency 0.05 --fail-rate 0.1 --first-token-latency 0.2 --token-latency 0.02
+
+    EMBED_MODEL = Ollama_Embedding("fake-embed", host="http://localhost:11435")
+    TEXT_MODEL = Ollama_LLM("fake-llm", host="http://localhost:11435")
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+GENERATE_WORDS = (
+    "the drill feed must stay below the tolerance given in the table for aluminium and titanium parts "
+    "use coolant and check the spindle speed before each inspection according to the standard"
+).split()
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """
+    Vector determinista para un texto, generado a partir de su hash.
+
+    Params:
+        text (str): Texto
+        dim (int): Dimension del vector
+
+    """
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode()).digest()
+        values.extend(v / 2**31 - 1.0 for v in struct.unpack("<8I", digest))
+        counter += 1
+    return values[:dim]
+
+
+def fake_response_tokens(prompt: str, n_tokens: int) -> list:
+    """
+    Tokens deterministas de respuesta para un prompt (el mismo prompt siempre da la misma respuesta).
+
+    Params:
+        prompt (str): Prompt
+        n_tokens (int): Numero de tokens
+
+    """
+    seed = int.from_bytes(hashlib.sha256(prompt.encode()).digest()[:8], "little")
+    rng = random.Random(seed)
+    return [rng.choice(GENERATE_WORDS) + " " for _ in range(n_tokens)]
+
+
+class Fake_Ollama_Server:
+    """
+    Servidor HTTP que imita la API de Ollama.
+
+    Params:
+        host (str, optional): Interfaz donde escuchar. Por defecto "127.0.0.1".
+        port (int, optional): Puerto. 0 elige uno libre. Por defecto 11435.
+        dim (int, optional): Dimension de los embeddings. Por defecto 64.
+        embed_latency (float, optional): Latencia fija por peticion de embeddings en segundos. Por defecto 0.
+        embed_latency_per_text (float, optional): Latencia extra por texto de la peticion. Por defecto 0.
+        fail_rate (float, optional): Probabilidad de devolver un error 500. Por defecto 0.
+        max_batch (int, optional): Si se indica, las peticiones con mas textos devuelven un error 413. Por defecto None.
+        seed (int, optional): Semilla para los errores aleatorios. Por defecto 0.
+        generate_tokens (int, optional): Tokens de cada respuesta de /api/generate. Por defecto 32.
+        first_token_latency (float, optional): Segundos hasta el primer token (carga del prompt). Por defecto 0.
+        token_latency (float, optional): Segundos entre tokens. Por defecto 0.
+
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 11435,
+                 dim: int = 64,
+                 embed_latency: float = 0.0,
+                 embed_latency_per_text: float = 0.0,
+                 fail_rate: float = 0.0,
+                 max_batch: int = None,
+                 seed: int = 0,
+                 generate_tokens: int = 32,
+                 first_token_latency: float = 0.0,
+                 token_latency: float = 0.0):
+
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_latency_per_text = embed_latency_per_text
+        self.fail_rate = fail_rate
+        self.max_batch = max_batch
+        self.generate_tokens = generate_tokens
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"embed_requests": 0, "embed_texts": 0, "generate_requests": 0, "generated_tokens": 0, "errors": 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def start(self):
+        """
+        Arranca el servidor en un hilo en segundo plano.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+
+    def stop(self):
+        """
+        Para el servidor.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+    def _should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.fail_rate
+
+
+    def _make_handler(self):
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+
+                if self.path == "/api/embed":
+                    server._handle_embed(self, request)
+                elif self.path == "/api/generate":
+                    server._handle_generate(self, request)
+                else:
+                    self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+        return Handler
+
+
+    def _handle_embed(self, handler: BaseHTTPRequestHandler, request: dict):
+
+        texts = request.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+
+        with self.lock:
+            self.stats["embed_requests"] += 1
+
+        time.sleep(self.embed_latency + self.embed_latency_per_text * len(texts))
+
+        if self.max_batch is not None and len(texts) > self.max_batch:
+            with self.lock:
+                self.stats["errors"] += 1
+            handler._send_json(413, {"error": f"batch too large ({len(texts)} > {self.max_batch})"})
+            return
+
+        if self._should_fail():
+            with self.lock:
+                self.stats["errors"] += 1
+            handler._send_json(500, {"error": "fake embed failure"})
+            return
+
+        with self.lock:
+            self.stats["embed_texts"] += len(texts)
+
+        handler._send_json(200, {
+            "model": request.get("model", ""),
+            "embeddings": [fake_embedding(text, self.dim) for text in texts],
+        })
+
+
+    def _handle_generate(self, handler: BaseHTTPRequestHandler, request: dict):
+
+        prompt = request.get("prompt", "")
+        model = request.get("model", "")
+        start = time.perf_counter()
+
+        with self.lock:
+            self.stats["generate_requests"] += 1
+
+        if self._should_fail():
+            with self.lock:
+                self.stats["errors"] += 1
+            handler._send_json(500, {"error": "fake generate failure"})
+            return
+
+        tokens = fake_response_tokens(prompt, self.generate_tokens)
+        prompt_tokens = len(prompt.split())
+
+        def event(response: str, done: bool, **extra) -> dict:
+            return {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "response": response, "done": done, **extra}
+
+        def final_stats(eval_start: float) -> dict:
+            # Duraciones en nanosegundos, como Ollama
+            return {
+                "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int((eval_start - start) * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int((time.perf_counter() - eval_start) * 1e9),
+            }
+
+        time.sleep(self.first_token_latency)
+        eval_start = time.perf_counter()
+
+        if not request.get("stream", True):
+            time.sleep(self.token_latency * max(0, len(tokens) - 1))
+            with self.lock:
+                self.stats["generated_tokens"] += len(tokens)
+            handler._send_json(200, event("".join(tokens).strip(), True, **final_stats(eval_start)))
+            return
+
+        # Stream NDJSON sin Content-Length: el cliente lee hasta que se cierra la conexion (HTTP/1.0)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.end_headers()
+
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(self.token_latency)
+                handler.wfile.write((json.dumps(event(token, False)) + "\n").encode())
+                handler.wfile.flush()
+
+            handler.wfile.write((json.dumps(event("", True, **final_stats(eval_start))) + "\n").encode())
+            handler.wfile.flush()
+
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente cancelo la respuesta
+            pass
+
+        with self.lock:
+            self.stats["generated_tokens"] += len(tokens)
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Servidor falso de Ollama")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia fija por peticion de embeddings (s)")
+    parser.add_argument("--latency-per-text", type=float, default=0.0, help="Latencia extra por texto (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--max-batch", type=int, default=None)
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens por respuesta de /api/generate")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="Segundos hasta el primer token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Segundos entre tokens")
+    args = parser.parse_args()
+
+    server = Fake_Ollama_Server(host=args.host,
+                                port=args.port,
+                                dim=args.dim,
+                                embed_latency=args.latency,
+                                embed_latency_per_text=args.latency_per_text,
+                                fail_rate=args.fail_rate,
+                                max_batch=args.max_batch,
+                                generate_tokens=args.tokens,
+                                first_token_latency=args.first_token_latency,
+                                token_latency=args.token_latency)
+
+    print(f"Fake Ollama running on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Generador de carga para /query/stream. Abre sesiones concurrentes que hacen consultas seguidas (como pestañas del
+frontend, cada una con su session_id), lee el stream JSONL como App.js (chunk, images, final, error) y sube la
+concurrencia por etapas. Por cada etapa da percentiles de TTFT, latencia entre tokens y latencia total, throughput
+y tasa de errores, y los tiempos medios por etapa del servidor (leidos de /metrics) para separar la cola del
+servidor del trabajo de cada consulta.
+
+Por defecto no necesita modelos: arranca el servidor falso de Ollama (benchmarks/fake_ollama.py) y uvicorn con main:app
+apuntando a el (OLLAMA_HOST), con un corpus sintetico que se sube con el watcher (WATCH_DIRS). Asi se mide el coste
+propio del servidor y su comportamiento con colas, independiente del modelo.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.load_stream
+    python -m benchmarks.load_stream --concurrency 1 8 32 64 --stage-seconds 30 --first-token-latency 0.3
+    python -m benchmarks.load_stream --url http://localhost:8000 --questions-file test_prompts.txt
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.corpus import generate_corpus, generate_questions
+
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGE_SAMPLE = re.compile(r'^rag_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+CACHED_SAMPLE = re.compile(r'^rag_requests_total\{cached="(true|false)"\} (\S+)$')
+
+
+def percentile(values: List[float], p: float) -> float:
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+def summary_ms(seconds: List[float], prefix: str) -> dict:
+    """
+    p50/p90/p99 y maximo en milisegundos.
+    """
+    return {
+        f"{prefix}_ms_p50": round(percentile(seconds, 0.5) * 1000, 2),
+        f"{prefix}_ms_p90": round(percentile(seconds, 0.9) * 1000, 2),
+        f"{prefix}_ms_p99": round(percentile(seconds, 0.99) * 1000, 2),
+        f"{prefix}_ms_max": round(max(seconds) * 1000, 2) if seconds else 0.0,
+    }
+
+
+def free_port() -> int:
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> str:
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_stage_metrics(text: str) -> Dict[str, List[float]]:
+    """
+    Lee la suma y el conteo de cada etapa de rag_stage_seconds del texto de /metrics, y en "cached" las consultas
+    respondidas desde la cache semantica y las totales.
+
+    Returns:
+        Dict[str, List[float]]: {etapa: [suma, conteo]}
+    """
+    stages = {"cached": [0.0, 0.0]}
+    for line in text.splitlines():
+        match = STAGE_SAMPLE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            stages.setdefault(stage, [0.0, 0.0])[0 if kind == "sum" else 1] = float(value)
+
+        match = CACHED_SAMPLE.match(line)
+        if match:
+            if match.group(1) == "true":
+                stages["cached"][0] += float(match.group(2))
+            stages["cached"][1] += float(match.group(2))
+    return stages
+
+
+def stage_means(before: Dict[str, List[float]], after: Dict[str, List[float]]) -> Dict[str, float]:
+    """
+    Media (ms) de cada etapa del servidor entre dos lecturas de /metrics.
+    """
+    means = {}
+    for stage, (total, count) in after.items():
+        if stage == "cached":
+            continue
+        previous_total, previous_count = before.get(stage, [0.0, 0.0])
+        if count > previous_count:
+            means[stage] = round((total - previous_total) / (count - previous_count) * 1000, 2)
+    return means
+
+
+async def stream_query(client: httpx.AsyncClient, url: str, query: str, session_id: str, timeout: float) -> dict:
+    """
+    Hace una consulta a /query/stream y mide el stream. Procesa las lineas como App.js: "chunk" añade texto,
+    "images" y "final" llegan una vez y "error" corta la respuesta.
+
+    Returns:
+        dict: ttft, gaps entre tokens, total, tokens y error (None si la respuesta llega completa con su "final")
+    """
+    result = {"ttft": None, "gaps": [], "total": None, "tokens": 0, "error": None}
+    start = time.perf_counter()
+    last_token = None
+    final = False
+
+    try:
+        async with client.stream("POST", f"{url}/query/stream", json={"query": query, "session_id": session_id}, timeout=timeout) as response:
+            if response.status_code != 200:
+                result["error"] = f"http_{response.status_code}"
+                return result
+
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    result["error"] = "invalid_json"
+                    continue
+
+                if item.get("type") == "chunk" and item.get("content"):
+                    now = time.perf_counter()
+                    if last_token is None:
+                        result["ttft"] = now - start
+                    else:
+                        result["gaps"].append(now - last_token)
+                    last_token = now
+                    result["tokens"] += 1
+
+                elif item.get("type") == "final":
+                    final = True
+
+                elif item.get("type") == "error":
+                    result["error"] = "stream_error"
+
+    except httpx.TimeoutException:
+        result["error"] = "timeout"
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+
+    result["total"] = time.perf_counter() - start
+    if result["error"] is None and not final:
+        result["error"] = "incomplete"
+
+    return result
+
+
+async def run_stage(url: str, concurrency: int, questions: List[str], args, rng: random.Random) -> dict:
+    """
+    Mantiene concurrency sesiones haciendo consultas durante stage_seconds. Las sesiones arrancan repartidas en
+    ramp_seconds y cambian de session_id cada turns_per_session consultas (con historial, algunas pasan por el
+    query enhancer). Al acabar la etapa no se lanzan consultas nuevas y se esperan las que estan en vuelo.
+    """
+    results = []
+    deadline = time.perf_counter() + args.ramp_seconds + args.stage_seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        metrics_before = parse_stage_metrics((await client.get(f"{url}/metrics")).text)
+
+        async def session(index: int):
+            await asyncio.sleep(args.ramp_seconds * index / concurrency)
+            turn = 0
+
+            while time.perf_counter() < deadline:
+                session_id = f"load-{concurrency}-{index}-{turn // args.turns_per_session}"
+                query = rng.choice(questions)
+                if args.unique_queries:
+                    # Sufijo distinto en cada consulta para que ninguna salga de la cache semantica
+                    query = f"{query} (#{concurrency}-{index}-{turn})"
+
+                result = await stream_query(client, url, query, session_id, args.timeout)
+                result["concurrency"] = concurrency
+                results.append(result)
+                turn += 1
+
+                if args.think_time:
+                    await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(session(i) for i in range(concurrency)))
+        wall = time.perf_counter() - start
+
+        metrics_after = parse_stage_metrics((await client.get(f"{url}/metrics")).text)
+
+    ok = [result for result in results if result["error"] is None]
+    errors = {}
+    for result in results:
+        if result["error"]:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 2),
+        "tokens_per_s": round(sum(result["tokens"] for result in ok) / wall, 1),
+        **summary_ms([result["ttft"] for result in ok if result["ttft"] is not None], "ttft"),
+        **summary_ms([gap for result in ok for gap in result["gaps"]], "itl"),
+        **summary_ms([result["total"] for result in ok], "total"),
+        "server_cache_hit_rate": round((metrics_after["cached"][0] - metrics_before["cached"][0]) / (metrics_after["cached"][1] - metrics_before["cached"][1]), 4)
+                                 if metrics_after["cached"][1] > metrics_before["cached"][1] else 0.0,
+        "server_stages_ms": stage_means(metrics_before, metrics_after),
+    }
+
+
+def wait_until_ready(url: str, timeout: float, process: subprocess.Popen = None):
+    """
+    Espera a que el servidor responda en /health y a que el watcher haya subido el corpus.
+    """
+    deadline = time.perf_counter() + timeout
+
+    while time.perf_counter() < deadline:
+        if process and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+
+        try:
+            health = httpx.get(f"{url}/health", timeout=2).json()
+            watcher = health.get("ingest_watcher")
+            if health.get("rag_system") == "initialized" and (not watcher or (watcher["batches"] and not watcher["pending"])):
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+
+        time.sleep(0.5)
+
+    raise TimeoutError(f"Server at {url} not ready after {timeout}s")
+
+
+def start_local_server(args, workdir: str) -> tuple:
+    """
+    Arranca el servidor falso de Ollama y uvicorn con main:app en procesos separados del generador de carga.
+
+    Returns:
+        Tuple[str, List[subprocess.Popen]]: (url del servidor, procesos a parar al terminar)
+    """
+    corpus = os.path.join(workdir, "corpus")
+    generate_corpus(corpus, args.docs, seed=args.seed)
+    os.makedirs(os.path.join(workdir, "images"), exist_ok=True)
+
+    log = open(os.path.join(workdir, "server.log"), "w")
+    ollama_port = free_port()
+    fake_ollama = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_ollama",
+                                    "--port", str(ollama_port),
+                                    "--tokens", str(args.tokens),
+                                    "--first-token-latency", str(args.first_token_latency),
+                                    "--token-latency", str(args.token_latency),
+                                    "--latency", str(args.embed_latency)],
+                                   cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT)
+
+    port = free_port()
+    env = dict(os.environ,
+               PYTHONPATH=REPO_ROOT,
+               OLLAMA_HOST=f"http://127.0.0.1:{ollama_port}",
+               WATCH_DIRS=corpus,
+               RERANKER_BACKEND=args.reranker)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app",
+                               "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+                              cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(url, args.startup_timeout, server)
+    except Exception:
+        for process in (server, fake_ollama):
+            process.terminate()
+        raise
+
+    return url, [server, fake_ollama]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Generador de carga para /query/stream")
+    parser.add_argument("--url", default=None, help="Servidor ya arrancado (p.ej. http://localhost:8000). Por defecto uno local con LLM falso")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 32], help="Sesiones simultaneas de cada etapa")
+    parser.add_argument("--stage-seconds", type=float, default=20.0, help="Duracion de cada etapa una vez arrancadas las sesiones")
+    parser.add_argument("--ramp-seconds", type=float, default=2.0, help="Segundos en los que se reparten los arranques de sesion")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pausa media entre consultas de una sesion (s)")
+    parser.add_argument("--turns-per-session", type=int, default=3, help="Consultas por session_id antes de empezar una sesion nueva")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout por consulta (s)")
+    parser.add_argument("--unique-queries", action="store_true", help="Hace cada consulta distinta para no responder desde la cache semantica")
+    parser.add_argument("--questions-file", default=None, help="Una pregunta por linea. Por defecto preguntas del corpus sintetico")
+    parser.add_argument("--docs", type=int, default=100, help="Documentos del corpus sintetico del servidor local")
+    parser.add_argument("--reranker", default="none", choices=["none", "torch", "onnx"], help="RERANKER_BACKEND del servidor local")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens por respuesta del LLM falso")
+    parser.add_argument("--first-token-latency", type=float, default=0.1, help="Latencia del LLM falso hasta el primer token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Latencia del LLM falso entre tokens (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="Latencia del servidor falso por peticion de embeddings (s)")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Directorio del servidor local. Por defecto uno temporal")
+    parser.add_argument("--output", default=None, help="Archivo JSON. Por defecto benchmarks/results/load_stream_<commit>.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    commit = git_commit()
+    output = os.path.abspath(args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"load_stream_{commit or 'unknown'}.json"))
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="rag_load_")
+    processes = []
+    stages = []
+
+    try:
+        url = args.url
+        if url is None:
+            print("Starting fake Ollama and API server...")
+            url, processes = start_local_server(args, workdir)
+        else:
+            wait_until_ready(url, args.startup_timeout)
+
+        if args.questions_file:
+            with open(args.questions_file, encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        else:
+            documents = generate_corpus(os.path.join(workdir, "corpus"), args.docs, seed=args.seed)
+            questions = [question["query"] for question in generate_questions(documents, 200, args.seed)]
+
+        print(f"\n{'sessions':>8} {'req':>6} {'err %':>6} {'req/s':>7} {'tok/s':>8} {'TTFT p50':>9} {'p90':>8} {'p99':>8} {'ITL p50':>8} {'p99':>8} {'total p90':>10} {'cache %':>8}")
+
+        for concurrency in args.concurrency:
+            stage = asyncio.run(run_stage(url, concurrency, questions, args, rng))
+            stages.append(stage)
+
+            print(f"{concurrency:>8} {stage['requests']:>6} {stage['error_rate'] * 100:>6.1f} {stage['throughput_rps']:>7.2f} {stage['tokens_per_s']:>8.1f} "
+                  f"{stage['ttft_ms_p50']:>9.1f} {stage['ttft_ms_p90']:>8.1f} {stage['ttft_ms_p99']:>8.1f} "
+                  f"{stage['itl_ms_p50']:>8.1f} {stage['itl_ms_p99']:>8.1f} {stage['total_ms_p90']:>10.1f} {stage['server_cache_hit_rate'] * 100:>8.1f}")
+
+    finally:
+        for process in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {"commit": commit, "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "url": args.url or "local"},
+        "config": vars(args),
+        "stages": stages,
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+"""
+Suite de benchmarks reproducible del sistema RAG. Por defecto no necesita modelos: arranca el servidor falso de Ollama
+(embeddings y generacion deterministas con latencias configurables) y genera un corpus sintetico, asi dos ejecuciones
+con la misma configuracion solo se diferencian por el codigo que se mide.
+
+Escenarios:
+    ingest     Subida en frio de corpus de varios tamaños (archivos/s, chunks/s) y re-subida sin cambios
+    retrieval  Latencia de retrieve (dense y hybrid), tiempos por etapa y recall@k por tamaño de corpus
+    rerank     Coste del reranking frente a k: latencia, pares puntuados y recall@top_k antes y despues
+    e2e        TTFT, latencia total y tokens/s de invoke_for_frontend_async con varias consultas concurrentes
+
+Cada corpus se mide en su propio proceso, con su propia base de datos y su servidor falso.
+Los resultados se guardan en JSON junto con el commit, y --compare muestra la diferencia con otra ejecucion.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.rag_suite
+    python -m benchmarks.rag_suite --sizes 50 200 --scenarios ingest retrieval --output results.json
+    python -m benchmarks.rag_suite --compare benchmarks/results/rag_suite_0c32a3a.json
+    python -m benchmarks.rag_suite --host http://localhost:11434 --embed-model mxbai-embed-large --llm mistral:7b \\
+        --corpus ./lidax_pdf --questions-file test_prompts.txt --reranker torch
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+
+from benchmarks.corpus import generate_corpus, generate_questions
+from benchmarks.fake_ollama import Fake_Ollama_Server
+from model_interfaces import Tracing
+from model_interfaces.BM25_Index import tokenize
+from model_interfaces.Chroma_RAG import Chroma_RAG
+from model_interfaces.Embedding_Model import Ollama_Embedding
+from model_interfaces.Reranker_Model import Reranker_Model
+from model_interfaces.Text_Model import Ollama_LLM
+from model_interfaces.file_readers import Text_Splitter_Spec
+
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("ingest", "retrieval", "rerank", "e2e")
+
+# Campos que identifican una fila de cada escenario y metricas que se comparan con --compare
+ROW_KEYS = {
+    "ingest": ("dataset",),
+    "retrieval": ("dataset", "mode"),
+    "rerank": ("dataset", "k"),
+    "e2e": ("dataset", "concurrency"),
+}
+
+COMPARED_METRICS = {
+    "ingest": ("seconds", "chunks_per_s", "noop_seconds"),
+    "retrieval": ("latency_ms_p50", "latency_ms_p95", "recall_at_k"),
+    "rerank": ("latency_ms_p50", "latency_ms_p95", "recall_at_top_k"),
+    "e2e": ("ttft_ms_p50", "ttft_ms_p95", "total_ms_p50", "total_ms_p95", "throughput_qps"),
+}
+
+
+class Lexical_Reranker(Reranker_Model):
+    """
+    Reranker determinista para benchmarks sin modelo: puntua por palabras en comun con la consulta
+    y simula el coste de inferencia con una espera por par.
+
+    Params:
+        pair_cost (float, optional): Segundos por par puntuado. Por defecto 0.0005.
+        **kwargs: Parametros de Reranker_Model
+
+    """
+
+    def __init__(self, pair_cost: float = 0.0005, **kwargs):
+
+        super().__init__("lexical", **kwargs)
+
+        self.pair_cost = pair_cost
+
+
+    def _score(self, pairs):
+
+        time.sleep(self.pair_cost * len(pairs))
+        return [len(set(tokenize(query)) & set(tokenize(document))) for query, document in pairs]
+
+
+def percentile(values: List[float], p: float) -> float:
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+def latency_summary(seconds: List[float], prefix: str = "latency") -> dict:
+    """
+    p50/p95/p99 y media en milisegundos.
+    """
+    return {
+        f"{prefix}_ms_p50": round(percentile(seconds, 0.5) * 1000, 2),
+        f"{prefix}_ms_p95": round(percentile(seconds, 0.95) * 1000, 2),
+        f"{prefix}_ms_p99": round(percentile(seconds, 0.99) * 1000, 2),
+        f"{prefix}_ms_mean": round(sum(seconds) / len(seconds) * 1000, 2) if seconds else 0.0,
+    }
+
+
+def mean_timings(timings: List[Dict[str, float]]) -> Dict[str, float]:
+    """
+    Media por etapa (ms) de una lista de Request_Trace.timings(). Las etapas que faltan en una consulta cuentan como 0.
+    """
+    stages = {}
+    for timing in timings:
+        for stage, ms in timing.items():
+            stages[stage] = stages.get(stage, 0.0) + ms
+    return {stage: round(total / len(timings), 2) for stage, total in stages.items()} if timings else {}
+
+
+def git_info() -> dict:
+
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def build_reranker(args) -> Reranker_Model:
+
+    if args.reranker == "lexical":
+        return Lexical_Reranker(pair_cost=args.pair_cost, batch_size=args.rerank_batch_size)
+
+    from benchmarks.reranker_backends import load_backend
+
+    return load_backend(args.reranker, args.reranker_model, args.rerank_batch_size)
+
+
+def load_datasets(args, workdir: str) -> List[dict]:
+    """
+    Corpus sinteticos de cada tamaño de --sizes, o el directorio de --corpus con las preguntas de --questions-file
+    (sin documento esperado, asi que sin recall).
+    """
+    if args.corpus:
+        with open(args.questions_file, encoding="utf-8") as f:
+            questions = [{"query": line.strip(), "source": None} for line in f if line.strip()]
+
+        return [{"name": os.path.basename(os.path.normpath(args.corpus)), "path": os.path.abspath(args.corpus), "questions": questions}]
+
+    datasets = []
+    for size in args.sizes:
+        path = os.path.join(workdir, f"corpus_{size}")
+        documents = generate_corpus(path, size, args.paragraphs, args.words, args.seed)
+        datasets.append({
+            "name": f"synthetic_{size}",
+            "path": path,
+            "questions": generate_questions(documents, max(args.queries, args.e2e_queries), args.seed),
+        })
+
+    return datasets
+
+
+def build_rag(args, store: str, host: str, **kwargs) -> Chroma_RAG:
+    """
+    Crea un Chroma_RAG con la base de datos y el cache_dir en store. PersistentClient usa "./chroma" del directorio
+    actual y Chroma reutiliza el cliente por esa ruta, por eso cada corpus se mide en su propio proceso.
+    """
+    os.makedirs(store, exist_ok=True)
+    os.chdir(store)
+
+    return Chroma_RAG(embedding_model=Ollama_Embedding(args.embed_model, host=host),
+                      text_splitter=Text_Splitter_Spec(args.chunk_size, args.chunk_overlap),
+                      cache_dir=os.path.join(store, ".rag_cache"),
+                      ingest_workers=args.ingest_workers,
+                      retrieval_mode="hybrid",
+                      **kwargs)
+
+
+def is_hit(question: dict, metadatas: List[dict]) -> Any:
+    """
+    Indica si el documento esperado de la pregunta esta entre los chunks, o None si no hay documento esperado.
+    """
+    if not question["source"]:
+        return None
+    return any(os.path.abspath(metadata.get("source", "")) == os.path.abspath(question["source"]) for metadata in metadatas)
+
+
+def recall(hits: List[Any]) -> Any:
+
+    hits = [hit for hit in hits if hit is not None]
+    return round(sum(hits) / len(hits), 4) if hits else None
+
+
+def bench_ingest(rag: Chroma_RAG, dataset: dict, server: Fake_Ollama_Server) -> dict:
+    """
+    Subida en frio del corpus y re-subida sin cambios (solo recorrido del directorio y manifest).
+    """
+    embed_requests = server.stats["embed_requests"] if server else None
+
+    def ingest() -> float:
+        start = time.perf_counter()
+        message = rag.add_to_vector_store([dataset["path"]])
+        # add_to_vector_store devuelve los errores como texto en lugar de lanzarlos
+        if message.strip().startswith("Error"):
+            raise RuntimeError(message.strip())
+        return time.perf_counter() - start
+
+    seconds = ingest()
+    stats = dict(rag.last_ingest_stats or {})
+
+    noop_seconds = ingest()
+
+    return {
+        "dataset": dataset["name"],
+        "files": stats.get("files", 0),
+        "chunks": stats.get("chunks", 0),
+        "seconds": round(seconds, 3),
+        "files_per_s": round(stats.get("files", 0) / seconds, 2),
+        "chunks_per_s": round(stats.get("chunks", 0) / seconds, 2),
+        "mb_per_s": round(stats.get("bytes", 0) / 1024**2 / seconds, 3),
+        "embed_requests": server.stats["embed_requests"] - embed_requests if server else None,
+        "noop_seconds": round(noop_seconds, 3),
+    }
+
+
+def bench_retrieval(rag: Chroma_RAG, dataset: dict, args) -> List[dict]:
+    """
+    Latencia de retrieve con las caches de consultas vacias, en modo dense y hybrid.
+    """
+    questions = dataset["questions"][:args.queries]
+    rows = []
+
+    for mode in args.modes:
+        rag.retrieval_mode = mode
+        latencies, hits, timings = [], [], []
+
+        for question in questions:
+            rag.results_cache.clear()
+            rag.query_embedding_cache.clear()
+
+            with Tracing.activate(Tracing.Request_Trace()) as trace:
+                start = time.perf_counter()
+                results = rag.retrieve(question["query"])
+                latencies.append(time.perf_counter() - start)
+
+            timings.append(trace.timings())
+            hits.append(is_hit(question, results["metadatas"][0]))
+
+        rows.append({
+            "dataset": dataset["name"],
+            "chunks": rag.vector_store.count(),
+            "mode": mode,
+            "k": rag.k,
+            "queries": len(questions),
+            **latency_summary(latencies),
+            "recall_at_k": recall(hits),
+            "stages_ms": mean_timings(timings),
+        })
+
+    rag.retrieval_mode = "hybrid"
+    return rows
+
+
+def bench_rerank(rag: Chroma_RAG, dataset: dict, args) -> List[dict]:
+    """
+    Coste del reranking de k candidatos para cada k, con la cache de puntuaciones vacia.
+    """
+    questions = dataset["questions"][:args.queries]
+    rows = []
+
+    for k in args.k_values:
+        rag.k = k
+        latencies, hits_before, hits_after, pairs = [], [], [], 0
+
+        for question in questions:
+            results = rag.retrieve(question["query"])
+            documents, metadatas = results["documents"][0], results["metadatas"][0]
+            rag.reranker.score_cache.clear()
+
+            start = time.perf_counter()
+            _, reranked_metadatas = rag.rerank_documents(question["query"], documents, metadatas, results["ids"][0], results.get("distances", [None])[0])
+            latencies.append(time.perf_counter() - start)
+
+            pairs += len(documents)
+            hits_before.append(is_hit(question, metadatas[:rag.top_k]))
+            hits_after.append(is_hit(question, reranked_metadatas[:rag.top_k]))
+
+        rows.append({
+            "dataset": dataset["name"],
+            "k": k,
+            "top_k": rag.top_k,
+            "reranker": rag.reranker.model_name,
+            "queries": len(questions),
+            "pairs_per_query": round(pairs / len(questions), 2) if questions else 0.0,
+            **latency_summary(latencies),
+            "recall_at_top_k_before": recall(hits_before),
+            "recall_at_top_k": recall(hits_after),
+        })
+
+    return rows
+
+
+async def bench_e2e(rag: Chroma_RAG, dataset: dict, args) -> List[dict]:
+    """
+    Consultas completas por invoke_for_frontend_async con concurrency consultas a la vez. El TTFT se mide desde que
+    la consulta empieza a ejecutarse hasta el primer chunk con texto. Todos los niveles en el mismo event loop
+    (los clientes asincronos de Ollama no se pueden pasar de un loop a otro).
+    """
+    questions = dataset["questions"][:args.e2e_queries]
+    rows = []
+
+    for concurrency in args.concurrency:
+        rag.results_cache.clear()
+        rag.query_embedding_cache.clear()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(i: int, question: dict) -> dict:
+            async with semaphore:
+                start = time.perf_counter()
+                result = {"ttft": None, "tokens": 0, "timings": {}, "error": None}
+
+                try:
+                    async for event in rag.invoke_for_frontend_async(question["query"], session_id=f"bench-{concurrency}-{i}", timings=True):
+                        if event["type"] == "chunk" and event["content"]:
+                            if result["ttft"] is None:
+                                result["ttft"] = time.perf_counter() - start
+                            result["tokens"] += 1
+                        elif event["type"] == "final":
+                            result["timings"] = event.get("timings", {})
+
+                except Exception as e:
+                    result["error"] = repr(e)
+
+                result["total"] = time.perf_counter() - start
+                return result
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run(i, question) for i, question in enumerate(questions)))
+        wall = time.perf_counter() - start
+
+        ok = [result for result in results if not result["error"]]
+        errors = [result["error"] for result in results if result["error"]]
+
+        rows.append({
+            "dataset": dataset["name"],
+            "concurrency": concurrency,
+            "queries": len(results),
+            "errors": len(errors),
+            "wall_seconds": round(wall, 3),
+            "throughput_qps": round(len(ok) / wall, 2),
+            "tokens_per_s": round(sum(result["tokens"] for result in ok) / wall, 1),
+            **latency_summary([result["ttft"] for result in ok if result["ttft"] is not None], "ttft"),
+            **latency_summary([result["total"] for result in ok], "total"),
+            "stages_ms": mean_timings([result["timings"] for result in ok]),
+            "first_error": errors[0] if errors else None,
+        })
+
+        print(f"  concurrency {concurrency}: {rows[-1]['throughput_qps']} q/s, TTFT p50 {rows[-1]['ttft_ms_p50']} ms, p95 {rows[-1]['ttft_ms_p95']} ms")
+
+    return rows
+
+
+def run_worker(args):
+    """
+    Proceso hijo: mide todos los escenarios sobre un corpus y escribe las filas en JSON.
+    """
+    with open(args.worker, encoding="utf-8") as f:
+        dataset = json.load(f)
+
+    server = None
+    host = args.host
+    if host is None:
+        server = Fake_Ollama_Server(port=0,
+                                    dim=args.dim,
+                                    embed_latency=args.embed_latency,
+                                    embed_latency_per_text=args.embed_latency_per_text,
+                                    seed=args.seed,
+                                    generate_tokens=args.tokens,
+                                    first_token_latency=args.first_token_latency,
+                                    token_latency=args.token_latency).start()
+        host = server.url
+
+    # Siempre se parte de una base de datos vacia para que la ingesta sea en frio
+    store = os.path.join(args.workdir, f"store_{dataset['name']}")
+    shutil.rmtree(store, ignore_errors=True)
+
+    rag = build_rag(args, store, host,
+                    text_model=Ollama_LLM(args.llm, host=host),
+                    reranker=build_reranker(args) if {"rerank", "e2e"} & set(args.scenarios) else None,
+                    k=args.k,
+                    top_k=args.top_k)
+    results = {scenario: [] for scenario in args.scenarios}
+
+    try:
+        ingest = bench_ingest(rag, dataset, server)
+        if "ingest" in results:
+            results["ingest"].append(ingest)
+            print(f"  ingest: {ingest['chunks']} chunks in {ingest['seconds']}s ({ingest['chunks_per_s']} chunks/s), unchanged re-run {ingest['noop_seconds']}s")
+
+        if "retrieval" in results:
+            for row in bench_retrieval(rag, dataset, args):
+                results["retrieval"].append(row)
+                print(f"  retrieval {row['mode']}: p50 {row['latency_ms_p50']} ms, p95 {row['latency_ms_p95']} ms, recall@{row['k']} {row['recall_at_k']}")
+
+        if "rerank" in results:
+            for row in bench_rerank(rag, dataset, args):
+                results["rerank"].append(row)
+                print(f"  rerank k={row['k']}: p50 {row['latency_ms_p50']} ms, p95 {row['latency_ms_p95']} ms, recall@{row['top_k']} {row['recall_at_top_k_before']} -> {row['recall_at_top_k']}")
+            rag.k = args.k
+
+        if "e2e" in results:
+            results["e2e"].extend(asyncio.run(bench_e2e(rag, dataset, args)))
+
+    finally:
+        if server:
+            server.stop()
+
+    with open(args.worker_output, "w", encoding="utf-8") as f:
+        json.dump({"results": results, "fake_ollama": server.stats if server else None}, f)
+
+
+def compare(previous: dict, current: dict):
+    """
+    Imprime la variacion de las metricas principales frente a otra ejecucion.
+    """
+    print(f"\nComparison with {previous.get('meta', {}).get('commit')} -> {current['meta']['commit']}")
+
+    for scenario, metrics in COMPARED_METRICS.items():
+        old_rows = {tuple(row.get(key) for key in ROW_KEYS[scenario]): row for row in previous.get("results", {}).get(scenario, [])}
+
+        for row in current["results"].get(scenario, []):
+            key = tuple(row.get(field) for field in ROW_KEYS[scenario])
+            old = old_rows.get(key)
+            if not old:
+                continue
+
+            changes = []
+            for metric in metrics:
+                if old.get(metric) is None or row.get(metric) is None:
+                    continue
+                delta = (row[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+                changes.append(f"{metric} {old[metric]} -> {row[metric]} ({delta:+.1f}%)")
+
+            print(f"  {scenario} {dict(zip(ROW_KEYS[scenario], key))}: " + ", ".join(changes))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmarks reproducibles del sistema RAG")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[50, 200, 800], help="Documentos de cada corpus sintetico")
+    parser.add_argument("--paragraphs", type=int, default=20, help="Parrafos por documento sintetico")
+    parser.add_argument("--words", type=int, default=80, help="Palabras por parrafo sintetico")
+    parser.add_argument("--corpus", default=None, help="Directorio de documentos reales en lugar del corpus sintetico")
+    parser.add_argument("--questions-file", default="test_prompts.txt", help="Una pregunta por linea, con --corpus")
+    parser.add_argument("--queries", type=int, default=50, help="Consultas de los escenarios retrieval y rerank")
+    parser.add_argument("--modes", nargs="+", default=["dense", "hybrid"], choices=["dense", "hybrid"])
+    parser.add_argument("--k", type=int, default=8, help="k de Chroma_RAG en retrieval y e2e")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--k-values", nargs="+", type=int, default=[4, 8, 16, 32], help="Valores de k del escenario rerank")
+    parser.add_argument("--reranker", default="lexical", choices=["lexical", "torch", "onnx", "onnx-fp32"])
+    parser.add_argument("--reranker-model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--rerank-batch-size", type=int, default=16)
+    parser.add_argument("--pair-cost", type=float, default=0.0005, help="Segundos por par del reranker lexical")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16], help="Consultas simultaneas del escenario e2e")
+    parser.add_argument("--e2e-queries", type=int, default=48)
+    parser.add_argument("--chunk-size", type=int, default=1200, help="Caracteres por chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--ingest-workers", type=int, default=None)
+    parser.add_argument("--host", default=None, help="Ollama real (p.ej. http://localhost:11434). Por defecto el servidor falso")
+    parser.add_argument("--embed-model", default="bench-embed")
+    parser.add_argument("--llm", default="bench-llm")
+    parser.add_argument("--dim", type=int, default=256, help="Dimension de los embeddings falsos")
+    parser.add_argument("--embed-latency", type=float, default=0.002, help="Latencia falsa por peticion de embeddings (s)")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.0002, help="Latencia falsa por texto (s)")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens por respuesta falsa")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="Latencia falsa hasta el primer token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Latencia falsa entre tokens (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Directorio de trabajo (corpus y bases de datos). Por defecto uno temporal")
+    parser.add_argument("--output", default=None, help="Archivo JSON. Por defecto benchmarks/results/rag_suite_<commit>.json")
+    parser.add_argument("--compare", default=None, help="JSON de otra ejecucion con el que comparar")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    meta = {
+        **git_info(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    output = os.path.abspath(args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"rag_suite_{meta['commit'] or 'unknown'}.json"))
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="rag_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = {scenario: [] for scenario in args.scenarios}
+    fake_ollama = {}
+
+    try:
+        for dataset in load_datasets(args, workdir):
+            print(f"\n== {dataset['name']} ==")
+
+            dataset_file = os.path.join(workdir, f"{dataset['name']}.json")
+            worker_output = os.path.join(workdir, f"{dataset['name']}_results.json")
+            with open(dataset_file, "w", encoding="utf-8") as f:
+                json.dump(dataset, f)
+
+            # Los argumentos añadidos al final tienen prioridad sobre los originales
+            command = [sys.executable, "-m", "benchmarks.rag_suite", *sys.argv[1:],
+                       "--workdir", workdir, "--worker", dataset_file, "--worker-output", worker_output]
+            subprocess.run(command, check=True, cwd=REPO_ROOT)
+
+            with open(worker_output, encoding="utf-8") as f:
+                worker_results = json.load(f)
+
+            for scenario in results:
+                results[scenario].extend(worker_results["results"][scenario])
+            if worker_results["fake_ollama"]:
+                fake_ollama[dataset["name"]] = worker_results["fake_ollama"]
+
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": meta,
+        "config": {key: value for key, value in vars(args).items() if not key.startswith("worker")},
+        "fake_ollama": fake_ollama or None,
+        "results": results,
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\nResults written to {output}")
+
+    if compare_path:
+        with open(compare_path, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
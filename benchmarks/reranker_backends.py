@@ -0,0 +1,223 @@
+"""
+Compara los backends del reranker (CrossEncoder en PyTorch y ONNX int8): paridad de puntuaciones,
+latencia p50/p95 por consulta y memoria residente (RSS maxima).
+
+Cada backend se ejecuta en su propio proceso para que la memoria de uno no se cuente en el otro.
+Cada consulta reordena k candidatos, como hace Chroma_RAG.rerank_documents.
+
+Uso (desde la raiz del repo):
+    python -m benchmarks.reranker_backends --queries 200 --k 8
+    python -m benchmarks.reranker_backends --backends onnx onnx-fp32 --output results.json
+
+Sale con codigo 1 si el orden de los top_k de ONNX difiere del de PyTorch en mas consultas de las permitidas.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import List, Tuple
+
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "taladro broca avance velocidad corte aluminio acero titanio tolerancia diametro profundidad "
+    "refrigerante viruta herramienta husillo pieza fijacion norma ensayo calidad inspeccion "
+    "drill feed speed cutting tolerance depth coolant chip spindle fixture standard inspection"
+).split()
+
+
+def synthetic_pairs(n_queries: int, k: int, doc_words: int, seed: int = 0) -> List[List[Tuple[str, str]]]:
+    """
+    Genera consultas con k documentos candidatos cada una. Algunos candidatos comparten palabras con la consulta.
+
+    Params:
+        n_queries (int): Numero de consultas
+        k (int): Candidatos por consulta
+        doc_words (int): Palabras por documento
+        seed (int, optional): Semilla. Por defecto 0.
+
+    """
+    rng = random.Random(seed)
+    queries = []
+
+    for q in range(n_queries):
+        query_words = rng.sample(WORDS, 4)
+        query = " ".join(query_words) + f" INT_LDX_ISD_TEC_{q % 50:03d}"
+
+        candidates = []
+        for _ in range(k):
+            overlap = rng.randint(0, 4)
+            words = query_words[:overlap] + [rng.choice(WORDS) for _ in range(doc_words - overlap)]
+            rng.shuffle(words)
+            candidates.append((query, " ".join(words)))
+
+        queries.append(candidates)
+
+    return queries
+
+
+def load_backend(name: str, model_name: str, batch_size: int):
+
+    from model_interfaces.Reranker_Model import CrossEncoder_Reranker, ONNX_Reranker
+
+    if name == "torch":
+        return CrossEncoder_Reranker(model_name, batch_size=batch_size, cache_size=1)
+    if name == "onnx":
+        return ONNX_Reranker(model_name, quantize=True, batch_size=batch_size, cache_size=1)
+    if name == "onnx-fp32":
+        return ONNX_Reranker(model_name, quantize=False, batch_size=batch_size, cache_size=1)
+
+    raise ValueError(f"Unknown backend '{name}'")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss esta en KB en Linux y en bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def run_worker(args):
+    """
+    Proceso hijo: carga un backend, puntua todas las consultas y escribe latencias, puntuaciones y RSS en JSON.
+    """
+    queries = synthetic_pairs(args.queries, args.k, args.doc_words, args.seed)
+
+    rss_before = peak_rss_mb()
+    load_start = time.perf_counter()
+    reranker = load_backend(args.worker, args.model, args.batch_size)
+    load_time = time.perf_counter() - load_start
+    rss_loaded = peak_rss_mb()
+
+    for pairs in queries[:args.warmup]:
+        reranker.predict(pairs)
+
+    latencies = []
+    scores = []
+    for pairs in queries:
+        start = time.perf_counter()
+        scores.append(reranker.predict(pairs))
+        latencies.append(time.perf_counter() - start)
+
+    with open(args.worker_output, "w") as f:
+        json.dump({
+            "backend": args.worker,
+            "load_seconds": load_time,
+            "rss_before_mb": rss_before,
+            "rss_loaded_mb": rss_loaded,
+            "rss_peak_mb": peak_rss_mb(),
+            "latencies": latencies,
+            "scores": scores,
+        }, f)
+
+
+def percentile(values: List[float], p: float) -> float:
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def parity(reference: List[List[float]], candidate: List[List[float]], top_k: int) -> dict:
+    """
+    Compara las puntuaciones de dos backends: diferencia absoluta y coincidencia de los top_k por consulta.
+    top_k_agreement exige el mismo orden, que es lo que usa rerank_documents; top_k_set_agreement solo los
+    mismos documentos.
+    """
+    diffs = [abs(a - b) for ref, cand in zip(reference, candidate) for a, b in zip(ref, cand)]
+
+    def top(scores):
+        return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
+
+    same_order = sum(top(ref) == top(cand) for ref, cand in zip(reference, candidate))
+    same_set = sum(set(top(ref)) == set(top(cand)) for ref, cand in zip(reference, candidate))
+
+    return {
+        "max_abs_diff": max(diffs),
+        "mean_abs_diff": sum(diffs) / len(diffs),
+        "top_k_agreement": same_order / len(reference),
+        "top_k_set_agreement": same_set / len(reference),
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark de backends del reranker")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], help="torch, onnx (int8) y/o onnx-fp32")
+    parser.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8, help="Candidatos por consulta (k de Chroma_RAG)")
+    parser.add_argument("--top-k", type=int, default=3, help="Documentos usados tras el rerank (top_k de Chroma_RAG)")
+    parser.add_argument("--doc-words", type=int, default=250)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="Fraccion minima de consultas con los mismos top_k en el mismo orden que el primer backend")
+    parser.add_argument("--output", default=None, help="Archivo JSON con los resultados")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            worker_output = os.path.join(tmp, f"{backend}.json")
+            command = [sys.executable, "-m", "benchmarks.reranker_backends",
+                       "--worker", backend, "--worker-output", worker_output,
+                       "--model", args.model, "--queries", str(args.queries), "--k", str(args.k),
+                       "--doc-words", str(args.doc_words), "--batch-size", str(args.batch_size),
+                       "--warmup", str(args.warmup), "--seed", str(args.seed)]
+
+            print(f"Running {backend}...")
+            subprocess.run(command, check=True, cwd=REPO_ROOT)
+
+            with open(worker_output) as f:
+                results[backend] = json.load(f)
+
+    reference = args.backends[0]
+    summary = {}
+    failed = False
+
+    print(f"\n{'backend':<10} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'top_k agree':>12} {'max diff':>9}")
+    for backend, result in results.items():
+        latencies = result["latencies"]
+        summary[backend] = {
+            "load_seconds": round(result["load_seconds"], 3),
+            "latency_ms_p50": round(percentile(latencies, 0.5) * 1000, 2),
+            "latency_ms_p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "rss_model_mb": round(result["rss_loaded_mb"] - result["rss_before_mb"], 1),
+            "rss_peak_mb": round(result["rss_peak_mb"], 1),
+        }
+
+        if backend != reference:
+            summary[backend]["parity"] = parity(results[reference]["scores"], result["scores"], args.top_k)
+            failed = failed or summary[backend]["parity"]["top_k_agreement"] < args.min_agreement
+
+        row = summary[backend]
+        agreement = row.get("parity", {}).get("top_k_agreement", 1.0)
+        max_diff = row.get("parity", {}).get("max_abs_diff", 0.0)
+        print(f"{backend:<10} {row['load_seconds']:>8.2f} {row['latency_ms_p50']:>8.2f} {row['latency_ms_p95']:>8.2f} "
+              f"{row['rss_peak_mb']:>8.1f} {agreement:>12.3f} {max_diff:>9.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if not k.startswith("worker")}, "results": summary}, f, indent=2)
+
+    if failed:
+        print(f"\nParity check failed: ordered top_k agreement below {args.min_agreement}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ from model_interfaces.Embedding_Model import Ollama_Embedding
 from model_interfaces.Visual_Model import Visual_Ollama
 
 
-from semantic_text_splitter import TextSplitter
+from model_interfaces.file_readers import Text_Splitter_Spec
 from sentence_transformers import CrossEncoder
 
 CHUNK_SIZE = 1200
@@ -20,7 +20,7 @@ def main():
 
     IMAGE_MODEL = Visual_Ollama("llava:13b")
 
-    TEXT_SPLITTER = TextSplitter.from_tiktoken_model("gpt-3.5-turbo", capacity=CHUNK_SIZE, overlap= CHUNK_OVERLAP)
+    TEXT_SPLITTER = Text_Splitter_Spec(CHUNK_SIZE, CHUNK_OVERLAP, model="gpt-3.5-turbo")
 
     RERANKER = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
 
@@ -2,11 +2,11 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Iterator
+from typing import List, Iterator, Optional
 import os
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import json
 import asyncio
 from fastapi.staticfiles import StaticFiles
@@ -15,13 +15,13 @@ from fastapi.staticfiles import StaticFiles
 load_dotenv()
 
 # Import your existing RAG code
-from model_interfaces import Chroma_RAG, Embedding_Model, Text_Model, Visual_Model
-from semantic_text_splitter import TextSplitter
-from sentence_transformers import CrossEncoder
+from model_interfaces import Chroma_RAG, ConversationMemory, Embedding_Model, Embedding_Cache, Ingest_Watcher, Query_Cache, Reranker_Model, Text_Model, Tracing, Visual_Model, file_readers
 
 # --- Simplified request/response models ---
 class QueryRequest(BaseModel):
     query: str
+    session_id: Optional[str] = None  # Each browser tab sends its own id so conversation memories don't mix
+    timings: bool = False  # Adds per-stage timings (ms) to the final streamed event
 
 class QueryResponse(BaseModel):
     answer: str
@@ -30,29 +30,49 @@ class QueryResponse(BaseModel):
 
 # Initialize your RAG system
 rag_system = None
+ingest_watcher = None
 
 # Lifespan startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global rag_system
+    global rag_system, ingest_watcher
     CHUNK_SIZE = 1200
     CHUNK_OVERLAP = 200
     TEXT_MODEL = Text_Model.Ollama_LLM("mistral:7b") #gpt-oss:20b
     ENHANCER = Text_Model.Ollama_LLM("mistral:7b")
-    EMBED_MODEL = Embedding_Model.Ollama_Embedding("mxbai-embed-large")
+    # EMBED_BACKEND=local genera los embeddings en este proceso con sentence-transformers (sin HTTP a Ollama)
+    if os.getenv("EMBED_BACKEND", "ollama") == "local":
+        EMBED_MODEL = Embedding_Cache.Cached_Embedding(Embedding_Model.SentenceTransformer_Embedding("mixedbread-ai/mxbai-embed-large-v1", num_threads=os.cpu_count()))
+    else:
+        EMBED_MODEL = Embedding_Cache.Cached_Embedding(Embedding_Model.Ollama_Embedding("mxbai-embed-large"))
     #IMAGE_MODEL = Visual_Model.Visual_Ollama("llava:13b")
 
-    TEXT_SPLITTER = TextSplitter.from_tiktoken_model(
-        "gpt-3.5-turbo", capacity=CHUNK_SIZE, overlap=CHUNK_OVERLAP
-    )
-    RERANKER = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+    # Spec serializable de TextSplitter.from_tiktoken_model, asi el chunking tambien se hace en el pool de procesos
+    TEXT_SPLITTER = file_readers.Text_Splitter_Spec(CHUNK_SIZE, CHUNK_OVERLAP, model="gpt-3.5-turbo")
+    # RERANKER_BACKEND=onnx sirve el mismo modelo con ONNX Runtime int8 (menos latencia y memoria en CPU), none lo desactiva
+    if os.getenv("RERANKER_BACKEND", "torch") == "onnx":
+        RERANKER = Reranker_Model.ONNX_Reranker("cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=16, max_length=512)
+    elif os.getenv("RERANKER_BACKEND") == "none":
+        RERANKER = None
+    else:
+        RERANKER = Reranker_Model.CrossEncoder_Reranker("cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=16, max_length=512)
+    SEMANTIC_CACHE = Query_Cache.Semantic_Answer_Cache(threshold=0.95)
+    MEMORY_STORE = ConversationMemory.Session_Memory_Store(max_tokens=1500, summarizer=ENHANCER.summarize_history)
 
     print("Initializing RAG system...")
-    rag_system = Chroma_RAG.Chroma_RAG(embedding_model= EMBED_MODEL, text_splitter= TEXT_SPLITTER, text_model= TEXT_MODEL, query_enhancer= ENHANCER,reranker= RERANKER, k = 8, top_k = 3, keep_memory= True )
+    rag_system = Chroma_RAG.Chroma_RAG(embedding_model= EMBED_MODEL, text_splitter= TEXT_SPLITTER, text_model= TEXT_MODEL, query_enhancer= ENHANCER,reranker= RERANKER, k = 8, top_k = 3, keep_memory= True, semantic_cache= SEMANTIC_CACHE, memory_store= MEMORY_STORE, retrieval_mode= "hybrid" )
     print("RAG system initialized successfully!")
 
+    # WATCH_DIRS=./lidax_pdf (separados por os.pathsep) mantiene la vdb sincronizada con esos directorios
+    if os.getenv("WATCH_DIRS"):
+        ingest_watcher = Ingest_Watcher.Ingest_Watcher(rag_system, os.getenv("WATCH_DIRS").split(os.pathsep))
+        ingest_watcher.start()
+        print(f"Watching {ingest_watcher.roots} for document changes")
+
     yield
     # Shutdown (if needed)
+    if ingest_watcher:
+        ingest_watcher.stop(timeout=30)
 
 # Create FastAPI app
 app = FastAPI(
@@ -97,12 +117,13 @@ async def query_rag_stream(request: QueryRequest):
     if rag_system is None:
         raise HTTPException(status_code=503, detail="RAG system not initialized.")
 
-    def generate_stream():
+    async def generate_stream():
         try:
-            # rag_system.invoke_as_stream yields Python dicts: {"type": "chunk", "content": "..."} or {"type": "final", "sources": [...]}
-            stream = rag_system.invoke_for_frontend(request.query)
+            # rag_system.invoke_for_frontend_async yields Python dicts: {"type": "chunk", "content": "..."} or {"type": "final", "sources": [...]}
+            # Async end to end so a slow generation doesn't hold a threadpool worker
+            stream = rag_system.invoke_for_frontend_async(request.query, session_id=request.session_id or "default", timings=request.timings)
             
-            for item in stream:
+            async for item in stream:
                 # 🛑 CRITICAL FIX: Explicitly serialize the Python dictionary to a JSON line 🛑
                 # This ensures the client receives a clean JSON string, not a Python dict's __repr__
                 yield json.dumps(item) + "\n"
@@ -110,6 +131,7 @@ async def query_rag_stream(request: QueryRequest):
         except Exception as e:
             import traceback
             traceback.print_exc()
+            Tracing.count("rag_request_errors_total")
             # Send an error payload as the final item in the stream
             error_payload = {"type": "error", "message": f"Error during streaming: {str(e)}"}
             yield json.dumps(error_payload) + "\n"
@@ -131,9 +153,17 @@ async def health_check():
         "status": "healthy",
         "openai_api_key": api_key_status,
         "rag_system": rag_status,
+        "caches": rag_system.cache_stats() if rag_system else None,
+        "ingest_watcher": ingest_watcher.stats() if ingest_watcher else None,
         "message": "Backend is running correctly"
     }
 
+# --- Prometheus metrics ---
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Per-stage latency histograms (rag_stage_seconds{stage=...}) and counters, Prometheus text format
+    return PlainTextResponse(Tracing.METRICS.render(), media_type="text/plain; version=0.0.4")
+
 # --- Run server ---
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,220 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+
+from collections import Counter
+from typing import List, Tuple
+
+
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+SUBTOKEN_PATTERN = re.compile(r"[_\-./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Divide un texto en terminos para BM25. Los identificadores compuestos (INT_LDX_ISD_TEC_009, M8-1.25)
+    se guardan enteros y ademas por partes, asi una busqueda exacta del codigo completo puntua alto.
+
+    Params:
+        text (str): Texto a tokenizar
+
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+
+        if SUBTOKEN_PATTERN.search(token):
+            terms.extend(part for part in SUBTOKEN_PATTERN.split(token) if part)
+
+    return terms
+
+
+def has_identifier(text: str) -> bool:
+    """
+    Indica si un texto contiene un codigo compuesto con digitos (referencias, normas, ids de documento).
+
+    Params:
+        text (str): Texto
+
+    """
+    return any(SUBTOKEN_PATTERN.search(token) and any(c.isdigit() for c in token)
+               for token in TOKEN_PATTERN.findall(text))
+
+
+class BM25_Index:
+    """
+    Indice invertido en disco (SQLite) para busqueda por palabras clave con BM25.
+    Se actualiza de forma incremental al añadir o borrar chunks de la vdb.
+
+    Params:
+        index_path (str): Ruta al archivo SQLite del indice
+        k1 (float, optional): Parametro de saturacion de frecuencia de BM25. Por defecto 1.5.
+        b (float, optional): Parametro de normalizacion por longitud de BM25. Por defecto 0.75.
+
+    """
+
+    def __init__(self, index_path: str, k1: float = 1.5, b: float = 0.75):
+
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+
+        directory = os.path.dirname(index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id)")
+        self._conn.commit()
+
+        self._n_docs, total_length = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        self._total_length = total_length
+
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+
+    def add(self, ids: List[str], texts: List[str]):
+        """
+        Añade (o reemplaza) chunks al indice.
+
+        Params:
+            ids (List[str]): Ids de los chunks
+            texts (List[str]): Textos de los chunks
+        """
+        with self._lock:
+            self._delete_locked(ids)
+
+            docs = []
+            postings = []
+            for chunk_id, text in zip(ids, texts):
+                terms = tokenize(text)
+                docs.append((chunk_id, len(terms)))
+                postings.extend((term, chunk_id, tf) for term, tf in Counter(terms).items())
+
+                self._n_docs += 1
+                self._total_length += len(terms)
+
+            self._conn.executemany("INSERT INTO docs (chunk_id, length) VALUES (?, ?)", docs)
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            self._conn.commit()
+
+
+    def delete(self, ids: List[str]):
+        """
+        Borra chunks del indice.
+
+        Params:
+            ids (List[str]): Ids de los chunks
+        """
+        with self._lock:
+            self._delete_locked(ids)
+            self._conn.commit()
+
+
+    def _delete_locked(self, ids: List[str]):
+
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+
+            n_docs, length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE chunk_id IN ({placeholders})", chunk
+            ).fetchone()
+
+            if not n_docs:
+                continue
+
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", chunk)
+            self._conn.execute(f"DELETE FROM docs WHERE chunk_id IN ({placeholders})", chunk)
+            self._n_docs -= n_docs
+            self._total_length -= length
+
+
+    def clear(self):
+        """
+        Vacia el indice.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.commit()
+            self._n_docs = 0
+            self._total_length = 0
+
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Devuelve los k chunks con mayor puntuacion BM25 para una consulta.
+
+        Params:
+            query (str): Consulta
+            k (int, optional): Numero de resultados. Por defecto 10.
+
+        Returns:
+            List[Tuple[str, float]]: (id del chunk, puntuacion) ordenados de mayor a menor
+        """
+        terms = set(tokenize(query))
+        if not terms or not self._n_docs:
+            return []
+
+        with self._lock:
+            n_docs = self._n_docs
+            avg_length = self._total_length / n_docs if n_docs else 0.0
+
+            scores = Counter()
+
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN docs d ON d.chunk_id = p.chunk_id WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+
+                if not rows:
+                    continue
+
+                df = len(rows)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+                for chunk_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return scores.most_common(k)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60, weights: List[float] = None) -> List[Tuple[str, float]]:
+    """
+    Fusiona varias listas de ids ordenadas con Reciprocal Rank Fusion.
+
+    Params:
+        rankings (List[List[str]]): Listas de ids, cada una ordenada de mas a menos relevante
+        k (int, optional): Constante de RRF. Por defecto 60.
+        weights (List[float], optional): Peso de cada lista. Por defecto todas 1.0.
+
+    Returns:
+        List[Tuple[str, float]]: (id, puntuacion) ordenados de mayor a menor
+    """
+    weights = weights or [1.0] * len(rankings)
+
+    scores = Counter()
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] += weight / (k + rank + 1)
+
+    return scores.most_common()
@@ -1,14 +1,25 @@
-import hashlib
-import re
+import asyncio
+import contextvars
+import os
+import time
 
 from chromadb import PersistentClient, errors
-from typing import List, Any, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, AsyncIterator, Iterator
 
-from model_interfaces.ConversationMemory import ConversationMemory
+from model_interfaces import Tracing
+from model_interfaces.ConversationMemory import Session_Memory_Store
 from model_interfaces.Text_Model import Text_Model
-from model_interfaces.Embedding_Model import  Embedding_Model
+from model_interfaces.Embedding_Model import  Embedding_Model, as_embedding_matrix
+from model_interfaces.Image_Captioner import Image_Captioner
 from model_interfaces.Visual_Model import Visual_Model
-from model_interfaces.file_readers import smart_doc_processing, expand_directories
+from model_interfaces.BM25_Index import BM25_Index, has_identifier, reciprocal_rank_fusion
+from model_interfaces.Ingest_Manifest import Ingest_Checkpoint, Ingest_Manifest
+from model_interfaces.Ingest_Pipeline import Ingest_Pipeline
+from model_interfaces.Query_Cache import LRU_TTL_Cache, Semantic_Answer_Cache, normalize_query
+from model_interfaces.Query_Gate import Query_Rewrite_Gate
+from model_interfaces.Reranker_Model import Reranker_Model, CrossEncoder_Reranker
+from model_interfaces.file_readers import IMAGE_REFERENCE_PATTERN, build_caption_documents, expand_directories, hash_file_content, hash_pdf_pages, is_markdown_splitter, is_paged_pdf, scan_documents, source_id_for
 
 
 
@@ -21,10 +32,26 @@ class Chroma_RAG():
         llm (str): Nombre/ruta del modelo de lenguaje a usar.
         vector_store (Any): Instancia de ChromaDB vector store.
         text_splitter (Any): Divisor de texto para procesamiento de documentos.
-        reranker (Any, optional): Modelo de reranking para reordenar documentos. Por defecto None.
+        reranker (Any, optional): Reranker_Model para reordenar documentos. Un CrossEncoder se envuelve en CrossEncoder_Reranker. Por defecto None.
         k (int, optional): Número de documentos a recuperar. Por defecto 5.
         top_k(int,opcional): Número de documentos que se usan después del rerank si se a proporcionado un reranker. Por defecto 3.
         print_documents(bool,opcional): Boolean por si queres que imprime los chunks que se usaron para generar la respuesta. Por defecto False.
+        cache_dir(str, opcional): Directorio donde se guardan el manifest de ingesta y otros ficheros auxiliares. Por defecto ".rag_cache".
+        ingest_workers(int, opcional): Numero de procesos para leer y dividir documentos. Por defecto os.cpu_count().
+        ingest_queue_size(int, opcional): Numero maximo de archivos en vuelo entre etapas de la ingesta (backpressure). Por defecto 8.
+        write_batch_size(int, opcional): Numero de chunks por escritura a Chroma durante la ingesta. Por defecto 256.
+        query_cache_size(int, opcional): Entradas maximas de las caches de embeddings de consultas y de resultados. Por defecto 1024.
+        query_cache_ttl(float, opcional): Segundos que dura una entrada de esas caches. Por defecto 3600.
+        semantic_cache(Semantic_Answer_Cache, opcional): Cache semantica de respuestas del LLM. Por defecto None (desactivada).
+        memory_store(Session_Memory_Store, opcional): Almacen de memorias por sesion si keep_memory es True. Por defecto uno en memoria.
+        rewrite_gate(Query_Rewrite_Gate, opcional): Decide si hace falta llamar al query_enhancer. Por defecto Query_Rewrite_Gate().
+        speculative_retrieval(bool, opcional): Si True, mientras se reescribe la consulta se busca con la consulta original en paralelo. Por defecto True.
+        retrieval_mode(str, opcional): "dense" (solo embeddings) o "hybrid" (BM25 + embeddings fusionados con RRF). Por defecto "dense".
+        rrf_k(int, opcional): Constante de Reciprocal Rank Fusion en modo hybrid. Por defecto 60.
+        identifier_weight(float, opcional): Peso de BM25 en la fusion cuando la consulta contiene un codigo (INT_LDX_ISD_TEC_009). Por defecto 2.0.
+        include_patterns(List[str], opcional): Patrones glob de los archivos a subir al recorrer directorios. Por defecto todos los soportados.
+        exclude_patterns(List[str], opcional): Patrones glob de archivos y directorios a ignorar ("borradores", "~$*"). Por defecto ninguno.
+        caption_workers(int, opcional): Llamadas simultaneas al visual_model para describir imagenes al subir documentos. Por defecto 2.
 
     """
     
@@ -40,7 +67,23 @@ class Chroma_RAG():
                 k: int= 5,
                 top_k: int= 3,
                 print_documents: bool = False,
-                keep_memory: bool = False):
+                keep_memory: bool = False,
+                cache_dir: str = ".rag_cache",
+                ingest_workers: int = None,
+                ingest_queue_size: int = 8,
+                write_batch_size: int = 256,
+                query_cache_size: int = 1024,
+                query_cache_ttl: float = 3600,
+                semantic_cache: Semantic_Answer_Cache = None,
+                memory_store: Session_Memory_Store = None,
+                rewrite_gate: Query_Rewrite_Gate = None,
+                speculative_retrieval: bool = True,
+                retrieval_mode: str = "dense",
+                rrf_k: int = 60,
+                identifier_weight: float = 2.0,
+                include_patterns: List[str] = None,
+                exclude_patterns: List[str] = None,
+                caption_workers: int = 2):
         
         self.embedding_model = embedding_model
         self.text_splitter = text_splitter
@@ -49,15 +92,33 @@ class Chroma_RAG():
         self.visual_model = visual_model
         self.query_enhancer = query_enhancer
         self.reranker = reranker
+        if reranker is not None and not isinstance(reranker, Reranker_Model):
+            self.reranker = CrossEncoder_Reranker(reranker)
         self.k = k
         self.top_k = top_k
         self.print_documents = print_documents
         self.keep_memory = keep_memory
-        self.conversation_memory = None
+        self.cache_dir = cache_dir
+        self.ingest_workers = ingest_workers
+        self.ingest_queue_size = ingest_queue_size
+        self.write_batch_size = write_batch_size
+        self.query_embedding_cache = LRU_TTL_Cache(query_cache_size, query_cache_ttl)
+        self.results_cache = LRU_TTL_Cache(query_cache_size, query_cache_ttl)
+        self.collection_version = 0
+        self.semantic_cache = semantic_cache
+        self.memory_store = None
+        self.rewrite_gate = rewrite_gate or Query_Rewrite_Gate()
+        self.speculative_retrieval = speculative_retrieval
+        self.retrieval_mode = retrieval_mode
+        self.rrf_k = rrf_k
+        self.identifier_weight = identifier_weight
+        self.include_patterns = include_patterns
+        self.exclude_patterns = exclude_patterns
+        self._executor = ThreadPoolExecutor(max_workers=4)
         self.vector_store = None
 
         if self.keep_memory:
-            self.conversation_memory = ConversationMemory()
+            self.memory_store = memory_store if memory_store is not None else Session_Memory_Store()
 
         try:
 
@@ -66,11 +127,137 @@ class Chroma_RAG():
             self.vector_store= client_chroma.get_or_create_collection(chroma_collection)
 
         except errors.InvalidArgumentError as iae:
-            tokens =embedding_model.split("/")
+            tokens =embedding_model.model_name.split("/")
             chroma_collection = tokens[1] + "_vdb"
             client_chroma = PersistentClient()
             self.vector_store= client_chroma.get_or_create_collection(chroma_collection)
 
+        if retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown retrieval_mode '{retrieval_mode}', expected 'dense' or 'hybrid'")
+
+        self.manifest = Ingest_Manifest(os.path.join(self.cache_dir, f"{chroma_collection}_manifest.json"))
+        self.checkpoint = Ingest_Checkpoint(os.path.join(self.cache_dir, f"{chroma_collection}_checkpoint.json"))
+        self.last_ingest_stats = None
+
+        # Las descripciones de imagenes se generan al subir documentos, nunca durante una consulta
+        self.captioner = None
+        if visual_model is not None:
+            self.captioner = Image_Captioner(visual_model, os.path.join(self.cache_dir, "captions.sqlite"), max_workers=caption_workers)
+
+        # El indice BM25 se mantiene siempre para poder cambiar a modo hybrid sin reindexar
+        self.keyword_index = BM25_Index(os.path.join(self.cache_dir, f"{chroma_collection}_bm25.sqlite"))
+
+        if retrieval_mode == "hybrid" and len(self.keyword_index) != self.vector_store.count():
+            self.rebuild_keyword_index()
+
+
+
+    def _collection_changed(self):
+        """
+        Se llama cada vez que se modifica la coleccion para invalidar los resultados cacheados.
+        La version forma parte de la clave, asi una busqueda que termine despues de la invalidacion no deja resultados viejos.
+        """
+        self.collection_version += 1
+        self.results_cache.clear()
+
+
+    def cache_stats(self) -> dict:
+        """
+        Devuelve las estadisticas de las caches del sistema.
+        """
+        stats = {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "retrieval_results": self.results_cache.stats(),
+        }
+
+        if hasattr(self.embedding_model, "stats"):
+            stats["embeddings"] = self.embedding_model.stats()
+
+        if self.semantic_cache:
+            stats["semantic_answers"] = self.semantic_cache.stats()
+
+        stats["query_rewrites"] = self.rewrite_gate.stats()
+
+        if self.reranker:
+            stats["reranker"] = self.reranker.stats()
+
+        if self.captioner:
+            stats["image_captions"] = self.captioner.stats()
+
+        return stats
+
+
+    def rebuild_keyword_index(self, batch_size: int = 1000):
+        """
+        Reconstruye el indice BM25 a partir de los chunks que hay en la vdb (p.ej. colecciones creadas antes de existir el indice).
+
+        Params:
+            batch_size(int, opcional): Chunks leidos de Chroma por lote. Por defecto 1000.
+
+        """
+        self.keyword_index.clear()
+
+        offset = 0
+        while True:
+            existing = self.vector_store.get(include=["documents"], limit=batch_size, offset=offset)
+            if not existing['ids']:
+                break
+
+            self.keyword_index.add(existing['ids'], existing['documents'])
+            offset += len(existing['ids'])
+
+        self._collection_changed()
+
+
+    def _add_chunks(self, documents: List[str], embeddings: List[Any], metadatas: List[dict], ids: List[str]):
+        """
+        Escribe chunks en la vdb y en el indice BM25.
+
+        Params:
+            documents(List[str]): Texto de los chunks
+            embeddings(List[Any]): Embeddings de los chunks
+            metadatas(List[dict]): Metadata de los chunks
+            ids(List[str]): Ids de los chunks
+
+        """
+        self.vector_store.add(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
+        self.keyword_index.add(ids, documents)
+
+
+    def _delete_chunks(self, ids: List[str] = None, where: dict = None):
+        """
+        Borra chunks de la vdb e invalida las respuestas cacheadas que los usaban.
+
+        Params:
+            ids(List[str], opcional): Ids de los chunks a borrar
+            where(dict, opcional): Filtro de Chroma de los chunks a borrar
+
+        """
+        if where is not None:
+            ids = self.vector_store.get(where=where, include=[])['ids']
+
+        if not ids:
+            return
+
+        self.vector_store.delete(ids=ids)
+        self.keyword_index.delete(ids)
+
+        if self.semantic_cache:
+            self.semantic_cache.invalidate_chunks(ids)
+
+        self._collection_changed()
+
+
+    def _source_filter(self, file_path: str) -> dict:
+        """
+        Filtro de Chroma para los chunks de un archivo. Incluye los chunks antiguos que usaban el hash de la ruta como file_hash.
+
+        Params:
+            file_path(str)
+
+        """
+        source_id = source_id_for(file_path)
+        return {"$or": [{"source_id": source_id}, {"file_hash": source_id}]}
 
 
     def is_file_in_store(self, file_path: str)-> bool:
@@ -83,14 +270,413 @@ class Chroma_RAG():
             
         """
         try:
-            file_hash = hashlib.md5(file_path.encode()).hexdigest()[:8]
-            existing_docs = self.vector_store.get(where={"file_hash": file_hash})
+            existing_docs = self.vector_store.get(where=self._source_filter(file_path), include=[], limit=1)
                 
-            return existing_docs and len(existing_docs.get('documents', [])) > 0
+            return existing_docs and len(existing_docs.get('ids', [])) > 0
             
         except Exception as e:
             print(f"\nError checking file in store: {e}")
             return False         
+
+
+    def _copy_source(self, old_path: str, new_path: str, file_hash: str) -> int:
+        """
+        Copia los chunks (con sus embeddings) de un archivo ya subido a una nueva ruta con el mismo contenido,
+        sin volver a procesar ni generar embeddings.
+
+        Params:
+            old_path(str): Ruta ya presente en la vdb
+            new_path(str): Ruta nueva con el mismo contenido
+            file_hash(str): Hash del contenido
+
+        """
+        existing = self.vector_store.get(where=self._source_filter(old_path), include=["documents", "embeddings", "metadatas"])
+        if not existing['ids']:
+            return 0
+
+        old_source_id = source_id_for(old_path)
+        new_source_id = source_id_for(new_path)
+
+        ids = []
+        metadatas = []
+        for chunk_id, metadata in zip(existing['ids'], existing['metadatas']):
+            ids.append(new_source_id + chunk_id[len(old_source_id):])
+            metadata = {**metadata, "source": new_path, "source_id": new_source_id, "file_hash": file_hash}
+
+            # Las descripciones de imagenes apuntan a su chunk padre, que tambien cambia de id
+            parent_id = metadata.get("parent_id")
+            if parent_id and parent_id.startswith(old_source_id):
+                metadata["parent_id"] = new_source_id + parent_id[len(old_source_id):]
+
+            metadatas.append(metadata)
+
+        self._add_chunks(
+            documents=existing['documents'],
+            embeddings=as_embedding_matrix(existing['embeddings']),
+            metadatas=metadatas,
+            ids=ids
+        )
+
+        return len(ids)
+
+
+    def _plan_file(self, path: str, force: bool = False, stat: os.stat_result = None):
+        """
+        Decide que hacer con un archivo antes de procesarlo usando el manifest y hashes de contenido.
+        Los archivos movidos o copiados reutilizan los embeddings guardados sin volver a procesarse.
+        En los PDF se comparan ademas los hashes de cada pagina para procesar solo las paginas cambiadas.
+
+        Params:
+            path(str): Ruta del archivo
+            force(bool): Si True ignora el atajo de mtime/tamaño y vuelve a calcular el hash
+            stat(os.stat_result, opcional): Stat ya obtenido al recorrer el directorio. Por defecto se llama a os.stat.
+
+        Returns:
+            Tuple[str, os.stat_result, str, dict]: (estado, stat, hash, plan de paginas). El estado es "unchanged", "moved",
+            "copied" o "parse" si hay que procesar el archivo. El plan de paginas es None si no es un PDF.
+
+        """
+        stat = stat or os.stat(path)
+        if not force and self.manifest.is_unchanged(path, stat):
+            return "unchanged", stat, None, None
+
+        file_hash = hash_file_content(path)
+        entry = self.manifest.get(path)
+
+        if entry and entry["hash"] == file_hash and self.is_file_in_store(path):
+            self.manifest.set(path, stat, file_hash)
+            return "unchanged", stat, file_hash, None
+
+        if not self.is_file_in_store(path):
+            for other_path in self.manifest.find_by_hash(file_hash):
+                if other_path == path or not self._copy_source(other_path, path, file_hash):
+                    continue
+
+                self.manifest.set(path, stat, file_hash, page_hashes=self.manifest.get(other_path).get("pages"))
+                self._collection_changed()
+
+                if not os.path.exists(other_path):
+                    self._delete_chunks(where=self._source_filter(other_path))
+                    self.manifest.remove(other_path)
+                    return "moved", stat, file_hash, None
+
+                return "copied", stat, file_hash, None
+
+        if not is_paged_pdf(path):
+            return "parse", stat, file_hash, None
+
+        try:
+            pages = self._plan_pages(path, entry)
+        except Exception as e:
+            # PDF ilegible: se procesa entero y el error se reporta como fallo de ese archivo
+            print(f"\nCould not read pages of {path}: {e}")
+            return "parse", stat, file_hash, None
+
+        if pages["range"] == ():
+            # Ninguna pagina ha cambiado de contenido (p.ej. solo metadata del PDF)
+            self.manifest.set(path, stat, file_hash, page_hashes=pages["hashes"])
+            return "unchanged", stat, file_hash, None
+
+        return "parse", stat, file_hash, pages
+
+
+    def _plan_pages(self, path: str, entry: dict) -> dict:
+        """
+        Compara los hashes de pagina de un PDF con los del manifest y calcula el rango de paginas a volver a dividir.
+        El rango se amplia hasta cubrir enteros los chunks guardados que tocan las paginas cambiadas, y se sustituyen
+        los chunks que quedan dentro de el. Si se han añadido o quitado paginas, los chunks posteriores solo
+        cambian su numero de pagina.
+
+        Params:
+            path(str): Ruta del PDF
+            entry(dict): Entrada del manifest (o None)
+
+        Returns:
+            dict: "hashes" (hashes de pagina nuevos), "range" ((primera, ultima) pagina a procesar, () si no ha cambiado
+            ninguna o None para procesar todo), "old_ids" (ids de los chunks del rango) y "shifted" (ids y metadata
+            de los chunks posteriores con el numero de pagina corregido)
+        """
+        new_hashes = hash_pdf_pages(path, include_images=is_markdown_splitter(self.text_splitter))
+        plan = {"hashes": new_hashes, "range": None, "old_ids": [], "shifted": None}
+
+        old_hashes = entry.get("pages") if entry else None
+        if not old_hashes or not new_hashes:
+            return plan
+
+        existing = self.vector_store.get(where=self._source_filter(path), include=["metadatas"])
+        if not existing['ids'] or any("page" not in metadata for metadata in existing['metadatas']):
+            # Chunks subidos antes de guardar paginas: se procesa el archivo entero
+            return plan
+
+        n_old, n_new = len(old_hashes), len(new_hashes)
+
+        prefix = 0
+        while prefix < min(n_old, n_new) and old_hashes[prefix] == new_hashes[prefix]:
+            prefix += 1
+
+        if prefix == n_old == n_new:
+            plan["range"] = ()
+            return plan
+
+        suffix = 0
+        while suffix < min(n_old, n_new) - prefix and old_hashes[n_old - 1 - suffix] == new_hashes[n_new - 1 - suffix]:
+            suffix += 1
+
+        # Paginas cambiadas en la numeracion antigua. Si solo se han insertado paginas se usan las vecinas
+        first, last = prefix + 1, n_old - suffix
+        if first > last:
+            first, last = max(1, prefix), min(n_old, prefix + 1)
+
+        chunks = [(metadata["page"], metadata["page_end"], chunk_id) for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])]
+
+        # Un solo paso de ampliacion: los chunks solapados entre paginas encadenarian el rango hasta cubrir todo el PDF
+        touched = [(page, page_end) for page, page_end, _ in chunks if page <= last and page_end >= first]
+        first = min([first] + [page for page, _ in touched])
+        last = max([last] + [page_end for _, page_end in touched])
+
+        delta = n_new - n_old
+        new_last = max(min(last + delta, n_new), min(first, n_new))
+
+        plan["range"] = (min(first, n_new), new_last)
+        plan["old_ids"] = [chunk_id for page, page_end, chunk_id in chunks if page >= first and page_end <= last]
+
+        if delta:
+            # Las paginas posteriores al bloque cambiado se desplazan, tambien en los chunks que cruzan el borde del rango
+            changed_end = n_old - suffix
+            old_ids = set(plan["old_ids"])
+
+            def shift(page):
+                return page + delta if page > changed_end else page
+
+            plan["shifted"] = [
+                (chunk_id, {**metadata, "page": shift(metadata["page"]), "page_end": shift(metadata["page_end"])})
+                for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])
+                if chunk_id not in old_ids and metadata["page_end"] > changed_end
+            ]
+
+        return plan
+
+
+    def _add_caption_chunks(self, documents: List[dict], ids: List[str]):
+        """
+        Añade a los chunks de un archivo un chunk con la descripcion de cada imagen que referencian.
+        Las descripciones que faltan se generan con el captioner (una vez por imagen unica).
+
+        Params:
+            documents(List[dict]): Documentos del archivo
+            ids(List[str]): Ids de los chunks
+
+        Returns:
+            Tuple[List[dict], List[str]]: Documentos e ids con los chunks de descripciones al final
+        """
+        if self.captioner is None:
+            return documents, ids
+
+        images = [image for document in documents for image in IMAGE_REFERENCE_PATTERN.findall(document["content"])]
+        if not images:
+            return documents, ids
+
+        caption_documents, caption_ids = build_caption_documents(documents, ids, self.captioner.caption(images))
+
+        return documents + caption_documents, ids + caption_ids
+
+
+    def _attach_captions(self, retrieved_context: str, image_references: List[str]) -> str:
+        """
+        Añade al contexto las descripciones ya guardadas de las imagenes referenciadas que no esten ya en el.
+        Solo consulta la cache del captioner, no llama al modelo de vision.
+
+        Params:
+            retrieved_context(str): Contexto recuperado
+            image_references(List[str]): Imagenes referenciadas en el contexto
+
+        """
+        if self.captioner is None or not image_references:
+            return retrieved_context
+
+        captions = self.captioner.lookup(image_references)
+        missing = [f"{image}: {caption}" for image, caption in captions.items() if caption not in retrieved_context]
+
+        if not missing:
+            return retrieved_context
+
+        return retrieved_context + "\nImage descriptions:\n" + "\n".join(missing)
+
+
+    def _diff_chunks(self, path: str, documents: List[dict], ids: List[str], pages: dict = None) -> dict:
+        """
+        Compara los chunks de un archivo recien procesado con los que ya estan en la vdb.
+
+        Params:
+            path(str): Ruta del archivo
+            documents(List[dict]): Documentos devueltos por smart_doc_processing
+            ids(List[str]): Ids de los chunks
+            pages(dict, opcional): Plan de paginas de _plan_pages. Con rango, solo los chunks de ese rango pueden quedar huerfanos.
+
+        Returns:
+            dict: Chunks nuevos (new_docs/new_ids), chunks existentes (kept_docs/kept_ids) y ids huerfanos (orphan_ids)
+
+        """
+        existing_ids = set(self.vector_store.get(where=self._source_filter(path), include=[])['ids'])
+
+        if pages and pages["range"]:
+            documents, ids = self._avoid_id_collisions(documents, ids, existing_ids - set(pages["old_ids"]))
+
+        diff = {"new_docs": [], "new_ids": [], "kept_docs": [], "kept_ids": []}
+        for doc, chunk_id in zip(documents, ids):
+            if chunk_id in existing_ids:
+                diff["kept_docs"].append(doc)
+                diff["kept_ids"].append(chunk_id)
+            else:
+                diff["new_docs"].append(doc)
+                diff["new_ids"].append(chunk_id)
+
+        if pages and pages["range"]:
+            diff["orphan_ids"] = list(set(pages["old_ids"]) - set(ids))
+        else:
+            diff["orphan_ids"] = list(existing_ids - set(ids))
+
+        return diff
+
+
+    @staticmethod
+    def _avoid_id_collisions(documents: List[dict], ids: List[str], outside_ids: set):
+        """
+        Al volver a dividir solo un rango de paginas, los sufijos de chunks repetidos ("-n") se cuentan solo dentro
+        del rango. Un chunk igual a otro de fuera del rango tendria su mismo id y lo sobreescribiria, asi que se le da
+        el siguiente sufijo libre. Las descripciones de imagenes que apuntan a un chunk renombrado se actualizan.
+
+        Params:
+            documents(List[dict]): Documentos del rango
+            ids(List[str]): Ids de esos documentos
+            outside_ids(set): Ids ya guardados del archivo fuera del rango
+
+        Returns:
+            Tuple[List[dict], List[str]]: Documentos e ids sin colisiones
+        """
+        if not outside_ids.intersection(ids):
+            return documents, ids
+
+        taken = outside_ids | set(ids)
+        renamed = {}
+        new_ids = []
+
+        for chunk_id in ids:
+            if chunk_id in outside_ids:
+                base = chunk_id.split("-")[0]
+                n = 1
+                while f"{base}-{n}" in taken:
+                    n += 1
+                renamed[chunk_id] = f"{base}-{n}"
+                taken.add(renamed[chunk_id])
+            new_ids.append(renamed.get(chunk_id, chunk_id))
+
+        new_documents = []
+        for document in documents:
+            parent_id = document["metadata"].get("parent_id")
+            if parent_id in renamed:
+                document = {**document, "metadata": {**document["metadata"], "parent_id": renamed[parent_id]}}
+            new_documents.append(document)
+
+        return new_documents, new_ids
+
+
+    def _finish_file(self, item: dict):
+        """
+        Termina la sincronizacion de un archivo una vez escritos sus chunks nuevos: actualiza la metadata
+        de los chunks que se mantienen, borra los huerfanos (en una sola llamada) y lo registra en el manifest.
+
+        Params:
+            item(dict): Resultado de _diff_chunks con path, stat, file_hash y pages
+
+        """
+        pages = item.get("pages")
+
+        if item["kept_ids"]:
+            self.vector_store.update(
+                metadatas=[doc["metadata"] for doc in item["kept_docs"]],
+                ids=item["kept_ids"]
+            )
+
+        if pages and pages.get("shifted"):
+            shifted = [(chunk_id, metadata) for chunk_id, metadata in pages["shifted"] if chunk_id not in set(item["kept_ids"])]
+            if shifted:
+                self.vector_store.update(ids=[chunk_id for chunk_id, _ in shifted], metadatas=[metadata for _, metadata in shifted])
+
+        if item["orphan_ids"]:
+            self._delete_chunks(ids=item["orphan_ids"])
+
+        self.manifest.set(item["path"], item["stat"], item["file_hash"], page_hashes=pages["hashes"] if pages else None)
+        self._collection_changed()
+
+
+    def _ingest(self, expanded_paths: List[str], action: str, force: bool = False, stats: dict = None):
+        """
+        Sincroniza una lista de archivos con la vdb. Los que hay que procesar pasan por el Ingest_Pipeline.
+        Si una ingesta anterior se interrumpio, sus archivos pendientes del checkpoint se procesan tambien.
+
+        Params:
+            expanded_paths(List[str]): Rutas de archivos ya expandidas
+            action(str): Verbo para los mensajes de progreso ("uploaded", "updated")
+            force(bool): Si True ignora el atajo de mtime/tamaño del manifest
+            stats(dict, opcional): Stat de cada ruta obtenido en scan_documents. Por defecto None.
+
+        """
+        targets = {path: force for path in expanded_paths}
+
+        resumed = [path for path in self.checkpoint.pending if path not in targets and os.path.exists(path)]
+        if resumed:
+            print(f"\nResuming interrupted ingest ({len(resumed)} files pending)")
+            for path in resumed:
+                targets[path] = self.checkpoint.pending[path]
+
+        stats = stats or {}
+        counts = {"unchanged": 0, "moved": 0, "copied": 0}
+
+        jobs = []
+        for path, path_force in targets.items():
+            status, stat, file_hash, pages = self._plan_file(path, force=path_force, stat=stats.get(path))
+
+            if status == "parse":
+                jobs.append((path, stat, file_hash, pages))
+            else:
+                counts[status] += 1
+
+        self.manifest.save()
+
+        print(f"\n{counts['unchanged']} files unchanged, {counts['moved'] + counts['copied']} moved/copied reusing stored embeddings, {len(jobs)} to be {action}")
+
+        if not jobs:
+            self.checkpoint.clear()
+            return
+
+        self.checkpoint.begin({path: targets[path] for path, _, _, _ in jobs})
+
+        pipeline = Ingest_Pipeline(self,
+                                   max_workers=self.ingest_workers,
+                                   max_pending=self.ingest_queue_size,
+                                   write_batch_size=self.write_batch_size,
+                                   checkpoint=self.checkpoint)
+        pipeline.run(jobs)
+
+        self.last_ingest_stats = pipeline.stats
+
+
+    def resume_ingest(self) -> str:
+        """
+        Termina una ingesta interrumpida usando el checkpoint.
+        """
+        try:
+
+            if not self.checkpoint.pending:
+                return "\nNo interrupted ingest to resume"
+
+            self._ingest([], "resumed")
+
+            return "\nInterrupted ingest resumed succesfully"
+
+        except Exception as e:
+            return f"\nError occurred when resuming ingest: {e}"
         
     
     def add_to_vector_store(self,file_paths: List[str])-> str:
@@ -104,45 +690,12 @@ class Chroma_RAG():
 
         try:
 
-            i = 1
-            expanded_paths = expand_directories(file_paths)
-            n_files = len(expanded_paths)
+            scanned = dict(scan_documents(file_paths, self.include_patterns, self.exclude_patterns))
+            n_files = len(scanned)
 
             print(f"Uploading files ({n_files})...")
 
-            for path in expanded_paths:
-                if self.is_file_in_store(path):
-                    print(f"\n{path} already on vdb moving to next file")
-                    i += 1
-                    continue
-
-                documents, ids = smart_doc_processing(self.text_splitter,path)
-
-                if documents is None or ids is None:
-                    continue
-                    
-                embeddings = []
-                chunks = []
-                for doc in documents:
-                    content = doc.get("content")
-                    chunks.append(content)
-            
-                embeddings = self.embedding_model.generate_embeddings(chunks)
-            
-                metadatas = []
-                for doc in documents:
-                    metadata = doc.get("metadata")
-                    metadatas.append(metadata)
-                
-                self.vector_store.add(
-                    documents=[doc["content"] for doc in documents],
-                    embeddings=embeddings,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-            
-                print(f"\n{path} uploaded succesfully ({i}/{n_files}).")
-                i += 1
+            self._ingest(sorted(scanned), "uploaded", stats=scanned)
 
             return("\nAll files succesfully uploaded")
     
@@ -152,9 +705,37 @@ class Chroma_RAG():
         
 
         
+    def _expand_deleted(self, file_paths: List[str]) -> List[str]:
+        """
+        Expande rutas a borrar. Las que ya no existen en disco (archivos o directorios borrados) se
+        resuelven con el manifest, asi se pueden quitar de la vdb despues de borrarlas.
+
+        Params:
+            file_paths(List[str]): Rutas de archivos o directorios
+
+        """
+        existing = [path for path in file_paths if os.path.exists(path)]
+        expanded_paths = set(expand_directories(existing, self.include_patterns, self.exclude_patterns))
+
+        for path in file_paths:
+            if os.path.exists(path):
+                continue
+
+            under = self.manifest.paths_under(path)
+            if under:
+                expanded_paths.update(under)
+            elif self.manifest.get(path) or self.is_file_in_store(path):
+                expanded_paths.add(path)
+            else:
+                print(f"Path not found: {path}")
+
+        return sorted(expanded_paths)
+
+
     def delete_from_vector_store(self, file_paths: List[str]) -> str:
         """
         Elimina documentos de la base de datos vectorial basándose en sus rutas de archivo.
+        Acepta rutas que ya no existen en disco si estaban subidas.
 
         Params:
             file_paths (List[str]): Lista de rutas de archivos a eliminar de la base de datos vectorial
@@ -164,20 +745,23 @@ class Chroma_RAG():
         try:
 
             i = 1
-            expanded_paths = expand_directories(file_paths)
+            expanded_paths = self._expand_deleted(file_paths)
             n_files = len(expanded_paths)
 
             print(f"Deleting files ({n_files})...")
 
             for path in expanded_paths:
                 if not self.is_file_in_store(path):
+                    self.manifest.remove(path)
                     print(f"\n{path} not on vdb moving to next file")
                     continue
-                file_hash = hashlib.md5(path.encode()).hexdigest()[:8]
-                self.vector_store.delete(where={"file_hash": file_hash})
+                self._delete_chunks(where=self._source_filter(path))
+                self.manifest.remove(path)
                 print(f"\nFile {path} deleted successfully ({i}/{n_files})")
                 i += 1
 
+            self.manifest.save()
+
             return f"\nAll files deleted successfully."
         
         except Exception as e:
@@ -195,45 +779,19 @@ class Chroma_RAG():
 
         try:
 
-            i = 1
-            expanded_paths = expand_directories(file_paths)
-            n_files = len(expanded_paths)
+            scanned = dict(scan_documents(file_paths, self.include_patterns, self.exclude_patterns))
+            n_files = len(scanned)
 
             print(f"Updating files ({n_files})...")
 
-            for path in expanded_paths:
+            in_store = []
+            for path in sorted(scanned):
                 if not self.is_file_in_store(path):
                     print(f"\n{path} not on vdb moving to next file")
                     continue
+                in_store.append(path)
 
-                documents, ids = smart_doc_processing(self.text_splitter,path)
-
-                if documents is None or ids is None:
-                    continue
-
-                chunks = []
-                for doc in documents:
-                    content = doc.get("content")
-                    #embedding = self.get_embeddings(content)
-                    chunks.append(doc)
-
-                embeddings = self.embedding_model.geenerate_embeddings(chunks)
-
-            
-                metadatas = []
-                for doc in documents:
-                    metadata = doc.get("metadata")
-                    metadatas.append(metadata)
-                
-                self.vector_store.update(
-                    documents=[doc["content"] for doc in documents],
-                    embeddings=embeddings,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-            
-                print(f"\n{path} updated succesfully ({i}/{n_files}).")
-                i += 1
+            self._ingest(in_store, "updated", force=True, stats=scanned)
 
             return("\nAll files succesfully updated")
     
@@ -241,76 +799,234 @@ class Chroma_RAG():
             return(f"\nError occurred when updating files: {e}")
 
         
+    def embed_query(self, query: str):
+        """
+        Genera el embedding de una consulta, usando la cache de embeddings de consultas.
+
+        Params:
+            query (str): Consulta de búsqueda
+
+        """
+        key = normalize_query(query)
+
+        query_embedding = self.query_embedding_cache.get(key)
+        if query_embedding is None:
+            with Tracing.span("embed"):
+                query_embedding = self.embedding_model.generate_embeddings([query])
+            self.query_embedding_cache.put(key, query_embedding)
+
+        return query_embedding
+
+
     def retrieve(self,query: str):
         """
         Recupera documentos relevantes de la base de datos vectorial.
+        Las consultas repetidas se sirven de la cache de resultados, que se invalida al modificar la coleccion.
 
         Params:
             query (str): Consulta de búsqueda para recuperar documentos relevantes
             
         """
-        
-        results = self.vector_store.query(
-            query_embeddings=self.embedding_model.generate_embeddings([query]),
-            n_results= self.k,
-        )
+        key = (normalize_query(query), self.k, self.collection_version)
+
+        results = self.results_cache.get(key)
+        if results is not None:
+            Tracing.count("rag_retrieval_cache_hits_total")
+            return results
+
+        query_embedding = self.embed_query(query)
+
+        with Tracing.span("ann_query"):
+            results = self.vector_store.query(
+                query_embeddings=query_embedding,
+                n_results= self.k,
+            )
+
+        if self.retrieval_mode == "hybrid":
+            with Tracing.span("hybrid_fusion"):
+                results = self._fuse_hybrid(query, results)
+
+        self.results_cache.put(key, results)
 
         return results
-        #Ver mas metodos de retrieval
+
+
+    def _fuse_hybrid(self, query: str, dense_results: dict) -> dict:
+        """
+        Fusiona los resultados densos con los de BM25 usando Reciprocal Rank Fusion y devuelve los k mejores
+        con el mismo formato que vector_store.query. Asi las consultas con codigos exactos (INT_LDX_ISD_TEC_009)
+        encuentran su documento sin subir k.
+
+        Params:
+            query (str): Consulta de búsqueda
+            dense_results (dict): Resultado de vector_store.query
+
+        """
+        dense_ids = dense_results['ids'][0]
+        keyword_ids = [chunk_id for chunk_id, _ in self.keyword_index.search(query, self.k)]
+
+        # Los embeddings tratan mal los codigos exactos, si la consulta tiene alguno manda BM25
+        keyword_weight = self.identifier_weight if has_identifier(query) else 1.0
+
+        fused = reciprocal_rank_fusion([dense_ids, keyword_ids], k=self.rrf_k, weights=[1.0, keyword_weight])[:self.k]
+
+        found = {
+            chunk_id: (doc, metadata, distance)
+            for chunk_id, doc, metadata, distance in zip(dense_ids,
+                                                         dense_results['documents'][0],
+                                                         dense_results['metadatas'][0],
+                                                         dense_results['distances'][0])
+        }
+
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in found]
+        if missing:
+            extra = self.vector_store.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, doc, metadata in zip(extra['ids'], extra['documents'], extra['metadatas']):
+                found[chunk_id] = (doc, metadata, None)
+
+        fused = [(chunk_id, score) for chunk_id, score in fused if chunk_id in found]
+
+        return {
+            "ids": [[chunk_id for chunk_id, _ in fused]],
+            "documents": [[found[chunk_id][0] for chunk_id, _ in fused]],
+            "metadatas": [[found[chunk_id][1] for chunk_id, _ in fused]],
+            "distances": [[found[chunk_id][2] for chunk_id, _ in fused]],
+            "scores": [[score for _, score in fused]],
+        }
     
     
-    def rerank_documents(self, query: str, init_docs: List[str], init_metadatas: List[dict]) -> List[str]:
+    def rerank_documents(self, query: str, init_docs: List[str], init_metadatas: List[dict], init_ids: List[str] = None, init_distances: List[float] = None) -> List[str]:
         """
         Reordena documentos recuperados usando el modelo de reranking para mejorar la relevancia.
 
         Params:
             query (str): Consulta original de búsqueda
-            documents (List[str]): Lista de documentos a reordenar
+            init_docs (List[str]): Lista de documentos a reordenar
+            init_metadatas (List[dict]): Metadata de cada documento
+            init_ids (List[str], opcional): Ids de los chunks, para la cache de puntuaciones del reranker
+            init_distances (List[float], opcional): Distancias densas, para saltarse el reranker si ya deciden
             
         """
+        with Tracing.span("rerank"):
+            ranking = self.reranker.rank(query, init_docs, ids=init_ids, distances=init_distances, top_k=self.top_k)
 
-        pairs = [[query, doc] for doc in init_docs]
-
-       #Alomejor hay que cambiar para otros rerankers 
-        
-        scores = self.reranker.predict(pairs)
-
-        scored_docs = list(zip(init_docs, init_metadatas, scores))
-        scored_docs.sort(key=lambda x: x[2], reverse=True)
-
-        reranked_documents = [doc for doc, metadata, score in scored_docs]
-        reranked_metadatas = [metadata for doc, metadata, score in scored_docs]
+        reranked_documents = [init_docs[i] for i, score in ranking]
+        reranked_metadatas = [init_metadatas[i] for i, score in ranking]
 
         return reranked_documents, reranked_metadatas
     
     
 
-    def invoke(self, query: str, testing:bool = False):
+    def _resolve_query(self, query: str, memory = None):
         """
-        Metodo para ejecutar la aquitectura RAG. Imprime la respuesta en consola.
+        Añade la consulta a la memoria, la reescribe con el historial solo si el rewrite_gate lo considera necesario
+        y recupera los documentos. Con speculative_retrieval la busqueda con la consulta original se lanza en paralelo
+        con la reescritura y se reutiliza si el mejorador devuelve la misma consulta.
 
         Params:
-        query(str): Input de usuario
+            query(str): Input de usuario
+            memory(ConversationMemory, opcional): Memoria de la sesion
 
+        Returns:
+            Tuple[str, dict]: (consulta final, resultados de retrieve)
         """
-        if self.keep_memory:
+        if memory is None:
+            return query, self.retrieve(query)
 
-            self.conversation_memory.add_message("user",query)
+        previous_history = self._conversation_history(memory)
+        memory.add_message("user", query)
 
-            relevant_messages = self.conversation_memory.get_full_history()
+        if not self.query_enhancer or not self.rewrite_gate.needs_rewrite(query, previous_history):
+            return query, self.retrieve(query)
 
-            conversation_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in relevant_messages])
-            
-            if self.query_enhancer:
-                query = self.llm.enhance_query(query, conversation_history)
+        # copy_context para que la busqueda especulativa registre sus etapas en la traza de la consulta
+        speculative = self._executor.submit(contextvars.copy_context().run, self.retrieve, query) if self.speculative_retrieval else None
+
+        with Tracing.span("enhance"):
+            enhanced_query = self.query_enhancer.enhance_query(query, self._conversation_history(memory))
+
+        if speculative and normalize_query(enhanced_query) == normalize_query(query):
+            return query, speculative.result()
+
+        return enhanced_query, self.retrieve(enhanced_query)
+
+
+    async def _resolve_query_async(self, query: str, memory = None):
+        """
+        Version asincrona de _resolve_query.
+
+        Params:
+            query(str): Input de usuario
+            memory(ConversationMemory, opcional): Memoria de la sesion
+        """
+        if memory is None:
+            return query, await self.retrieve_async(query)
+
+        previous_history = self._conversation_history(memory)
+        memory.add_message("user", query)
+
+        if not self.query_enhancer or not self.rewrite_gate.needs_rewrite(query, previous_history):
+            return query, await self.retrieve_async(query)
+
+        speculative = asyncio.create_task(self.retrieve_async(query)) if self.speculative_retrieval else None
+
+        try:
+            with Tracing.span("enhance"):
+                enhanced_query = await self.query_enhancer.enhance_query_async(query, self._conversation_history(memory))
+        except BaseException:
+            if speculative:
+                speculative.cancel()
+            raise
 
-        results = self.retrieve(query)
+        if speculative and normalize_query(enhanced_query) == normalize_query(query):
+            return query, await speculative
+
+        if speculative:
+            speculative.cancel()
+
+        return enhanced_query, await self.retrieve_async(enhanced_query)
+
+
+    def invoke(self, query: str, testing:bool = False, session_id: str = "default"):
+        """
+        Metodo para ejecutar la aquitectura RAG. Imprime la respuesta en consola.
+
+        Params:
+        query(str): Input de usuario
+        session_id(str): Identificador de la sesion cuyo historial se usa si keep_memory es True
+
+        """
+        memory = self.memory_store.get(session_id) if self.keep_memory else None
+
+        query, results = self._resolve_query(query, memory)
         documents = results['documents'][0]
         metadatas = results.get('metadatas', [[]])[0]
+        chunk_ids = results['ids'][0]
+
+        if self.semantic_cache:
+            query_embedding = self.embed_query(query)
+            cached = self.semantic_cache.lookup(query_embedding, chunk_ids)
+
+            if cached:
+                full_response = cached["answer"]
+
+                if not testing:
+                    print(full_response)
+
+                if full_response and self.keep_memory:
+                    memory.add_message("system", full_response)
+
+                if testing:
+                    return {
+                        "answer": full_response,
+                        "sources": [{"id": i + 1, "title": source["title"], "content": source["content"]} for i, source in enumerate(cached["sources"])],
+                        "query": query
+                    }
+                return
 
         if self.reranker:
             
-            reranked_docs, reranked_metadatas = self.rerank_documents(query, documents, metadatas)
+            reranked_docs, reranked_metadatas = self.rerank_documents(query, documents, metadatas, chunk_ids, results.get('distances', [None])[0])
             documents = reranked_docs[:self.top_k]
             metadatas = reranked_metadatas[:self.top_k]
 
@@ -323,17 +1039,27 @@ class Chroma_RAG():
 
         Answer:"""
 
-        stream = self.llm.generate_stream(manual_prompt)
+        generation_start = time.perf_counter()
+
+        stream = self.text_model.generate_stream(manual_prompt)
 
         bool_print = True
 
         if testing:
             bool_print = False
 
-        full_response = self.llm.get_full_response(stream, bool_print= bool_print)
+        full_response = self.text_model.get_full_response(stream, bool_print= bool_print)
 
         if full_response and self.keep_memory:
-            self.conversation_memory.add_message("system", full_response)
+            memory.add_message("system", full_response)
+
+        if self.semantic_cache and full_response:
+            self.semantic_cache.store(query_embedding,
+                                      chunk_ids,
+                                      events=[{"type": "chunk", "content": full_response}],
+                                      sources=[{"title": meta.get('source'), "link": meta.get('link', '#'), "content": doc} for doc, meta in zip(documents, metadatas)],
+                                      answer=full_response,
+                                      generation_time=time.perf_counter() - generation_start)
 
         if self.print_documents:
 
@@ -364,43 +1090,25 @@ class Chroma_RAG():
 
 
 
-    def invoke_for_frontend(self, query: str) -> Iterator[dict]:
+    def _conversation_history(self, memory) -> str:
         """
-        Metodo para ejcutar codigo para el frontend deolviendo Iterators que REACT puede interpretar
+        Devuelve el historial de conversacion de una sesion como texto para el mejorador de consultas.
 
         Params:
-            query(str)
+            memory(ConversationMemory)
         """
+        relevant_messages = memory.get_full_history()
+        return "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in relevant_messages])
 
-        if self.keep_memory:
-
-            self.conversation_memory.add_message("user", query)
-            
-            relevant_messages = self.conversation_memory.get_full_history()
-            conversation_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in relevant_messages])
-
-            query = self.query_enhancer.enhance_query(query,conversation_history)
-        
-        results = self.retrieve(query)
-        documents = results['documents'][0]
-        metadatas = results['metadatas'][0]
-
-        if self.reranker:
-            reranked_docs, reranked_metadatas = self.rerank_documents(query, documents, metadatas)
-            documents = reranked_docs[:self.top_k]
-            metadatas = reranked_metadatas[:self.top_k]
-        
-        retrieved_context = "\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(documents)])
 
-        pattern = r'!\s*\[\]\s*\((images/[^)]+\.png)\)'
-        image_references = re.findall(pattern, retrieved_context)
-        
-        if image_references:
-            yield {"type": "images", "content": image_references}
-
-            if self.visual_model:
-                captions = self.image_model.image_to_text(image_references, query)
+    def _build_frontend_prompt(self, retrieved_context: str, query: str) -> str:
+        """
+        Construye el prompt del LLM para el frontend a partir del contexto recuperado.
 
+        Params:
+            retrieved_context(str)
+            query(str)
+        """
 
         SYSTEM_PROMPT_GPT = f"""
 
@@ -431,56 +1139,308 @@ class Chroma_RAG():
         [/INST]
         """
 
+        return SYSTEM_PROMPT_MISTRAL
+
 
-        llm_stream = self.text_model.generate_stream(SYSTEM_PROMPT_MISTRAL) 
+    def _format_sources(self, documents: list, metadatas: list) -> list:
+        """
+        Funcion ayudante para formetear las fuentes de forma que el frontend pueda procesar
+        
+        Params:
+            documents(list)
+            metadatas(list)
+            
+        """
+
+        formatted_sources = []
+        for doc, meta in zip(documents, metadatas):
+            formatted_sources.append({
+                "title": meta.get('source'),
+                "link": meta.get('link', '#'),
+                "content": doc,
+            })
+        return formatted_sources
+
+
+    def _replay_cached_answer(self, cached: dict, query: str, memory = None, trace: Tracing.Request_Trace = None, timings: bool = False) -> Iterator[dict]:
+        """
+        Reproduce una respuesta de la cache semantica con la misma secuencia de eventos, el frontend no nota la diferencia.
+
+        Params:
+            cached(dict): Entrada de Semantic_Answer_Cache
+            query(str)
+            memory(ConversationMemory, opcional): Memoria de la sesion
+            trace(Request_Trace, opcional): Traza de la consulta
+            timings(bool, opcional): Si True el evento final incluye los tiempos por etapa
+        """
+        for i, event in enumerate(cached["events"]):
+            if i == 0 and trace:
+                Tracing.record("first_token", trace.elapsed(), trace)
+            yield event
+
+        if cached["answer"] and self.keep_memory:
+            memory.add_message("system", cached["answer"])
+
+        yield self._final_event(cached["sources"], query, trace, timings, cached=True)
+
+
+    def _final_event(self, sources: list, query: str, trace: Tracing.Request_Trace = None, timings: bool = False, cached: bool = False) -> dict:
+        """
+        Construye el evento final del stream y cierra la traza de la consulta (etapa "total" y contador de consultas).
+
+        Params:
+            sources(list): Fuentes formateadas
+            query(str)
+            trace(Request_Trace, opcional): Traza de la consulta
+            timings(bool, opcional): Si True se añaden los tiempos por etapa en ms
+            cached(bool, opcional): Si la respuesta sale de la cache semantica
+        """
+        event = {"type": "final", "sources": sources, "query": query}
+
+        if trace:
+            Tracing.record("total", trace.elapsed(), trace)
+            Tracing.count("rag_requests_total", cached=str(cached).lower())
+
+            if timings:
+                event["timings"] = trace.timings()
+
+        return event
+
+
+    def _build_frontend_context(self, documents: list) -> tuple:
+        """
+        Une los documentos en el contexto del prompt y añade las descripciones de sus imagenes.
+
+        Params:
+            documents(list): Documentos que se pasan al LLM
+
+        Returns:
+            Tuple[str, list]: (contexto, referencias a imagenes)
+        """
+        retrieved_context = "\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(documents)])
+
+        image_references = list(dict.fromkeys(IMAGE_REFERENCE_PATTERN.findall(retrieved_context)))
+
+        if image_references:
+            retrieved_context = self._attach_captions(retrieved_context, image_references)
+
+        return retrieved_context, image_references
+
+
+    def _print_used_documents(self, documents: list):
+
+        print("\nDocument used:\n")
+
+        for i, doc in enumerate(documents):
+            print(f"\nDOCUMENT {i+1}:")
+            print(f"\n{doc}\n\n{'-'*100}")
+
+
+    def invoke_for_frontend(self, query: str, session_id: str = "default", timings: bool = False) -> Iterator[dict]:
+        """
+        Metodo para ejcutar codigo para el frontend deolviendo Iterators que REACT puede interpretar
+
+        Params:
+            query(str)
+            session_id(str): Identificador de la sesion cuyo historial se usa si keep_memory es True
+            timings(bool): Si True el evento final incluye los tiempos por etapa en ms (enhance, embed, ann_query, rerank, first_token...)
+        """
+        trace = Tracing.Request_Trace()
+        memory = self.memory_store.get(session_id) if self.keep_memory else None
+
+        # La traza solo se activa en los tramos sin yield, asi no se queda puesta en el contexto de quien consume el stream
+        with Tracing.activate(trace):
+            query, results = self._resolve_query(query, memory)
+            documents = results['documents'][0]
+            metadatas = results['metadatas'][0]
+            chunk_ids = results['ids'][0]
+
+            cached = None
+            if self.semantic_cache:
+                query_embedding = self.embed_query(query)
+                with Tracing.span("semantic_cache"):
+                    cached = self.semantic_cache.lookup(query_embedding, chunk_ids)
+
+            if not cached and self.reranker:
+                reranked_docs, reranked_metadatas = self.rerank_documents(query, documents, metadatas, chunk_ids, results.get('distances', [None])[0])
+                documents = reranked_docs[:self.top_k]
+                metadatas = reranked_metadatas[:self.top_k]
+
+        if cached:
+            yield from self._replay_cached_answer(cached, query, memory, trace, timings)
+            return
+
+        events = []
+
+        with Tracing.span("prompt_build", trace):
+            retrieved_context, image_references = self._build_frontend_context(documents)
+            prompt = self._build_frontend_prompt(retrieved_context, query)
+
+        if image_references:
+            events.append({"type": "images", "content": image_references})
+            yield events[-1]
+
+        generation_start = time.perf_counter()
+
+        llm_stream = self.text_model.generate_stream(prompt)
 
 
         full_response = ""
         for chunk in llm_stream:
 
             chunk_text = chunk.get('response', '') 
-            
 
-            yield {"type": "chunk", "content": chunk_text}
+            if not full_response and chunk_text:
+                Tracing.record("first_token", trace.elapsed(), trace)
+            
+            events.append({"type": "chunk", "content": chunk_text})
+            yield events[-1]
 
             full_response += chunk_text
 
+        generation_time = time.perf_counter() - generation_start
+        Tracing.record("generation", generation_time, trace)
+
 
         if full_response and self.keep_memory:
-            self.conversation_memory.add_message("system", full_response)
+            memory.add_message("system", full_response)
 
         if self.print_documents:
+            self._print_used_documents(documents)
+            
+        formatted_sources = self._format_sources(documents, metadatas)
 
-            print("\nDocument used:\n")
+        if self.semantic_cache and full_response:
+            self.semantic_cache.store(query_embedding, chunk_ids, events, formatted_sources, full_response, generation_time)
 
-            for i, doc in enumerate(documents):
-                print(f"\nDOCUMENT {i+1}:")
-                print(f"\n{doc}\n\n{"-"*100}")
+        yield self._final_event(formatted_sources, query, trace, timings)
 
 
-        def _format_sources( documents: list, metadatas: list) -> list:
-            """
-            Funcion ayudante para formetear las fuentes de forma que el frontend pueda procesar
-            
-            Params:
-                documents(list)
-                metadatas(list)
-                
-            """
-
-            formatted_sources = []
-            for doc, meta in zip(documents, metadatas):
-                formatted_sources.append({
-                    "title": meta.get('source'),
-                    "link": meta.get('link', '#'),
-                    "content": doc,
-                })
-            return formatted_sources
-    
- 
-            
-        formatted_sources = _format_sources(documents, metadatas)
-        yield {"type": "final", "sources": formatted_sources, "query": query}
+    async def embed_query_async(self, query: str):
+        """
+        Version asincrona de embed_query.
+
+        Params:
+            query (str): Consulta de búsqueda
+
+        """
+        key = normalize_query(query)
+
+        query_embedding = self.query_embedding_cache.get(key)
+        if query_embedding is None:
+            with Tracing.span("embed"):
+                query_embedding = await self.embedding_model.generate_embeddings_async([query])
+            self.query_embedding_cache.put(key, query_embedding)
+
+        return query_embedding
+
+
+    async def retrieve_async(self, query: str):
+        """
+        Version asincrona de retrieve. El embedding se pide con el cliente HTTP asincrono y la consulta
+        a Chroma (sincrona) se ejecuta en un hilo para no bloquear el event loop.
+
+        Params:
+            query (str): Consulta de búsqueda para recuperar documentos relevantes
+
+        """
+        key = (normalize_query(query), self.k, self.collection_version)
+
+        results = self.results_cache.get(key)
+        if results is not None:
+            Tracing.count("rag_retrieval_cache_hits_total")
+            return results
+
+        query_embedding = await self.embed_query_async(query)
+
+        with Tracing.span("ann_query"):
+            results = await asyncio.to_thread(self.vector_store.query, query_embeddings=query_embedding, n_results=self.k)
+
+        if self.retrieval_mode == "hybrid":
+            with Tracing.span("hybrid_fusion"):
+                results = await asyncio.to_thread(self._fuse_hybrid, query, results)
+
+        self.results_cache.put(key, results)
+
+        return results
+
+
+    async def invoke_for_frontend_async(self, query: str, session_id: str = "default", timings: bool = False) -> AsyncIterator[dict]:
+        """
+        Version asincrona de invoke_for_frontend para el servidor FastAPI. Las llamadas a Ollama usan el cliente
+        asincrono y el rerank (CPU) se ejecuta en un executor, asi un solo worker de uvicorn atiende muchas sesiones.
+
+        Params:
+            query(str)
+            session_id(str): Identificador de la sesion cuyo historial se usa si keep_memory es True
+            timings(bool): Si True el evento final incluye los tiempos por etapa en ms
+        """
+        trace = Tracing.Request_Trace()
+        memory = self.memory_store.get(session_id) if self.keep_memory else None
+
+        with Tracing.activate(trace):
+            query, results = await self._resolve_query_async(query, memory)
+            documents = results['documents'][0]
+            metadatas = results['metadatas'][0]
+            chunk_ids = results['ids'][0]
+
+            cached = None
+            if self.semantic_cache:
+                query_embedding = await self.embed_query_async(query)
+                with Tracing.span("semantic_cache"):
+                    cached = self.semantic_cache.lookup(query_embedding, chunk_ids)
+
+            if not cached and self.reranker:
+                loop = asyncio.get_running_loop()
+                reranked_docs, reranked_metadatas = await loop.run_in_executor(None, contextvars.copy_context().run, self.rerank_documents, query, documents, metadatas, chunk_ids, results.get('distances', [None])[0])
+                documents = reranked_docs[:self.top_k]
+                metadatas = reranked_metadatas[:self.top_k]
+
+        if cached:
+            for event in self._replay_cached_answer(cached, query, memory, trace, timings):
+                yield event
+            return
+
+        events = []
+
+        with Tracing.span("prompt_build", trace):
+            retrieved_context, image_references = self._build_frontend_context(documents)
+            prompt = self._build_frontend_prompt(retrieved_context, query)
+
+        if image_references:
+            events.append({"type": "images", "content": image_references})
+            yield events[-1]
+
+        generation_start = time.perf_counter()
+
+        full_response = ""
+        async for chunk in self.text_model.generate_stream_async(prompt):
+
+            chunk_text = chunk.get('response', '')
+
+            if not full_response and chunk_text:
+                Tracing.record("first_token", trace.elapsed(), trace)
+
+            events.append({"type": "chunk", "content": chunk_text})
+            yield events[-1]
+
+            full_response += chunk_text
+
+        generation_time = time.perf_counter() - generation_start
+        Tracing.record("generation", generation_time, trace)
+
+        if full_response and self.keep_memory:
+            memory.add_message("system", full_response)
+
+        if self.print_documents:
+            self._print_used_documents(documents)
+
+        formatted_sources = self._format_sources(documents, metadatas)
+
+        if self.semantic_cache and full_response:
+            self.semantic_cache.store(query_embedding, chunk_ids, events, formatted_sources, full_response, generation_time)
+
+        yield self._final_event(formatted_sources, query, trace, timings)
 
 
 
@@ -1,19 +1,77 @@
-from typing import List, Dict
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, List, Dict
+
+def approximate_tokens(text: str) -> int:
+    """
+    Estimacion rapida del numero de tokens de un texto (aprox. 4 caracteres por token).
+
+    Params:
+        text (str): Texto
+
+    """
+    return max(1, len(text) // 4)
+
 
 class ConversationMemory:
     """
     Clase para gestionar y mantener el historial de conversaciones.
     Almacena mensajes con roles y contenido, con límite de longitud.
 
+    Con max_tokens el historial tiene ademas un presupuesto de tokens: el conteo se lleva de forma incremental
+    y cuando se supera, los turnos mas antiguos se resumen en un resumen acumulado que se guarda en cache.
+    Asi el prompt del mejorador de consultas no crece aunque la conversacion sea muy larga.
+    Con summary_executor el resumen se hace en segundo plano: add_message no espera al LLM y, mientras tanto,
+    el historial mantiene el resumen anterior seguido de los turnos pendientes de resumir.
+
     Params:
         max_history (int, optional): Número máximo de mensajes a mantener en el historial. Por defecto 10.
+        on_message (Callable, optional): Funcion llamada con (role, content) cada vez que se añade un mensaje. Por defecto None.
+        max_tokens (int, optional): Presupuesto de tokens de los mensajes guardados. Por defecto None (sin limite).
+        summarizer (Callable, optional): Funcion (resumen_anterior, texto_de_los_turnos) -> nuevo resumen. Si no se da,
+            los turnos antiguos se descartan. Por defecto None.
+        count_tokens (Callable, optional): Funcion para contar tokens de un texto. Por defecto approximate_tokens.
+        summary_max_tokens (int, optional): Tokens maximos del resumen. Por defecto max_tokens // 2.
+        on_summary (Callable, optional): Funcion llamada con el nuevo resumen cada vez que cambia. Por defecto None.
+        summary_executor (Executor, optional): Executor donde se ejecuta el summarizer. Por defecto None (en la llamada).
 
     """
 
-    def __init__(self, max_history: int = 10):
+    def __init__(self,
+                 max_history: int = 10,
+                 on_message: Callable[[str, str], None] = None,
+                 max_tokens: int = None,
+                 summarizer: Callable[[str, str], str] = None,
+                 count_tokens: Callable[[str], int] = approximate_tokens,
+                 summary_max_tokens: int = None,
+                 on_summary: Callable[[str], None] = None,
+                 summary_executor: Executor = None):
 
         self.max_history = max_history
-        self.conversation_history = []
+        self.on_message = on_message
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+        self.summary_max_tokens = summary_max_tokens or (max_tokens // 2 if max_tokens else None)
+        self.on_summary = on_summary
+        self.summary_executor = summary_executor
+
+        self.conversation_history = deque()
+        self._token_counts = deque()
+        self.total_tokens = 0
+        self.summary = ""
+        self._history_cache = None
+
+        # Turnos que ya salieron del historial pero aun no estan en el resumen
+        self._pending_summary = []
+        self._summary_future = None
+        self._summarizing = False
+        self._summary_lock = threading.Lock()
 
 
     def add_message(self, role: str, content: str):
@@ -24,14 +82,134 @@ class ConversationMemory:
             role (str): Rol del emisor (ej: 'user', 'system')
             content (str): Contenido del mensaje
         """
+        self._append(role, content)
+
+        if self.on_message:
+            self.on_message(role, content)
+
+
+    def load(self, messages: List[Dict], summary: str = ""):
+        """
+        Carga mensajes y resumen guardados (p.ej. desde SQLite) sin llamar a on_message.
+
+        Params:
+            messages (List[Dict]): Mensajes con 'role' y 'content'
+            summary (str, optional): Resumen acumulado. Por defecto "".
+        """
+        self.summary = summary
+
+        # Lo que ya no cabe al cargar se descarta sin volver a resumir
+        summarizer, self.summarizer = self.summarizer, None
+        try:
+            for message in messages:
+                self._append(message["role"], message["content"])
+        finally:
+            self.summarizer = summarizer
+
+
+    def _append(self, role: str, content: str):
+
         message = {
             "role": role,
             "content": content
         }
+        tokens = self.count_tokens(content)
+
         self.conversation_history.append(message)
-        
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[1:]
+        self._token_counts.append(tokens)
+        self.total_tokens += tokens
+        self._history_cache = None
+
+        rolled = []
+        while len(self.conversation_history) > self.max_history:
+            rolled.append(self._pop_oldest())
+
+        if self.max_tokens and self.total_tokens > self.max_tokens:
+            # Se baja a la mitad del presupuesto para no resumir en cada turno
+            while len(self.conversation_history) > 1 and self.total_tokens > self.max_tokens // 2:
+                rolled.append(self._pop_oldest())
+
+        if rolled and self.max_tokens:
+            self._roll_into_summary(rolled)
+
+
+    def _pop_oldest(self) -> Dict:
+
+        self.total_tokens -= self._token_counts.popleft()
+        return self.conversation_history.popleft()
+
+
+    def _roll_into_summary(self, rolled: List[Dict]):
+        """
+        Añade los turnos que salen del historial al resumen acumulado. Con summary_executor solo los deja
+        pendientes y lanza el resumen en segundo plano si no hay uno en marcha.
+        """
+        if not self.summarizer:
+            return
+
+        with self._summary_lock:
+            self._pending_summary.extend(rolled)
+            self._history_cache = None
+
+            if self._summarizing:
+                # El resumen en marcha recoge tambien estos turnos al terminar
+                return
+            self._summarizing = True
+
+            if self.summary_executor is not None:
+                self._summary_future = self.summary_executor.submit(self._summarize_pending)
+                return
+
+        self._summarize_pending()
+
+
+    def _summarize_pending(self):
+        """
+        Resume los turnos pendientes hasta que no quede ninguno. El resumen anterior se mantiene hasta tener el nuevo.
+        """
+        while True:
+            with self._summary_lock:
+                batch = list(self._pending_summary)
+                previous = self.summary
+
+                if not batch:
+                    self._summarizing = False
+                    return
+
+            rolled_text = "\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in batch)
+
+            try:
+                summary = self.summarizer(previous, rolled_text).strip()
+            except Exception as e:
+                print(f"Error summarizing conversation: {e}")
+                summary = None
+
+            if summary is not None and self.summary_max_tokens and self.count_tokens(summary) > self.summary_max_tokens:
+                # El resumen tambien tiene limite para que el prompt no crezca
+                summary = summary[-self.summary_max_tokens * 4:]
+
+            with self._summary_lock:
+                # Si falla, los turnos se descartan como sin summarizer
+                del self._pending_summary[:len(batch)]
+                if summary is not None:
+                    self.summary = summary
+                self._history_cache = None
+
+            if summary is not None and self.on_summary:
+                self.on_summary(summary)
+
+
+    def wait_for_summary(self, timeout: float = None):
+        """
+        Espera a que termine el resumen en segundo plano, si hay uno en marcha.
+
+        Params:
+            timeout (float, optional): Segundos maximos de espera. Por defecto None (sin limite).
+        """
+        future = self._summary_future
+        if future is not None:
+            future.result(timeout)
+
 
     def get_conversation_as_text(self, include_roles: bool = True) -> str:
         """
@@ -40,11 +218,11 @@ class ConversationMemory:
         Params:
             include_roles (bool, optional): Si incluir los roles en el texto. Por defecto True.
         """
-        if not self.conversation_history:
+        if self.is_empty():
             return ""
         
         lines = []
-        for message in self.conversation_history:
+        for message in self.get_full_history():
             if include_roles:
                 lines.append(f"{message['role'].upper()}: {message['content']}")
             else:
@@ -55,14 +233,198 @@ class ConversationMemory:
 
     def get_full_history(self) -> List[Dict]:
         """
-        Devuelve una copia completa del historial de conversación.
+        Devuelve una copia completa del historial de conversación. Si hay resumen acumulado va primero con rol 'summary'.
 
         """
-        return self.conversation_history.copy()
+        with self._summary_lock:
+            if self._history_cache is None:
+                history = self._pending_summary + list(self.conversation_history)
+                if self.summary:
+                    history.insert(0, {"role": "summary", "content": self.summary})
+                self._history_cache = history
+
+            return self._history_cache.copy()
     
 
     def is_empty(self) -> bool:
         """
         Verifica si el historial de conversación está vacío.
         """
-        return len(self.conversation_history) == 0
+        return len(self.conversation_history) == 0 and not self.summary and not self._pending_summary
+
+
+class Session_Memory_Store:
+    """
+    Almacen de memorias de conversacion por sesion, para que usuarios simultaneos no compartan historial.
+    Mantiene como mucho max_sessions sesiones en memoria (LRU) y descarta las que llevan session_ttl segundos sin uso.
+    Con persist_path los mensajes se guardan en SQLite y una sesion desalojada se recupera al volver a usarse.
+
+    Params:
+        max_history (int, optional): Número máximo de mensajes por sesion. Por defecto 10.
+        max_sessions (int, optional): Número máximo de sesiones en memoria. Por defecto 1000.
+        session_ttl (float, optional): Segundos sin uso tras los que se descarta una sesion. Por defecto 3600.
+        persist_path (str, optional): Ruta a un archivo SQLite para persistir los mensajes. Por defecto None (solo memoria).
+        max_tokens (int, optional): Presupuesto de tokens de cada memoria (ver ConversationMemory). Por defecto None.
+        summarizer (Callable, optional): Funcion para resumir los turnos antiguos (ver ConversationMemory). Por defecto None.
+        summary_workers (int, optional): Hilos para resumir en segundo plano, fuera del camino de las consultas.
+            0 resume dentro de add_message. Por defecto 2.
+
+    """
+
+    def __init__(self,
+                 max_history: int = 10,
+                 max_sessions: int = 1000,
+                 session_ttl: float = 3600,
+                 persist_path: str = None,
+                 max_tokens: int = None,
+                 summarizer: Callable[[str, str], str] = None,
+                 summary_workers: int = 2):
+
+        self.max_history = max_history
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.persist_path = persist_path
+
+        self._sessions = OrderedDict()  # session_id -> (ConversationMemory, ultimo uso)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._summary_executor = None
+        if summarizer and summary_workers:
+            self._summary_executor = ThreadPoolExecutor(max_workers=summary_workers, thread_name_prefix="memory-summary")
+
+        if persist_path:
+            directory = os.path.dirname(persist_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+
+    def get(self, session_id: str) -> ConversationMemory:
+        """
+        Devuelve la memoria de una sesion, creandola (o cargandola de SQLite) si no esta en memoria.
+
+        Params:
+            session_id (str): Identificador de la sesion enviado por el cliente
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            if session_id in self._sessions:
+                memory, _ = self._sessions[session_id]
+                self._sessions[session_id] = (memory, now)
+                self._sessions.move_to_end(session_id)
+                return memory
+
+            memory = ConversationMemory(self.max_history, max_tokens=self.max_tokens, summarizer=self.summarizer,
+                                        summary_executor=self._summary_executor)
+            if self._conn is not None:
+                self._load(session_id, memory)
+                memory.on_message = lambda role, content: self._persist(session_id, role, content)
+                memory.on_summary = lambda summary: self._persist_summary(session_id, summary)
+
+            self._sessions[session_id] = (memory, now)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            return memory
+
+
+    def drop(self, session_id: str):
+        """
+        Borra una sesion de memoria y de SQLite.
+
+        Params:
+            session_id (str): Identificador de la sesion
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+    def _evict_idle(self, now: float):
+        """
+        Descarta las sesiones que llevan mas de session_ttl sin usarse. Se llama con el lock cogido.
+        """
+        if self.session_ttl is None:
+            return
+
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.session_ttl:
+                break
+            self._sessions.popitem(last=False)
+
+
+    def _load(self, session_id: str, memory: ConversationMemory):
+        """
+        Carga los ultimos max_history mensajes de una sesion desde SQLite. Se llama con el lock cogido.
+        """
+        rows = self._conn.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, self.max_history)
+        ).fetchall()
+
+        summary = self._conn.execute("SELECT summary FROM summaries WHERE session_id = ?", (session_id,)).fetchone()
+
+        memory.load([{"role": role, "content": content} for role, content in reversed(rows)],
+                    summary=summary[0] if summary else "")
+
+
+    def _persist(self, session_id: str, role: str, content: str):
+        """
+        Guarda un mensaje en SQLite y borra los que ya no caben en el historial de la sesion.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, created) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, time.time())
+            )
+            self._conn.execute(
+                """DELETE FROM messages WHERE session_id = ? AND seq NOT IN (
+                       SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?)""",
+                (session_id, session_id, self.max_history)
+            )
+            self._conn.commit()
+
+
+    def _persist_summary(self, session_id: str, summary: str):
+        """
+        Guarda el resumen acumulado de una sesion en SQLite.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, summary) VALUES (?, ?)",
+                (session_id, summary)
+            )
+            self._conn.commit()
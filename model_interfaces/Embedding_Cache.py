@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from typing import List
+
+from model_interfaces.Embedding_Model import Embedding_Model, as_embedding_matrix
+
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza un texto antes de calcular su hash para la cache (espacios colapsados y sin espacios en los extremos).
+
+    Params:
+        text (str): Texto a normalizar
+
+    """
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_key(text: str) -> str:
+    """
+    Hash del texto normalizado usado como clave de la cache.
+
+    Params:
+        text (str): Texto
+
+    """
+    return hashlib.sha1(normalize_text(text).encode()).hexdigest()
+
+
+class Cached_Embedding(Embedding_Model):
+    """
+    Cache persistente de embeddings delante de cualquier Embedding_Model. Las entradas se guardan en SQLite
+    como float32 con clave (model_name, hash del texto normalizado), asi que reindexar o reconstruir la
+    coleccion solo pide al modelo los textos que no ha visto nunca.
+
+    Params:
+        embedding_model (Embedding_Model): Modelo de embeddings real
+        cache_path (str, optional): Ruta al archivo SQLite. Por defecto ".rag_cache/embeddings.sqlite".
+        max_bytes (int, optional): Tamaño maximo de los vectores guardados. Al superarlo se borran las entradas
+            usadas hace mas tiempo. Por defecto 2GB.
+
+    """
+
+    def __init__(self,
+                 embedding_model: Embedding_Model,
+                 cache_path: str = os.path.join(".rag_cache", "embeddings.sqlite"),
+                 max_bytes: int = 2 * 1024**3):
+
+        super().__init__(embedding_model.model_name, getattr(embedding_model, "normalize", False))
+
+        self.embedding_model = embedding_model
+        # Los vectores normalizados y sin normalizar del mismo modelo no se mezclan en la cache
+        self._cache_model = self.model_name + ("|l2" if self.normalize else "")
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+
+    def __getattr__(self, name: str):
+        # Atributos del modelo real (max_batch_chars, max_concurrency...) accesibles desde la cache
+        if name == "embedding_model":
+            raise AttributeError(name)
+        return getattr(self.embedding_model, name)
+
+
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Devuelve los embeddings de la cache y solo pide al modelo los textos que faltan.
+
+        Params:
+            texts (List[str]): Texto para generar embeddings
+
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys, found, missing = self._split_cached(texts)
+
+        if missing:
+            new_embeddings = self.embedding_model.generate_embeddings(list(missing.values()))
+            found.update(self._store_new(missing, new_embeddings))
+
+        return self._gather(keys, found)
+
+
+    async def generate_embeddings_async(self, texts: List[str]):
+        """
+        Version asincrona de generate_embeddings. Las consultas a SQLite se hacen en un hilo
+        y los textos que faltan se piden con la version asincrona del modelo real.
+
+        Params:
+            texts (List[str]): Texto para generar embeddings
+
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys, found, missing = await asyncio.to_thread(self._split_cached, texts)
+
+        if missing:
+            new_embeddings = await self.embedding_model.generate_embeddings_async(list(missing.values()))
+            found.update(await asyncio.to_thread(self._store_new, missing, new_embeddings))
+
+        return self._gather(keys, found)
+
+
+    @staticmethod
+    def _gather(keys: List[str], found: dict) -> np.ndarray:
+        """
+        Copia los vectores (de la cache y nuevos) a una matriz float32 contigua en el orden de los textos.
+        """
+        dimension = len(next(iter(found.values())))
+        embeddings = np.empty((len(keys), dimension), dtype=np.float32)
+
+        for i, key in enumerate(keys):
+            embeddings[i] = found[key]
+
+        return embeddings
+
+
+    def _split_cached(self, texts: List[str]):
+        """
+        Separa los textos en los que estan en la cache y los que hay que pedir al modelo.
+
+        Returns:
+            Tuple[List[str], dict, dict]: (claves de cada texto, vectores encontrados, clave -> texto que falta)
+        """
+        keys = [text_key(text) for text in texts]
+        found = self._lookup(set(keys))
+
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        with self._lock:
+            self.hits += len(texts) - sum(1 for key in keys if key in missing)
+            self.misses += len(missing)
+
+        return keys, found, missing
+
+
+    def _store_new(self, missing: dict, new_embeddings: list) -> dict:
+        """
+        Guarda los embeddings recien generados. Las filas son vistas de la matriz del modelo, no copias.
+        """
+        matrix = as_embedding_matrix(new_embeddings)
+        new_vectors = {key: matrix[i] for i, key in enumerate(missing)}
+        self._store(new_vectors)
+        return new_vectors
+
+
+    def _lookup(self, keys: set) -> dict:
+        """
+        Busca claves en SQLite y actualiza su fecha de ultimo uso.
+        """
+        found = {}
+        keys = list(keys)
+
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [self._cache_model, *chunk]
+                ).fetchall()
+
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, self._cache_model, key) for key in found]
+                )
+                self._conn.commit()
+
+        return found
+
+
+    def _store(self, vectors: dict):
+        """
+        Guarda vectores nuevos y desaloja las entradas menos usadas si se supera max_bytes.
+        Una clave ya guardada (dos hilos que fallan a la vez con el mismo texto) no se vuelve a sumar al tamaño.
+        """
+        now = time.time()
+
+        with self._lock:
+            for key, vector in vectors.items():
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (self._cache_model, key, vector.tobytes(), now)
+                )
+                if cursor.rowcount:
+                    self._total_bytes += vector.nbytes
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+            self._conn.commit()
+
+
+    def _evict(self):
+        """
+        Borra las entradas usadas hace mas tiempo hasta bajar al 90% de max_bytes. Se llama con el lock cogido.
+        """
+        target = int(self.max_bytes * 0.9)
+        # Otro proceso puede compartir el archivo: se parte del tamaño real antes de borrar
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT model, key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC")
+
+        to_delete = []
+        for model, key, size in rows:
+            if self._total_bytes <= target:
+                break
+            to_delete.append((model, key))
+            self._total_bytes -= size
+
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+
+    def stats(self) -> dict:
+        """
+        Devuelve los contadores de la cache.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,23 +1,64 @@
+import asyncio
 import ollama
+import threading
+import time
+
+import numpy as np
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+from model_interfaces import Tracing
+
+
+def as_embedding_matrix(embeddings, normalize: bool = False) -> np.ndarray:
+    """
+    Convierte embeddings a una matriz float32 contigua (n_textos, dimension), sin copiar si ya lo es.
+    Con normalize los vectores se normalizan (L2) de una vez y en el sitio.
+
+    Params:
+        embeddings (Any): Lista de vectores o array
+        normalize (bool, optional): Si True normaliza cada fila a norma 1. Por defecto False.
+
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+
+    if normalize and matrix.size:
+        if not matrix.flags.writeable:
+            matrix = matrix.copy()
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+    return matrix
 
 
 class Embedding_Model(ABC):
+    """
+    Interfaz de los modelos de embeddings. generate_embeddings devuelve siempre una matriz float32 contigua
+    de NumPy (n_textos, dimension), que se pasa tal cual a la cache y a Chroma sin convertir a listas.
+
+    Params:
+        model_name (str): Nombre del modelo
+        normalize (bool, optional): Si True los vectores salen con norma L2 = 1. Por defecto False.
+
+    """
 
 
     def __init__(self, 
-                 model_name: str):
+                 model_name: str,
+                 normalize: bool = False):
         
         self.model_name = model_name
+        self.normalize = normalize
 
 
     @abstractmethod
-    def generate_embeddings(self,texts: List[str]):
+    def generate_embeddings(self,texts: List[str]) -> np.ndarray:
         """
-        Metodo abstracto para la vdb generar embeddings.
+        Metodo abstracto para la vdb generar embeddings. Devuelve una matriz float32 (n_textos, dimension).
 
         Params:
             texts (List[str]): Texto para generar embeddings
@@ -25,6 +66,52 @@ class Embedding_Model(ABC):
         """
         pass
 
+    async def generate_embeddings_async(self, texts: List[str]):
+        """
+        Version asincrona de generate_embeddings. Por defecto ejecuta la version sincrona en un hilo,
+        las subclases con cliente asincrono la sobreescriben.
+
+        Params:
+            texts (List[str]): Texto para generar embeddings
+
+        """
+        return await asyncio.to_thread(self.generate_embeddings, texts)
+
+
+def pack_batches(texts: List[str], max_batch_chars: int, max_batch_size: int) -> List[List[int]]:
+    """
+    Agrupa textos en lotes por presupuesto de caracteres y numero maximo de textos, manteniendo el orden.
+    Un texto mas largo que el presupuesto va solo en su propio lote.
+
+    Params:
+        texts (List[str]): Textos a agrupar
+        max_batch_chars (int): Numero maximo de caracteres por lote (aprox. 4 caracteres por token)
+        max_batch_size (int): Numero maximo de textos por lote
+
+    Returns:
+        List[List[int]]: Indices de los textos de cada lote
+
+    """
+    batches = []
+    current = []
+    current_chars = 0
+
+    for i, text in enumerate(texts):
+        n_chars = len(text)
+
+        if current and (current_chars + n_chars > max_batch_chars or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+            current_chars = 0
+
+        current.append(i)
+        current_chars += n_chars
+
+    if current:
+        batches.append(current)
+
+    return batches
+
 
 class OpenAI_Embedding(Embedding_Model):
 
@@ -39,11 +126,83 @@ class OpenAI_Embedding(Embedding_Model):
 
         
 class Ollama_Embedding(Embedding_Model):
+    """
+    Embeddings con Ollama. Los textos se agrupan en lotes por presupuesto de caracteres y los lotes se envian
+    en paralelo, para no mandar una peticion gigante por un PDF enorme ni cientos de peticiones pequeñas.
+
+    Params:
+        model_name (str): Nombre del modelo de embeddings en Ollama
+        host (str, optional): URL del servidor de Ollama. Por defecto OLLAMA_HOST o localhost.
+        max_batch_chars (int, optional): Caracteres maximos por peticion. Por defecto 32000.
+        max_batch_size (int, optional): Textos maximos por peticion. Por defecto 64.
+        max_concurrency (int, optional): Peticiones simultaneas al servidor. Por defecto 2.
+        max_retries (int, optional): Reintentos de un lote que falla antes de enviarlo texto a texto. Por defecto 2.
+        timeout (float, optional): Timeout en segundos de cada peticion. Por defecto None.
+        normalize (bool, optional): Si True los vectores salen con norma L2 = 1. Por defecto False.
+
+    """
 
     def __init__(self,
-                 model_name: str):
+                 model_name: str,
+                 host: str = None,
+                 max_batch_chars: int = 32000,
+                 max_batch_size: int = 64,
+                 max_concurrency: int = 2,
+                 max_retries: int = 2,
+                 timeout: float = None,
+                 normalize: bool = False):
         
-        super().__init__(model_name)
+        super().__init__(model_name, normalize)
+
+        self.client = ollama.Client(host=host, timeout=timeout)
+        self.async_client = ollama.AsyncClient(host=host, timeout=timeout)
+        self.max_batch_chars = max_batch_chars
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+
+    def _embed_with_retry(self, texts: List[str]):
+        """
+        Envia una peticion de embeddings reintentando con espera exponencial si falla.
+
+        Params:
+            texts (List[str]): Textos del lote
+
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.embed(model=self.model_name, input=texts)
+                return response['embeddings']
+
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+
+    def _embed_batch(self, texts: List[str]):
+        """
+        Genera los embeddings de un lote. Si el lote sigue fallando tras los reintentos se reintenta
+        texto a texto, para que un solo texto problematico no tire el lote entero.
+        La respuesta JSON se convierte a float32 en cuanto llega, asi las listas de floats de Python solo viven un lote.
+
+        Params:
+            texts (List[str]): Textos del lote
+
+        """
+        Tracing.count("embedding_texts_total", len(texts), model=self.model_name)
+
+        try:
+            with Tracing.span("embed_request"):
+                return np.asarray(self._embed_with_retry(texts), dtype=np.float32)
+
+        except Exception as e:
+            if len(texts) == 1:
+                raise
+
+            print(f"Error embedding batch of {len(texts)} texts, retrying individually: {e}")
+            return np.asarray([self._embed_with_retry([text])[0] for text in texts], dtype=np.float32)
 
 
     def generate_embeddings(self, texts: List[str]):
@@ -54,6 +213,159 @@ class Ollama_Embedding(Embedding_Model):
             texts (List[str]): Texto para generar embeddings
 
         """
-       
-        response = ollama.embed(model=self.model_name, input=texts)
-        return response['embeddings']
\ No newline at end of file
+        batches = pack_batches(texts, self.max_batch_chars, self.max_batch_size)
+
+        if len(batches) <= 1:
+            embeddings = self._embed_batch(texts) if texts else np.empty((0, 0), dtype=np.float32)
+            return as_embedding_matrix(embeddings, self.normalize)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = executor.map(lambda batch: self._embed_batch([texts[i] for i in batch]), batches)
+
+            embeddings = self._assemble(len(texts), batches, results)
+
+        return as_embedding_matrix(embeddings, self.normalize)
+
+
+    @staticmethod
+    def _assemble(n_texts: int, batches: List[List[int]], results) -> np.ndarray:
+        """
+        Coloca los lotes (en el orden de pack_batches) en una matriz preasignada con el orden original de los textos.
+        """
+        embeddings = None
+
+        for batch, batch_embeddings in zip(batches, results):
+            if embeddings is None:
+                embeddings = np.empty((n_texts, batch_embeddings.shape[1]), dtype=np.float32)
+            embeddings[batch] = batch_embeddings
+
+        return embeddings if embeddings is not None else np.empty((0, 0), dtype=np.float32)
+
+
+    async def _embed_batch_async(self, texts: List[str]):
+        """
+        Version asincrona de _embed_batch, con los mismos reintentos.
+
+        Params:
+            texts (List[str]): Textos del lote
+
+        """
+        async def embed_with_retry(batch: List[str]):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.async_client.embed(model=self.model_name, input=batch)
+                    return response['embeddings']
+
+                except Exception:
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+
+        Tracing.count("embedding_texts_total", len(texts), model=self.model_name)
+
+        try:
+            with Tracing.span("embed_request"):
+                return np.asarray(await embed_with_retry(texts), dtype=np.float32)
+
+        except Exception as e:
+            if len(texts) == 1:
+                raise
+
+            print(f"Error embedding batch of {len(texts)} texts, retrying individually: {e}")
+            return np.asarray([(await embed_with_retry([text]))[0] for text in texts], dtype=np.float32)
+
+
+    async def generate_embeddings_async(self, texts: List[str]):
+        """
+        Version asincrona de generate_embeddings usando el cliente asincrono de Ollama.
+
+        Params:
+            texts (List[str]): Texto para generar embeddings
+
+        """
+        batches = pack_batches(texts, self.max_batch_chars, self.max_batch_size)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(batch: List[int]):
+            async with semaphore:
+                return await self._embed_batch_async([texts[i] for i in batch])
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+
+        return as_embedding_matrix(self._assemble(len(texts), batches, results), self.normalize)
+
+
+class SentenceTransformer_Embedding(Embedding_Model):
+    """
+    Embeddings en el propio proceso con sentence-transformers, sin pasar por HTTP. Sirve para ingestas
+    offline y baja la latencia de embedding de una consulta a unos milisegundos.
+    Devuelve arrays float32 de NumPy (n_textos, dimension) sin convertir a listas.
+
+    Params:
+        model_name (str): Nombre o ruta del modelo (p.ej. "mixedbread-ai/mxbai-embed-large-v1")
+        device (str, optional): Dispositivo de inferencia. Por defecto "cpu".
+        backend (str, optional): "torch", "onnx" u "openvino" (sentence-transformers >= 3.2). Por defecto "torch".
+        batch_size (int, optional): Textos por lote de inferencia. Por defecto 32.
+        num_threads (int, optional): Hilos de PyTorch para la inferencia en CPU. Por defecto None (los de PyTorch).
+        normalize (bool, optional): Si True los vectores salen con norma L2 = 1. Por defecto False.
+        max_seq_length (int, optional): Tokens maximos por texto. Por defecto el del modelo.
+
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 device: str = "cpu",
+                 backend: str = "torch",
+                 batch_size: int = 32,
+                 num_threads: int = None,
+                 normalize: bool = False,
+                 max_seq_length: int = None):
+
+        super().__init__(model_name, normalize)
+
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+
+        self.batch_size = batch_size
+        # El pipeline de ingesta agrupa chunks por caracteres, aprox. un lote lleno de textos de 1200 tokens
+        self.max_batch_chars = batch_size * 4800
+        self.max_concurrency = 1
+
+        if backend == "torch":
+            self.model = SentenceTransformer(model_name, device=device)
+        else:
+            self.model = SentenceTransformer(model_name, device=device, backend=backend)
+
+        if max_seq_length:
+            self.model.max_seq_length = max_seq_length
+
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+        # Una sola inferencia a la vez: varias en paralelo solo compiten por los mismos hilos de CPU
+        self._lock = threading.Lock()
+
+
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Genera embeddings en lotes de batch_size (sentence-transformers ordena los textos por longitud para rellenar menos).
+
+        Params:
+            texts (List[str]): Texto para generar embeddings
+
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        Tracing.count("embedding_texts_total", len(texts), model=self.model_name)
+
+        with self._lock, Tracing.span("embed_request"):
+            embeddings = self.model.encode(texts,
+                                           batch_size=self.batch_size,
+                                           convert_to_numpy=True,
+                                           normalize_embeddings=self.normalize,
+                                           show_progress_bar=False)
+
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
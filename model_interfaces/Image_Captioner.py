@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from model_interfaces.Visual_Model import Visual_Model
+
+
+
+class Image_Captioner:
+    """
+    Genera descripciones de imagenes con un Visual_Model al subir documentos, una sola vez por imagen.
+    Las imagenes se guardan con su hash de contenido como nombre (store_image), asi que el nombre sirve de clave:
+    la misma figura en otro documento o en una nueva version del manual no vuelve a pasar por el modelo.
+    Las descripciones se guardan en SQLite y las llamadas al modelo se reparten en un pool de hilos.
+
+    Params:
+        visual_model (Visual_Model): Modelo de vision que describe las imagenes
+        cache_path (str, optional): Ruta al archivo SQLite. Por defecto ".rag_cache/captions.sqlite".
+        max_workers (int, optional): Llamadas simultaneas al modelo. Por defecto 2.
+
+    """
+
+    def __init__(self,
+                 visual_model: Visual_Model,
+                 cache_path: str = os.path.join(".rag_cache", "captions.sqlite"),
+                 max_workers: int = 2):
+
+        self.visual_model = visual_model
+        self.cache_path = cache_path
+        self.generated = 0
+        self.failed = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS captions (
+                model TEXT NOT NULL,
+                image TEXT NOT NULL,
+                caption TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (model, image)
+            )
+        """)
+        self._conn.commit()
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="captioner")
+
+
+    def lookup(self, images: Iterable[str]) -> Dict[str, str]:
+        """
+        Devuelve las descripciones ya generadas, sin llamar al modelo. Se usa en las consultas.
+
+        Params:
+            images (Iterable[str]): Rutas de las imagenes ("images/<hash>.png")
+
+        Returns:
+            Dict[str, str]: Descripcion de cada imagen que la tenga
+        """
+        images = list(dict.fromkeys(images))
+        if not images:
+            return {}
+
+        found = {}
+        with self._lock:
+            for start in range(0, len(images), 500):
+                chunk = images[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT image, caption FROM captions WHERE model = ? AND image IN ({placeholders})",
+                    [self.visual_model.model_name, *[os.path.basename(image) for image in chunk]]
+                ).fetchall()
+                found.update(rows)
+
+        return {image: found[os.path.basename(image)] for image in images if os.path.basename(image) in found}
+
+
+    def caption(self, images: Iterable[str]) -> Dict[str, str]:
+        """
+        Devuelve la descripcion de cada imagen. Las que no estan en la cache se generan en el pool de hilos
+        (una llamada al modelo por imagen unica) y se guardan. Bloquea hasta tenerlas todas.
+
+        Params:
+            images (Iterable[str]): Rutas de las imagenes
+
+        Returns:
+            Dict[str, str]: Descripcion de cada imagen (las que fallan no aparecen)
+        """
+        images = list(dict.fromkeys(images))
+        captions = self.lookup(images)
+        missing = [image for image in images if image not in captions and os.path.exists(image)]
+
+        with self._lock:
+            self.hits += len(captions)
+
+        if not missing:
+            return captions
+
+        start = time.perf_counter()
+        results = list(self._executor.map(self.visual_model.caption_image, missing))
+
+        rows = []
+        for image, caption in zip(missing, results):
+            if not caption:
+                continue
+            captions[image] = caption.strip()
+            rows.append((self.visual_model.model_name, os.path.basename(image), caption.strip(), time.time()))
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO captions (model, image, caption, created) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self.generated += len(rows)
+            self.failed += len(missing) - len(rows)
+            self.seconds += time.perf_counter() - start
+
+        return captions
+
+
+    def stats(self) -> dict:
+        """
+        Devuelve contadores del captioner.
+        """
+        with self._lock:
+            return {
+                "model": self.visual_model.model_name,
+                "generated": self.generated,
+                "failed": self.failed,
+                "hits": self.hits,
+                "seconds": round(self.seconds, 2),
+            }
+
+
+    def close(self):
+        """
+        Cierra el pool de hilos y la conexion a SQLite.
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,269 @@
+import json
+import os
+
+from typing import Dict, List, Optional
+
+
+
+class Ingest_Manifest:
+    """
+    Manifest persistente de los archivos subidos a la vdb. Guarda por cada ruta su mtime, tamaño y hash de contenido
+    para que un archivo sin cambios solo cueste una llamada a os.stat. Mantiene en memoria indices por hash y por
+    directorio, asi buscar copias o los archivos de una carpeta no recorre todo el manifest.
+
+    Params:
+        manifest_path (str): Ruta al archivo JSON donde se guarda el manifest
+
+    """
+
+    def __init__(self, manifest_path: str):
+
+        self.manifest_path = manifest_path
+        self.entries: Dict[str, dict] = {}
+        self._by_hash: Dict[str, Dict[str, None]] = {}  # hash -> rutas (dict como conjunto ordenado)
+        self._by_dir: Dict[str, Dict[str, None]] = {}   # directorio (cualquier nivel) -> rutas
+        self._dirty = False
+
+        self.load()
+
+
+    def _index(self, path: str):
+
+        self._by_hash.setdefault(self.entries[path]["hash"], {})[path] = None
+        for directory in self._ancestors(path):
+            self._by_dir.setdefault(directory, {})[path] = None
+
+
+    def _unindex(self, path: str, entry: dict):
+
+        for index, key in [(self._by_hash, entry["hash"])] + [(self._by_dir, directory) for directory in self._ancestors(path)]:
+            paths = index.get(key)
+            if paths is not None:
+                paths.pop(path, None)
+                if not paths:
+                    del index[key]
+
+
+    @staticmethod
+    def _ancestors(path: str) -> List[str]:
+        """
+        Directorios que contienen una ruta, del mas cercano a la raiz.
+        """
+        directories = []
+        directory = os.path.dirname(path)
+        while directory:
+            directories.append(directory)
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+        return directories
+
+
+    def load(self):
+        """
+        Carga el manifest desde disco. Si no existe o esta corrupto se empieza vacio.
+        """
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+        except FileNotFoundError:
+            self.entries = {}
+
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"\nError loading manifest {self.manifest_path}: {e}")
+            self.entries = {}
+
+        self._by_hash = {}
+        self._by_dir = {}
+        for path in self.entries:
+            self._index(path)
+
+        self._dirty = False
+
+
+    def save(self):
+        """
+        Guarda el manifest en disco de forma atomica (escribe a un temporal y lo renombra).
+        Si no ha cambiado nada desde la ultima vez no se escribe.
+        """
+        if not self._dirty:
+            return
+
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._dirty = False
+
+
+    def get(self, path: str) -> Optional[dict]:
+        """
+        Devuelve la entrada de una ruta o None si no esta en el manifest.
+
+        Params:
+            path (str): Ruta del archivo
+        """
+        return self.entries.get(path)
+
+
+    def set(self, path: str, stat: os.stat_result, file_hash: str, page_hashes: List[str] = None):
+        """
+        Registra o actualiza la entrada de una ruta.
+
+        Params:
+            path (str): Ruta del archivo
+            stat (os.stat_result): Resultado de os.stat sobre el archivo
+            file_hash (str): Hash del contenido del archivo
+            page_hashes (List[str], optional): Hash de cada pagina (PDF). Si no se da se conservan los
+                de la entrada anterior cuando el contenido no ha cambiado. Por defecto None.
+        """
+        previous = self.entries.get(path)
+        if page_hashes is None and previous and previous["hash"] == file_hash:
+            page_hashes = previous.get("pages")
+
+        if previous is not None:
+            self._unindex(path, previous)
+
+        self.entries[path] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": file_hash
+        }
+
+        if page_hashes is not None:
+            self.entries[path]["pages"] = page_hashes
+
+        self._index(path)
+        self._dirty = self._dirty or self.entries[path] != previous
+
+
+    def remove(self, path: str):
+        """
+        Elimina la entrada de una ruta si existe.
+
+        Params:
+            path (str): Ruta del archivo
+        """
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self._unindex(path, entry)
+            self._dirty = True
+
+
+    def is_unchanged(self, path: str, stat: os.stat_result) -> bool:
+        """
+        Indica si el archivo no ha cambiado desde la ultima subida comparando mtime y tamaño.
+
+        Params:
+            path (str): Ruta del archivo
+            stat (os.stat_result): Resultado de os.stat sobre el archivo
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return False
+        return entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+
+
+    def find_by_hash(self, file_hash: str) -> List[str]:
+        """
+        Devuelve las rutas registradas con un hash de contenido dado (archivos movidos, renombrados o copiados).
+
+        Params:
+            file_hash (str): Hash del contenido
+        """
+        return list(self._by_hash.get(file_hash, ()))
+
+
+    def paths_under(self, directory: str) -> List[str]:
+        """
+        Devuelve las rutas registradas dentro de un directorio (en cualquier nivel).
+
+        Params:
+            directory (str): Ruta del directorio
+        """
+        return list(self._by_dir.get(directory.rstrip(os.sep) or os.sep, ()))
+
+
+class Ingest_Checkpoint:
+    """
+    Checkpoint de una ingesta en curso. Guarda los archivos que faltan por escribir y se actualiza despues de
+    cada escritura a Chroma, asi una ingesta interrumpida (crash, Ctrl+C) continua donde se quedo.
+    Los chunks ya escritos de un archivo a medias no se vuelven a generar porque sus ids dependen del contenido.
+
+    Params:
+        checkpoint_path (str): Ruta al archivo JSON del checkpoint
+
+    """
+
+    def __init__(self, checkpoint_path: str):
+
+        self.checkpoint_path = checkpoint_path
+        self.pending: Dict[str, bool] = {}  # ruta -> force
+
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                self.pending = json.load(f).get("pending", {})
+
+        except FileNotFoundError:
+            pass
+
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"\nError loading checkpoint {self.checkpoint_path}: {e}")
+
+
+    def begin(self, pending: Dict[str, bool]):
+        """
+        Registra los archivos de una nueva ingesta, sustituyendo lo que hubiera pendiente.
+
+        Params:
+            pending (Dict[str, bool]): Ruta -> force (si ignora el atajo de mtime/tamaño del manifest)
+        """
+        self.pending = dict(pending)
+        self.save()
+
+
+    def mark_done(self, paths: List[str]):
+        """
+        Quita archivos ya escritos del checkpoint y lo guarda.
+
+        Params:
+            paths (List[str]): Rutas terminadas
+        """
+        for path in paths:
+            self.pending.pop(path, None)
+        self.save()
+
+
+    def save(self):
+        """
+        Guarda el checkpoint de forma atomica. Si no queda nada pendiente se borra el archivo.
+        """
+        if not self.pending:
+            self.clear()
+            return
+
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"pending": self.pending}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+    def clear(self):
+        """
+        Borra el checkpoint.
+        """
+        self.pending = {}
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,333 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from typing import Any, List, Tuple
+
+from model_interfaces.file_readers import parallel_doc_processing
+
+
+
+class Ingest_Pipeline:
+    """
+    Pipeline de ingesta por etapas para Chroma_RAG:
+        1. Lectura y chunking en un pool de procesos (parallel_doc_processing).
+        2. Si el RAG tiene captioner, descripcion de las imagenes nuevas en un hilo propio, asi las llamadas al
+           modelo de vision no paran la lectura de resultados del pool.
+        3. Generacion de embeddings en un hilo, solapada con la lectura a traves de una cola acotada.
+           Los chunks de varios archivos se agrupan en una misma llamada al modelo.
+        4. Escritura a Chroma por lotes de write_batch_size chunks (de uno o varios archivos) en un hilo al final
+           del pipeline. Despues de cada escritura se guardan el manifest y el checkpoint.
+
+    Cuando las colas se llenan el productor se bloquea, asi que el pool deja de leer archivos (backpressure).
+    En lugar de un mensaje por archivo se imprime el progreso con chunks/s y MB/s cada progress_interval segundos.
+
+    Params:
+        rag (Chroma_RAG): Instancia de RAG con el vector store, el modelo de embeddings y el manifest
+        max_workers (int, optional): Numero de procesos para leer archivos. Por defecto os.cpu_count().
+        max_pending (int, optional): Tamaño maximo de las colas entre etapas (en archivos). Por defecto 8.
+        write_batch_size (int, optional): Numero de chunks por escritura a Chroma. Por defecto 256.
+        embed_group_chars (int, optional): Caracteres que se acumulan entre archivos antes de pedir embeddings.
+            Por defecto max_batch_chars * max_concurrency del modelo de embeddings si los tiene, si no 64000.
+        checkpoint (Ingest_Checkpoint, optional): Checkpoint que se actualiza tras cada escritura. Por defecto None.
+        progress_interval (float, optional): Segundos entre mensajes de progreso. Por defecto 2.
+
+    """
+
+    _STOP = object()
+
+
+    def __init__(self,
+                 rag: Any,
+                 max_workers: int = None,
+                 max_pending: int = 8,
+                 write_batch_size: int = 256,
+                 embed_group_chars: int = None,
+                 checkpoint: Any = None,
+                 progress_interval: float = 2.0):
+
+        self.rag = rag
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.write_batch_size = write_batch_size
+
+        if embed_group_chars is None:
+            embedding_model = rag.embedding_model
+            embed_group_chars = getattr(embedding_model, "max_batch_chars", 32000) * getattr(embedding_model, "max_concurrency", 2)
+        self.embed_group_chars = embed_group_chars
+        self.checkpoint = checkpoint
+        self.progress_interval = progress_interval
+        self.stats = {"files": 0, "failed": 0, "chunks": 0, "bytes": 0, "writes": 0, "seconds": 0.0}
+
+        self._caption_queue = queue.Queue(maxsize=max_pending)
+        self._embed_queue = queue.Queue(maxsize=max_pending)
+        self._write_queue = queue.Queue(maxsize=max_pending)
+        self._errors = []
+        self._lock = threading.Lock()
+
+
+    def run(self, jobs: List[Tuple[str, Any, str]], on_file_done: Any = None) -> int:
+        """
+        Ejecuta el pipeline sobre una lista de archivos a procesar.
+
+        Params:
+            jobs (List[Tuple[str, os.stat_result, str, dict]]): Lista de (ruta, stat, hash de contenido, plan de paginas o None)
+            on_file_done (Callable, optional): Funcion llamada con (ruta, estado) cuando un archivo termina
+
+        Returns:
+            int: Numero de archivos procesados correctamente
+
+        """
+        stats = {path: (stat, file_hash, pages) for path, stat, file_hash, pages in jobs}
+        self._on_file_done = on_file_done
+        self._n_done = 0
+        self._n_jobs = len(jobs)
+        self._start = time.perf_counter()
+        self._last_progress = self._start
+
+        threads = [threading.Thread(target=self._embed_stage, daemon=True),
+                   threading.Thread(target=self._write_stage, daemon=True)]
+        first_queue = self._embed_queue
+        if self.rag.captioner is not None:
+            threads.insert(0, threading.Thread(target=self._caption_stage, daemon=True))
+            first_queue = self._caption_queue
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            parse_jobs = [(path, file_hash, pages["range"] if pages else None) for path, _, file_hash, pages in jobs]
+
+            for path, documents, ids in parallel_doc_processing(self.rag.text_splitter,
+                                                                parse_jobs,
+                                                                max_workers=self.max_workers,
+                                                                max_pending=self.max_pending):
+                if self._errors:
+                    break
+
+                if documents is None or ids is None:
+                    self._file_done(path, "failed")
+                    continue
+
+                stat, file_hash, pages = stats[path]
+                item = {"path": path, "stat": stat, "file_hash": file_hash, "pages": pages, "documents": documents, "ids": ids}
+
+                if first_queue is self._caption_queue:
+                    self._put(self._caption_queue, item)
+                else:
+                    self._put(self._embed_queue, self._diff_item(item))
+
+        finally:
+            self._put(first_queue, self._STOP)
+            for thread in threads:
+                thread.join()
+
+        self.stats["seconds"] = time.perf_counter() - self._start
+        self._print_progress(final=True)
+
+        if self._errors:
+            raise self._errors[0]
+
+        return self._n_done
+
+
+    def _put(self, q: queue.Queue, item: Any):
+        """
+        Mete un elemento en una cola acotada sin quedarse bloqueado para siempre si una etapa ha fallado.
+        """
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._errors and item is not self._STOP:
+                    return
+
+
+    def _file_done(self, path: str, status: str):
+
+        with self._lock:
+            if status != "failed":
+                self._n_done += 1
+            else:
+                self.stats["failed"] += 1
+                if self.checkpoint:
+                    self.checkpoint.mark_done([path])
+
+            if self._on_file_done:
+                self._on_file_done(path, status)
+
+
+    def _print_progress(self, final: bool = False):
+        """
+        Imprime archivos, chunks y throughput (chunks/s y MB/s de texto escrito) como mucho cada progress_interval segundos.
+        """
+        now = time.perf_counter()
+        if not final and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+
+        with self._lock:
+            elapsed = max(now - self._start, 1e-9)
+            stats = dict(self.stats)
+
+        label = ("Stopped" if self._errors else "Done") if final else "Progress"
+        failed = f", {stats['failed']} failed" if stats["failed"] else ""
+
+        print(f"\n{label}: {stats['files']}/{self._n_jobs} files{failed}, {stats['chunks']} chunks in {stats['writes']} writes, "
+              f"{stats['chunks'] / elapsed:.1f} chunks/s, {stats['bytes'] / 1024**2 / elapsed:.2f} MB/s ({elapsed:.1f}s)")
+
+
+    def _diff_item(self, item: dict) -> dict:
+        """
+        Compara los chunks de un archivo con los ya guardados y devuelve el elemento para la etapa de embeddings.
+        """
+        diff = self.rag._diff_chunks(item["path"], item.pop("documents"), item.pop("ids"), item["pages"])
+        diff.update(item)
+        return diff
+
+
+    def _caption_stage(self):
+        """
+        Etapa de descripciones: añade a cada archivo los chunks con la descripcion de sus imagenes (el captioner
+        solo llama al modelo de vision para las imagenes que no tiene en cache) y lo pasa a la etapa de embeddings.
+        """
+        while True:
+            item = self._caption_queue.get()
+            if item is self._STOP:
+                break
+
+            if self._errors:
+                continue
+
+            try:
+                item["documents"], item["ids"] = self.rag._add_caption_chunks(item["documents"], item["ids"])
+                self._put(self._embed_queue, self._diff_item(item))
+
+            except Exception as e:
+                self._errors.append(e)
+
+        self._put(self._embed_queue, self._STOP)
+
+
+    def _embed_stage(self):
+        """
+        Etapa de embeddings: agrupa los chunks nuevos de varios archivos hasta embed_group_chars caracteres
+        y hace una sola llamada a generate_embeddings, que los reparte en lotes del tamaño adecuado.
+        """
+        stop = False
+
+        while not stop:
+            items = []
+            n_chars = 0
+
+            item = self._embed_queue.get()
+            while True:
+                if item is self._STOP:
+                    stop = True
+                    break
+
+                items.append(item)
+                n_chars += sum(len(doc["content"]) for doc in item["new_docs"])
+
+                if n_chars >= self.embed_group_chars:
+                    break
+
+                try:
+                    item = self._embed_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if self._errors or not items:
+                continue
+
+            try:
+                texts = [doc["content"] for item in items for doc in item["new_docs"]]
+                embeddings = self.rag.embedding_model.generate_embeddings(texts) if texts else None
+
+                start = 0
+                for item in items:
+                    end = start + len(item["new_docs"])
+                    item["embeddings"] = embeddings[start:end] if embeddings is not None else None
+                    start = end
+
+                    self._put(self._write_queue, item)
+
+            except Exception as e:
+                self._errors.append(e)
+
+        self._put(self._write_queue, self._STOP)
+
+
+    def _write_stage(self):
+        """
+        Etapa de escritura: acumula chunks de varios archivos y los escribe a Chroma en lotes de write_batch_size.
+        Un archivo se da por terminado (y se registra en el manifest) cuando se han escrito todos sus chunks.
+        """
+        batch = {"documents": [], "embeddings": [], "metadatas": [], "ids": []}
+        waiting = []
+
+        def flush():
+            n_chunks = len(batch["ids"])
+            n_bytes = sum(len(text.encode("utf-8")) for text in batch["documents"])
+
+            if batch["ids"]:
+                # Una sola matriz float32 contigua por escritura, sin pasar por listas de floats
+                self.rag._add_chunks(documents=batch["documents"],
+                                     embeddings=np.concatenate(batch["embeddings"]),
+                                     metadatas=batch["metadatas"],
+                                     ids=batch["ids"])
+                for values in batch.values():
+                    values.clear()
+
+            for item in waiting:
+                self.rag._finish_file(item)
+                self._file_done(item["path"], "synced")
+
+            if waiting:
+                # Commit: el manifest registra los archivos completos y el checkpoint los quita de pendientes
+                self.rag.manifest.save()
+                if self.checkpoint:
+                    self.checkpoint.mark_done([item["path"] for item in waiting])
+
+            with self._lock:
+                self.stats["files"] += len(waiting)
+                self.stats["chunks"] += n_chunks
+                self.stats["bytes"] += n_bytes
+                self.stats["writes"] += 1 if n_chunks else 0
+
+            waiting.clear()
+            self._print_progress()
+
+        while True:
+            item = self._write_queue.get()
+            if item is self._STOP:
+                break
+
+            if self._errors:
+                continue
+
+            try:
+                if item["new_ids"]:
+                    batch["documents"].extend(doc["content"] for doc in item["new_docs"])
+                    batch["embeddings"].append(item["embeddings"])
+                    batch["metadatas"].extend(doc["metadata"] for doc in item["new_docs"])
+                    batch["ids"].extend(item["new_ids"])
+
+                waiting.append(item)
+
+                if len(batch["ids"]) >= self.write_batch_size:
+                    flush()
+
+            except Exception as e:
+                self._errors.append(e)
+
+        try:
+            if not self._errors:
+                flush()
+
+        except Exception as e:
+            self._errors.append(e)
@@ -0,0 +1,294 @@
+import os
+import threading
+import time
+
+from typing import Any, Dict, List
+
+from watchfiles import Change, DefaultFilter, watch
+
+from model_interfaces.file_readers import is_supported_file, matches_patterns, scan_documents
+
+
+
+class Document_Filter(DefaultFilter):
+    """
+    Filtro de watchfiles que solo deja pasar documentos soportados y directorios añadidos o borrados
+    (un directorio movido dentro o fuera de la raiz llega como un solo evento). Ademas de lo que ignora
+    DefaultFilter (.git, __pycache__, temporales de editores...) ignora las rutas dadas.
+
+    Params:
+        ignore_paths (List[str], optional): Rutas a ignorar, p.ej. el cache_dir del RAG. Por defecto ninguna.
+
+    """
+
+    def __init__(self, ignore_paths: List[str] = ()):
+
+        super().__init__(ignore_paths=[os.path.abspath(path) for path in ignore_paths])
+
+
+    def __call__(self, change: Change, path: str) -> bool:
+
+        if not super().__call__(change, path):
+            return False
+
+        if is_supported_file(path):
+            return True
+
+        if change == Change.added:
+            return os.path.isdir(path)
+
+        # Un directorio borrado ya no se puede comprobar con isdir, se acepta cualquier ruta sin extension
+        return change == Change.deleted and not os.path.splitext(path)[1]
+
+
+class Ingest_Watcher:
+    """
+    Servicio de ingesta continua: vigila directorios de documentos de forma recursiva y mantiene la vdb al dia
+    sin volver a recorrer los directorios enteros.
+
+    Los eventos del sistema de archivos se agrupan (debounce) hasta que hay quiet_period segundos sin cambios,
+    o como mucho max_delay segundos. Se quedan en un lote pendiente por ruta (el ultimo evento gana) y un hilo
+    de fondo los procesa: primero los archivos que existen (añadir/actualizar, con el manifest para saltarse los que
+    no han cambiado) y despues los que ya no existen (borrar). En ese orden un archivo renombrado se detecta como
+    movido y reutiliza sus embeddings. Mientras se procesa un lote se siguen acumulando eventos para el siguiente.
+
+    Params:
+        rag (Chroma_RAG): Instancia de RAG a mantener sincronizada
+        roots (List[str]): Directorios a vigilar
+        quiet_period (float, optional): Segundos sin eventos antes de procesar un lote. Por defecto 1.
+        max_delay (float, optional): Segundos maximos que se agrupan eventos aunque sigan llegando. Por defecto 10.
+        initial_sync (bool, optional): Si True sincroniza las raices completas al arrancar. Por defecto True.
+
+    """
+
+    def __init__(self,
+                 rag: Any,
+                 roots: List[str],
+                 quiet_period: float = 1.0,
+                 max_delay: float = 10.0,
+                 initial_sync: bool = True):
+
+        self.rag = rag
+        self.roots = list(roots)
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self.initial_sync = initial_sync
+        self.filter = Document_Filter(ignore_paths=[rag.cache_dir])
+
+        self._pending: Dict[str, Change] = {}
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._ready = threading.Event()
+
+        self.batches = 0
+        self.files_synced = 0
+        self.files_deleted = 0
+        self.last_sync = None
+        self.last_error = None
+
+
+    def start(self):
+        """
+        Arranca el hilo que vigila las raices y el hilo que procesa los lotes.
+        """
+        if self._threads:
+            return
+
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._watch_loop, name="ingest-watch", daemon=True),
+            threading.Thread(target=self._worker_loop, name="ingest-worker", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+
+    def stop(self, timeout: float = None):
+        """
+        Para el servicio. El lote que se este procesando termina antes de salir.
+
+        Params:
+            timeout (float, optional): Segundos maximos a esperar a cada hilo. Por defecto sin limite.
+        """
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """
+        Espera a que se empiecen a vigilar las raices.
+        """
+        return self._ready.wait(timeout)
+
+
+    def run_forever(self):
+        """
+        Arranca el servicio y bloquea hasta Ctrl+C.
+        """
+        self.start()
+        try:
+            while not self._stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            print("\nStopping ingest watcher")
+        finally:
+            self.stop()
+
+
+    def stats(self) -> dict:
+        """
+        Devuelve contadores del servicio.
+        """
+        with self._condition:
+            pending = len(self._pending)
+
+        return {
+            "roots": self.roots,
+            "pending": pending,
+            "batches": self.batches,
+            "files_synced": self.files_synced,
+            "files_deleted": self.files_deleted,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+        }
+
+
+    def _to_root_path(self, path: str) -> str:
+        """
+        watchfiles devuelve rutas absolutas; se pasan a la forma de la raiz (p.ej. "./lidax_pdf/a.pdf")
+        para que coincidan con las rutas del manifest y de la metadata de los chunks.
+        """
+        for root in self.roots:
+            relative = os.path.relpath(path, os.path.abspath(root))
+            if not relative.startswith(os.pardir):
+                return root if relative == os.curdir else os.path.join(root, relative)
+        return path
+
+
+    def _is_excluded(self, path: str) -> bool:
+        """
+        Aplica include_patterns/exclude_patterns del RAG a una ruta de un evento, relativa a su raiz.
+        Un archivo dentro de un directorio excluido tambien se excluye.
+        """
+        for root in self.roots:
+            relative = os.path.relpath(path, root)
+            if relative.startswith(os.pardir):
+                continue
+
+            parts = relative.split(os.sep)
+            prefixes = [os.sep.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+            if self.rag.exclude_patterns and any(matches_patterns(prefix, self.rag.exclude_patterns) for prefix in prefixes):
+                return True
+
+            return bool(self.rag.include_patterns) and os.path.isfile(path) and not matches_patterns(relative, self.rag.include_patterns)
+
+        return False
+
+
+    def _watch_loop(self):
+
+        try:
+            if self.initial_sync:
+                # La sincronizacion inicial es el primer lote del worker, asi se vigila desde el principio
+                # y no se pierden los cambios que lleguen mientras tanto
+                with self._condition:
+                    for root in self.roots:
+                        self._pending[root] = Change.added
+                        for path in self.rag.manifest.paths_under(root):
+                            if not os.path.exists(path):
+                                self._pending[path] = Change.deleted
+                    self._condition.notify()
+
+            for changes in watch(*self.roots,
+                                 watch_filter=self.filter,
+                                 debounce=int(self.max_delay * 1000),
+                                 step=int(self.quiet_period * 1000),
+                                 stop_event=self._stop_event,
+                                 rust_timeout=1000,
+                                 yield_on_timeout=True,
+                                 recursive=True,
+                                 raise_interrupt=False):
+                self._ready.set()
+
+                if not changes:
+                    continue
+
+                with self._condition:
+                    for change, path in changes:
+                        path = self._to_root_path(path)
+                        if not self._is_excluded(path):
+                            self._pending[path] = change
+                    self._condition.notify()
+
+        except Exception as e:
+            self.last_error = f"watch: {e}"
+            print(f"\nError in ingest watcher: {e}")
+            self._stop_event.set()
+
+        finally:
+            self._ready.set()
+            with self._condition:
+                self._condition.notify_all()
+
+
+    def _worker_loop(self):
+
+        while True:
+            with self._condition:
+                while not self._pending and not self._stop_event.is_set():
+                    self._condition.wait()
+
+                if not self._pending:
+                    return
+
+                batch, self._pending = self._pending, {}
+
+            # Se decide por el estado actual del disco, no por el tipo de evento: si un archivo se crea y se
+            # borra dentro del mismo lote no hay nada que subir
+            present = [path for path in batch if os.path.exists(path)]
+            missing = [path for path in batch if not os.path.exists(path)]
+
+            self._sync(present, missing)
+
+
+    def _sync(self, present: List[str], missing: List[str]):
+        """
+        Aplica un lote: sube o actualiza las rutas que existen y borra las que ya no existen.
+        """
+        start = time.perf_counter()
+
+        try:
+            # Los archivos de eventos se pasan directamente (ya filtrados); los directorios se recorren con los patrones del RAG
+            files = [path for path in present if os.path.isfile(path)]
+            directories = [path for path in present if os.path.isdir(path)]
+
+            scanned = dict(scan_documents(files))
+            scanned.update(scan_documents(directories, self.rag.include_patterns, self.rag.exclude_patterns))
+            paths = sorted(scanned)
+
+            if paths:
+                self.rag._ingest(paths, "synced", stats=scanned)
+                self.files_synced += len(paths)
+
+            # Las rutas movidas ya se han quitado del manifest al subir su destino
+            missing = [path for path in missing
+                       if self.rag.manifest.get(path) or self.rag.manifest.paths_under(path) or self.rag.is_file_in_store(path)]
+            if missing:
+                self.files_deleted += len(self.rag._expand_deleted(missing))
+                print(self.rag.delete_from_vector_store(missing))
+
+            self.batches += 1
+            self.last_sync = time.time()
+
+            print(f"\nWatcher synced {len(paths)} files, deleted {len(missing)} paths in {time.perf_counter() - start:.2f}s")
+
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"\nError syncing watched files: {e}")
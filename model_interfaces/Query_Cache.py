@@ -0,0 +1,267 @@
+import re
+import threading
+import time
+
+import numpy as np
+
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normaliza una consulta para usarla como clave de cache (minusculas, espacios colapsados
+    y sin puntuacion final), asi las preguntas casi identicas comparten entrada.
+
+    Params:
+        query (str): Consulta del usuario
+
+    """
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!.¿¡ ")
+
+
+class LRU_TTL_Cache:
+    """
+    Cache en memoria con desalojo LRU y caducidad por tiempo. Es segura entre hilos.
+
+    Params:
+        max_size (int, optional): Numero maximo de entradas. Por defecto 1024.
+        ttl (float, optional): Segundos que dura una entrada. None para que no caduquen. Por defecto 3600.
+
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Devuelve el valor de una clave o default si no esta o ha caducado.
+
+        Params:
+            key (Hashable): Clave
+            default (Any, optional): Valor si no hay entrada. Por defecto None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Guarda un valor, desalojando la entrada usada hace mas tiempo si la cache esta llena.
+
+        Params:
+            key (Hashable): Clave
+            value (Any): Valor
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        """
+        Vacia la cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+
+    def stats(self) -> dict:
+        """
+        Devuelve los contadores de la cache.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+class Semantic_Answer_Cache:
+    """
+    Cache semantica de respuestas del LLM. Una entrada se reutiliza cuando el embedding de la nueva consulta
+    es suficientemente parecido (similitud coseno >= threshold) y se han recuperado exactamente los mismos chunks.
+    Las entradas se invalidan cuando cambia o se borra cualquiera de sus chunks.
+
+    Params:
+        threshold (float, optional): Similitud coseno minima para considerar dos consultas equivalentes. Por defecto 0.95.
+        max_entries (int, optional): Numero maximo de respuestas guardadas (desalojo LRU). Por defecto 512.
+        ttl (float, optional): Segundos que dura una respuesta. None para que no caduquen. Por defecto 86400.
+
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512, ttl: float = 86400):
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.saved_generation_seconds = 0.0
+
+        self._entries = OrderedDict()   # id de entrada -> entrada
+        self._by_chunks = {}            # frozenset de ids de chunks -> set de ids de entrada
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _normalize(embedding: Any):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+    def lookup(self, query_embedding: Any, chunk_ids: list) -> dict:
+        """
+        Busca una respuesta cacheada para una consulta y un conjunto de chunks recuperados.
+
+        Params:
+            query_embedding (Any): Embedding de la consulta
+            chunk_ids (list): Ids de los chunks recuperados
+
+        Returns:
+            dict: Entrada con "events", "sources", "answer" y "generation_time", o None si no hay
+        """
+        key = frozenset(chunk_ids)
+        vector = self._normalize(query_embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            best, best_score = None, self.threshold
+
+            for entry_id in list(self._by_chunks.get(key, ())):
+                entry = self._entries[entry_id]
+
+                if entry["expires"] is not None and entry["expires"] < now:
+                    self._remove(entry_id)
+                    continue
+
+                score = float(np.dot(vector, entry["embedding"]))
+                if score >= best_score:
+                    best, best_score = entry_id, score
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best)
+            entry = self._entries[best]
+            self.hits += 1
+            self.saved_generation_seconds += entry["generation_time"]
+            return entry
+
+
+    def store(self, query_embedding: Any, chunk_ids: list, events: list, sources: list, answer: str, generation_time: float):
+        """
+        Guarda una respuesta generada.
+
+        Params:
+            query_embedding (Any): Embedding de la consulta
+            chunk_ids (list): Ids de los chunks recuperados
+            events (list): Eventos emitidos antes del evento final (imagenes y chunks de texto)
+            sources (list): Fuentes del evento final
+            answer (str): Respuesta completa
+            generation_time (float): Segundos que tardo la generacion
+        """
+        key = frozenset(chunk_ids)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._entries[entry_id] = {
+                "embedding": self._normalize(query_embedding),
+                "chunk_ids": key,
+                "events": events,
+                "sources": sources,
+                "answer": answer,
+                "generation_time": generation_time,
+                "expires": time.monotonic() + self.ttl if self.ttl is not None else None,
+            }
+            self._by_chunks.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+
+    def invalidate_chunks(self, chunk_ids: list):
+        """
+        Borra las respuestas que usaban alguno de los chunks dados.
+
+        Params:
+            chunk_ids (list): Ids de chunks modificados o borrados
+        """
+        changed = set(chunk_ids)
+        if not changed:
+            return
+
+        with self._lock:
+            for key in [key for key in self._by_chunks if not changed.isdisjoint(key)]:
+                for entry_id in list(self._by_chunks.get(key, ())):
+                    self._remove(entry_id)
+                    self.invalidated += 1
+
+
+    def _remove(self, entry_id: int):
+        """
+        Borra una entrada. Se llama con el lock cogido.
+        """
+        entry = self._entries.pop(entry_id)
+        ids = self._by_chunks.get(entry["chunk_ids"])
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_chunks[entry["chunk_ids"]]
+
+
+    def stats(self) -> dict:
+        """
+        Devuelve los contadores de la cache.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidated": self.invalidated,
+                "saved_generation_seconds": round(self.saved_generation_seconds, 3),
+            }
@@ -0,0 +1,125 @@
+import re
+
+from typing import Callable
+
+
+
+# Pronombres que se refieren a algo dicho antes en la conversacion (ingles y español). No incluye articulos,
+# posesivos ni adverbios ("la", "su", "also"...), que aparecen en casi cualquier pregunta independiente
+ANAPHORA_WORDS = {
+    "it", "its", "they", "them", "their", "theirs",
+    "eso", "esto", "ello", "aquello",
+}
+
+# Expresiones que remiten a un turno anterior
+ANAPHORA_PHRASES = (
+    "the same", "the previous", "the above", "the former", "the latter", "that one", "this one", "those ones",
+    "lo mismo", "el mismo", "la misma", "los mismos", "las mismas", "lo anterior", "el anterior", "la anterior",
+)
+
+# Demostrativos que solo cuentan al principio de la consulta ("Esa pieza...", "These tolerances..."); en medio
+# suelen ser determinantes de una pregunta completa ("el par de esta norma")
+LEADING_DEMONSTRATIVES = {
+    "this", "that", "these", "those",
+    "ese", "esa", "esos", "esas", "este", "esta", "estos", "estas", "aquel", "aquella",
+}
+
+# Comienzos tipicos de una pregunta de seguimiento
+FOLLOW_UP_PREFIXES = (
+    "and ", "but ", "what about", "how about", "y ", "pero ",
+    "¿y ", "que hay de", "qué hay de", "y si", "¿y si",
+)
+
+# Comienzos que tambien abren preguntas completas ("Why does 2024 aluminium corrode...?"): solo cuentan en
+# consultas cortas
+SHORT_FOLLOW_UP_PREFIXES = ("so ", "then ", "why ", "entonces", "¿entonces", "¿por qué", "por qué", "¿por que", "por que")
+
+
+class Query_Rewrite_Gate:
+    """
+    Etapa barata que decide si hace falta reescribir una consulta con el historial antes de la busqueda.
+    Evita la llamada al LLM mejorador cuando la consulta ya es independiente.
+
+    Reglas, en orden:
+        1. Sin historial no hay nada que reescribir.
+        2. Pronombres o anaforas ("it", "eso", "the same"...), un demostrativo al principio ("esa pieza...")
+           o comienzos de seguimiento ("and...", "¿y...") -> reescribir. "why", "so", "entonces"... solo cuentan
+           en consultas de 2 * min_words palabras o menos.
+        3. Consultas muy cortas (min_words o menos) -> reescribir, suelen ser seguimientos.
+        4. Si hay scorer, se reescribe cuando su puntuacion supera threshold.
+
+    Params:
+        min_words (int, optional): Consultas con este numero de palabras o menos se reescriben. Por defecto 3.
+        scorer (Callable, optional): Clasificador ligero (consulta, historial) -> probabilidad de que dependa del historial. Por defecto None.
+        threshold (float, optional): Umbral para el scorer. Por defecto 0.5.
+
+    """
+
+    def __init__(self,
+                 min_words: int = 3,
+                 scorer: Callable[[str, str], float] = None,
+                 threshold: float = 0.5):
+
+        self.min_words = min_words
+        self.scorer = scorer
+        self.threshold = threshold
+        self.skipped = 0
+        self.rewritten = 0
+
+
+    def needs_rewrite(self, query: str, history: str) -> bool:
+        """
+        Indica si la consulta depende del historial y hay que reescribirla.
+
+        Params:
+            query (str): Consulta del usuario
+            history (str): Historial de conversacion previo (sin la consulta actual)
+        """
+        decision = self._decide(query, history)
+
+        if decision:
+            self.rewritten += 1
+        else:
+            self.skipped += 1
+
+        return decision
+
+
+    def _decide(self, query: str, history: str) -> bool:
+
+        if not history.strip():
+            return False
+
+        normalized = query.strip().lower()
+        words = re.findall(r"[\wáéíóúñü]+", normalized)
+
+        if normalized.startswith(FOLLOW_UP_PREFIXES):
+            return True
+
+        if normalized.startswith(SHORT_FOLLOW_UP_PREFIXES) and len(words) <= 2 * self.min_words:
+            return True
+
+        if any(word in ANAPHORA_WORDS for word in words):
+            return True
+
+        if words and words[0] in LEADING_DEMONSTRATIVES:
+            return True
+
+        joined = f" {' '.join(words)} "
+        if any(f" {phrase} " in joined for phrase in ANAPHORA_PHRASES):
+            return True
+
+        if len(words) <= self.min_words:
+            return True
+
+        if self.scorer:
+            return self.scorer(query, history) >= self.threshold
+
+        return False
+
+
+    def stats(self) -> dict:
+        """
+        Devuelve cuantas consultas se han reescrito y cuantas se han saltado.
+        """
+        return {"rewritten": self.rewritten, "skipped": self.skipped}
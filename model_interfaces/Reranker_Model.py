@@ -0,0 +1,335 @@
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, List, Tuple
+
+from model_interfaces import Tracing
+from model_interfaces.Query_Cache import LRU_TTL_Cache, normalize_query
+
+
+
+class Reranker_Model(ABC):
+    """
+    Etapa de reranking. Las subclases solo implementan _score (puntuar pares ya recortados);
+    esta clase se encarga de recortar los chunks, agrupar en lotes, cachear puntuaciones por
+    (hash de la consulta, id del chunk), saltarse el modelo cuando las distancias densas ya deciden
+    y medir latencias para ajustar k frente a top_k.
+
+    Params:
+        model_name (str): Nombre del modelo
+        batch_size (int, optional): Pares por llamada al modelo. Por defecto 16.
+        max_length (int, optional): Tokens maximos por par (consulta + chunk). Por defecto 512.
+        cache_size (int, optional): Numero maximo de puntuaciones cacheadas. Por defecto 4096.
+        cache_ttl (float, optional): Segundos que dura una puntuacion cacheada. Por defecto 3600.
+        decisive_gap (float, optional): Si la distancia densa entre el ultimo documento que entra en top_k y el
+            siguiente supera este valor no se llama al modelo. Por defecto None (siempre se reordena).
+
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 batch_size: int = 16,
+                 max_length: int = 512,
+                 cache_size: int = 4096,
+                 cache_ttl: float = 3600,
+                 decisive_gap: float = None):
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.decisive_gap = decisive_gap
+        self.score_cache = LRU_TTL_Cache(cache_size, cache_ttl)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.pairs_scored = 0
+        self.candidates = 0
+        self.early_cutoffs = 0
+
+
+    @abstractmethod
+    def _score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """
+        Metodo abstracto que puntua un lote de pares (consulta, chunk). Mayor puntuacion = mas relevante.
+
+        Params:
+            pairs (List[Tuple[str, str]]): Pares ya recortados
+
+        """
+        pass
+
+
+    def _truncate(self, query: str, document: str) -> Tuple[str, str]:
+        """
+        Recorta el chunk para que el par quepa en max_length (aprox. 4 caracteres por token).
+        El tokenizador del modelo vuelve a recortar, pero asi no tokeniza textos de 1200 tokens para tirarlos.
+        """
+        if not self.max_length:
+            return query, document
+
+        max_chars = max(0, self.max_length * 4 - len(query))
+        return query, document[:max_chars]
+
+
+    def predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """
+        Puntua pares (consulta, chunk) en lotes de batch_size, sin cache. Compatible con CrossEncoder.predict.
+
+        Params:
+            pairs (List[Tuple[str, str]]): Pares a puntuar
+
+        """
+        pairs = [self._truncate(query, document) for query, document in pairs]
+
+        scores = []
+        with Tracing.span("rerank_model"):
+            for start in range(0, len(pairs), self.batch_size):
+                scores.extend(float(score) for score in self._score(pairs[start:start + self.batch_size]))
+
+        Tracing.count("rerank_pairs_total", len(pairs), model=self.model_name)
+
+        with self._lock:
+            self.pairs_scored += len(pairs)
+
+        return scores
+
+
+    def rank(self, query: str, documents: List[str], ids: List[str] = None, distances: List[float] = None, top_k: int = None) -> List[Tuple[int, float]]:
+        """
+        Ordena documentos por relevancia para una consulta.
+
+        Params:
+            query (str): Consulta
+            documents (List[str]): Documentos candidatos
+            ids (List[str], optional): Ids de los chunks, para cachear puntuaciones. Por defecto None (se usa un hash del texto).
+            distances (List[float], optional): Distancias densas de Chroma, para el corte temprano. Por defecto None.
+            top_k (int, optional): Documentos que se van a usar, para el corte temprano. Por defecto None.
+
+        Returns:
+            List[Tuple[int, float]]: (indice del documento, puntuacion) de mas a menos relevante
+        """
+        start = time.perf_counter()
+
+        if self._is_decisive(distances, top_k):
+            with self._lock:
+                self.calls += 1
+                self.candidates += len(documents)
+                self.early_cutoffs += 1
+                self._latencies.append(time.perf_counter() - start)
+
+            Tracing.count("rerank_early_cutoffs_total", model=self.model_name)
+
+            # Se mantiene el orden denso, la puntuacion es la distancia negada
+            return sorted(((i, -distance) for i, distance in enumerate(distances)), key=lambda x: x[1], reverse=True)
+
+        query_hash = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+        if ids is None:
+            ids = [hashlib.sha1(document.encode()).hexdigest() for document in documents]
+
+        scores = [self.score_cache.get((query_hash, chunk_id)) for chunk_id in ids]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        if missing:
+            new_scores = self.predict([(query, documents[i]) for i in missing])
+            for i, score in zip(missing, new_scores):
+                scores[i] = score
+                self.score_cache.put((query_hash, ids[i]), score)
+
+        with self._lock:
+            self.calls += 1
+            self.candidates += len(documents)
+            self._latencies.append(time.perf_counter() - start)
+
+        return sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
+
+
+    def _is_decisive(self, distances: List[float], top_k: int) -> bool:
+        """
+        Indica si las distancias densas ya separan claramente los top_k primeros del resto.
+        """
+        if self.decisive_gap is None or not distances or top_k is None or len(distances) <= top_k:
+            return False
+
+        if any(distance is None for distance in distances):
+            return False
+
+        ordered = sorted(distances)
+        return ordered[top_k] - ordered[top_k - 1] >= self.decisive_gap
+
+
+    def stats(self) -> dict:
+        """
+        Devuelve contadores y latencias (ms) del reranker.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls = self.calls
+
+            def percentile(p: float) -> float:
+                if not latencies:
+                    return 0.0
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+            return {
+                "calls": calls,
+                "pairs_scored": self.pairs_scored,
+                "avg_candidates": self.candidates / calls if calls else 0.0,
+                "early_cutoffs": self.early_cutoffs,
+                "score_cache": self.score_cache.stats(),
+                "latency_ms_p50": percentile(0.5),
+                "latency_ms_p95": percentile(0.95),
+            }
+
+
+class CrossEncoder_Reranker(Reranker_Model):
+    """
+    Reranker con un CrossEncoder de sentence_transformers (PyTorch).
+
+    Params:
+        model (Any): Nombre del modelo ("cross-encoder/ms-marco-MiniLM-L-6-v2") o un CrossEncoder ya cargado
+        **kwargs: Parametros de Reranker_Model
+
+    """
+
+    def __init__(self, model: Any = "cross-encoder/ms-marco-MiniLM-L-6-v2", **kwargs):
+
+        if isinstance(model, str):
+            from sentence_transformers import CrossEncoder
+
+            model_name = model
+            model = CrossEncoder(model_name, max_length=kwargs.get("max_length", 512))
+        else:
+            model_name = getattr(model, "model_name", None) or getattr(getattr(model, "config", None), "_name_or_path", type(model).__name__)
+
+        super().__init__(model_name, **kwargs)
+
+        self.model = model
+
+
+    def _score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+
+        return self.model.predict([list(pair) for pair in pairs])
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """
+    Exporta un cross-encoder de Hugging Face a ONNX y, opcionalmente, lo cuantiza a int8 (cuantizacion dinamica).
+    Solo hace falta PyTorch para exportar, no para servir.
+
+    Params:
+        model_name (str): Nombre del modelo en Hugging Face
+        output_dir (str): Directorio donde se guardan el modelo ONNX y el tokenizador
+        quantize (bool, optional): Si True genera ademas model_int8.onnx. Por defecto True.
+
+    Returns:
+        str: Ruta del modelo a servir
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, "model.onnx")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["query"], ["document"], return_tensors="pt")
+    # Mismo orden que los argumentos de forward() del modelo
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    with torch.no_grad():
+        torch.onnx.export(model,
+                          tuple(sample[name] for name in input_names),
+                          model_path,
+                          input_names=input_names,
+                          output_names=["logits"],
+                          dynamic_axes=dynamic_axes,
+                          opset_version=14)
+
+    if not quantize:
+        return model_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = os.path.join(output_dir, "model_int8.onnx")
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+
+    return quantized_path
+
+
+class ONNX_Reranker(Reranker_Model):
+    """
+    Reranker que ejecuta el cross-encoder con ONNX Runtime en CPU, por defecto cuantizado a int8.
+    La primera vez exporta el modelo (necesita PyTorch); despues solo usa onnxruntime y el tokenizador,
+    con menos latencia y memoria que CrossEncoder_Reranker.
+
+    Params:
+        model_name (str, optional): Nombre del modelo en Hugging Face. Por defecto "cross-encoder/ms-marco-MiniLM-L-6-v2".
+        onnx_dir (str, optional): Directorio donde se guardan los modelos exportados. Por defecto ".rag_cache/onnx".
+        quantize (bool, optional): Si True usa el modelo cuantizado a int8. Por defecto True.
+        num_threads (int, optional): Hilos de ONNX Runtime por inferencia. Por defecto None (los que elija ONNX Runtime).
+        activation (str, optional): "sigmoid" para devolver probabilidades, None para los logits como CrossEncoder. Por defecto None.
+        **kwargs: Parametros de Reranker_Model
+
+    """
+
+    def __init__(self,
+                 model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 onnx_dir: str = os.path.join(".rag_cache", "onnx"),
+                 quantize: bool = True,
+                 num_threads: int = None,
+                 activation: str = None,
+                 **kwargs):
+
+        super().__init__(model_name, **kwargs)
+
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.quantize = quantize
+        self.activation = activation
+
+        model_dir = os.path.join(onnx_dir, model_name.replace("/", "__"))
+        model_path = os.path.join(model_dir, "model_int8.onnx" if quantize else "model.onnx")
+
+        if not os.path.exists(model_path):
+            model_path = export_onnx(model_name, model_dir, quantize=quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._input_names = [node.name for node in self.session.get_inputs()]
+
+
+    def _score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+
+        encoded = self.tokenizer([query for query, _ in pairs],
+                                 [document for _, document in pairs],
+                                 padding=True,
+                                 truncation="longest_first",
+                                 max_length=self.max_length or 512,
+                                 return_tensors="np")
+
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        logits = self.session.run(None, feeds)[0]
+
+        scores = logits[:, 0] if logits.ndim == 2 else logits
+        if self.activation == "sigmoid":
+            scores = 1 / (1 + np.exp(-scores))
+
+        return scores.tolist()
@@ -1,9 +1,12 @@
 
+import asyncio
 import ollama
 
 from abc import ABC, abstractmethod
 from openai import OpenAI
 
+from model_interfaces import Tracing
+
 
 
 
@@ -52,6 +55,64 @@ class Text_Model(ABC):
             
         pass
 
+    async def generate_stream_async(self, prompt: str):
+        """
+        Version asincrona de generate_stream. Por defecto consume el stream sincrono en un hilo,
+        las subclases con cliente asincrono la sobreescriben.
+
+        Params:
+            prompt(str)
+
+        """
+        stream = await asyncio.to_thread(self.generate_stream, prompt)
+        end = object()
+
+        while True:
+            chunk = await asyncio.to_thread(next, stream, end)
+            if chunk is end:
+                break
+            yield chunk
+
+    async def enhance_query_async(self, query: str, memory: str) -> str:
+        """
+        Version asincrona de enhance_query. Por defecto ejecuta la version sincrona en un hilo.
+
+        Params:
+            query(str)
+            memory(str)
+
+        """
+        return await asyncio.to_thread(self.enhance_query, query, memory)
+
+    def _observe_response(self, response, task: str = "generate"):
+        """
+        Registra en las metricas los tokens y tiempos que devuelve el servidor en la respuesta final
+        (prompt_eval_count, eval_count, load_duration... en nanosegundos, formato de Ollama).
+
+        Params:
+            response(dict): Respuesta completa o ultimo chunk del stream
+            task(str): Etiqueta de la llamada ("generate", "enhance", "summarize")
+
+        """
+        Tracing.count("llm_requests_total", model=self.model_name, task=task)
+
+        for key, kind in (("prompt_eval_count", "prompt"), ("eval_count", "completion")):
+            if response.get(key):
+                Tracing.count("llm_tokens_total", response[key], model=self.model_name, task=task, kind=kind)
+
+        for key, stage in (("load_duration", "llm_load"), ("prompt_eval_duration", "llm_prompt_eval"), ("eval_duration", "llm_eval")):
+            if response.get(key):
+                Tracing.record(stage, response[key] / 1e9)
+
+    def _observe_stream(self, stream):
+        """
+        Devuelve los chunks del stream tal cual y registra las metricas del ultimo (done=True).
+        """
+        for chunk in stream:
+            if chunk.get('done'):
+                self._observe_response(chunk)
+            yield chunk
+
 
 class OpenAI_LLM(Text_Model):
 
@@ -114,10 +175,14 @@ class OpenAI_LLM(Text_Model):
 class Ollama_LLM(Text_Model):
 
     def __init__(self,
-                 model_name: str):
+                 model_name: str,
+                 host: str = None):
         
         super().__init__(model_name)
 
+        self.client = ollama.Client(host=host)
+        self.async_client = ollama.AsyncClient(host=host)
+
 
     def generate_stream(self, prompt: str):
         """
@@ -129,16 +194,36 @@ class Ollama_LLM(Text_Model):
 
         try:
         
-            stream = ollama.generate(
+            stream = self.client.generate(
                 model=self.model_name,
                 prompt= prompt,
                 stream=True
             )
 
-            return stream
+            return self._observe_stream(stream)
         
         except Exception as e:
             print(f"Error generating stream: {e}")
+
+
+    async def generate_stream_async(self, prompt: str):
+        """
+        Version asincrona de generate_stream usando el cliente asincrono de Ollama.
+        
+        Params:
+            prompt (str): Texto que se pasa al modelo como prompt para generar respuesta
+        """
+
+        stream = await self.async_client.generate(
+            model=self.model_name,
+            prompt= prompt,
+            stream=True
+        )
+
+        async for chunk in stream:
+            if chunk.get('done'):
+                self._observe_response(chunk)
+            yield chunk
         
 
     def get_full_response(self, stream, bool_print: bool = False)-> str:
@@ -160,17 +245,16 @@ class Ollama_LLM(Text_Model):
         return full_response
 
 
-    #Mejorar o cambiar por completo
-    def enhance_query(self, query:str, memory:str):
+    def _enhance_prompt(self, query: str, memory: str) -> str:
         """
-        Método para mejorar el input del usario anted de hacer la busqueda de vectores
-        
+        Construye el prompt para reescribir la consulta como pregunta independiente.
+
         Params:
             query(str): Input del usuario
             memory(str): Texto representativo del historial de conversacion del usuario
         """
 
-        prompt = f"""<s>[INST]
+        return f"""<s>[INST]
             You are a Query Rewriter assistant. Your task is to analyze a conversation history and a follow-up user query, and then generate a new, single, **standalone question**.
 
             The standalone question must be able to be understood and answered without needing the preceding conversation history. This ensures a more effective search in a vector database.
@@ -186,21 +270,80 @@ class Ollama_LLM(Text_Model):
             STANDALONE QUESTION:
             [/INST]"""
 
-        response = ollama.generate(
+
+    #Mejorar o cambiar por completo
+    def enhance_query(self, query:str, memory:str):
+        """
+        Método para mejorar el input del usario anted de hacer la busqueda de vectores
+        
+        Params:
+            query(str): Input del usuario
+            memory(str): Texto representativo del historial de conversacion del usuario
+        """
+
+        response = self.client.generate(
             model=self.model_name,
-            prompt=prompt,
+            prompt=self._enhance_prompt(query, memory),
         )
     
+        self._observe_response(response, task="enhance")
+
         enhanced_query = response['response']
 
-        print(f"\nENHANCED QUERY: {enhanced_query}\n\n{"-"*100}")
+        print(f"\nENHANCED QUERY: {enhanced_query}\n\n{'-'*100}")
                     
         return enhanced_query
-        
 
+
+    async def enhance_query_async(self, query: str, memory: str) -> str:
+        """
+        Version asincrona de enhance_query usando el cliente asincrono de Ollama.
+
+        Params:
+            query(str): Input del usuario
+            memory(str): Texto representativo del historial de conversacion del usuario
+        """
+
+        response = await self.async_client.generate(
+            model=self.model_name,
+            prompt=self._enhance_prompt(query, memory),
+        )
+
+        self._observe_response(response, task="enhance")
+
+        return response['response']
+
+
+    def summarize_history(self, summary: str, new_turns: str) -> str:
+        """
+        Método para resumir de forma incremental el historial de conversacion. Se usa como summarizer de ConversationMemory.
         
-        
-    
+        Params:
+            summary(str): Resumen acumulado hasta ahora (puede estar vacio)
+            new_turns(str): Turnos que salen del historial y hay que añadir al resumen
+        """
+
+        prompt = f"""<s>[INST]
+            You maintain a running summary of a conversation between a user and a document question-answering assistant.
+            Update the summary with the new turns. Keep the topics, documents, part numbers and identifiers that were discussed.
+            Be brief and factual. Return only the updated summary, without any extra commentary.
+
+            --- CURRENT SUMMARY ---
+            {summary}
+            --- END SUMMARY ---
+
+            --- NEW TURNS ---
+            {new_turns}
+            --- END NEW TURNS ---
+
+            UPDATED SUMMARY:
+            [/INST]"""
+
+        response = self.client.generate(
+            model=self.model_name,
+            prompt=prompt,
+        )
 
+        self._observe_response(response, task="summarize")
 
-        
\ No newline at end of file
+        return response['response']
@@ -0,0 +1,251 @@
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Tuple
+
+
+# Limites (segundos) de los histogramas: desde una consulta a la cache hasta una generacion larga del LLM
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_METRIC = "rag_stage_seconds"
+
+
+
+def _label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+
+    if not labels:
+        return ""
+
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics_Registry:
+    """
+    Contadores e histogramas del proceso, sin dependencias. render() los devuelve en el formato de texto
+    de Prometheus para el endpoint /metrics. Es seguro entre hilos.
+
+    Params:
+        buckets (Tuple[float], optional): Limites de los histogramas en segundos. Por defecto LATENCY_BUCKETS.
+
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+
+        self.buckets = tuple(sorted(buckets))
+
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+
+
+    def increment(self, name: str, value: float = 1.0, **labels):
+        """
+        Suma value a un contador.
+
+        Params:
+            name (str): Nombre de la metrica (p.ej. "rag_requests_total")
+            value (float, optional): Cantidad a sumar. Por defecto 1.
+            **labels: Etiquetas de la serie
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Añade una observacion (segundos) a un histograma.
+
+        Params:
+            name (str): Nombre de la metrica (p.ej. "rag_stage_seconds")
+            value (float): Valor observado
+            **labels: Etiquetas de la serie
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # [conteo por bucket..., suma, conteo total]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = [0] * len(self.buckets) + [0.0, 0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+
+    def snapshot(self) -> dict:
+        """
+        Devuelve el conteo, la media y la suma de cada serie de los histogramas, para /health o benchmarks.
+        """
+        with self._lock:
+            return {
+                name: {
+                    _format_labels(key) or "total": {
+                        "count": histogram[-1],
+                        "sum": round(histogram[-2], 6),
+                        "avg_ms": round(histogram[-2] / histogram[-1] * 1000, 2) if histogram[-1] else 0.0,
+                    }
+                    for key, histogram in series.items()
+                }
+                for name, series in self._histograms.items()
+            }
+
+
+    def render(self) -> str:
+        """
+        Devuelve todas las metricas en el formato de texto de Prometheus (version 0.0.4).
+        """
+        lines = []
+
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+            for name in sorted(self._histograms):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    for bound, count in zip(self.buckets, histogram):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram[-2])}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+
+    def reset(self):
+        """
+        Borra todas las series (para benchmarks).
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class Request_Trace:
+    """
+    Tiempos de una consulta por etapa. Las etapas que se repiten (p.ej. dos embeddings) se suman.
+    Se activa con activate() y los modelos registran sus etapas en la traza activa sin recibirla como parametro.
+    """
+
+    def __init__(self):
+
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+
+    def elapsed(self) -> float:
+        """
+        Segundos desde el inicio de la consulta.
+        """
+        return time.perf_counter() - self.start
+
+
+    def record(self, stage: str, seconds: float):
+
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+    def timings(self) -> Dict[str, float]:
+        """
+        Devuelve los tiempos de cada etapa en milisegundos, en el orden en que se registraron.
+        """
+        with self._lock:
+            return {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+
+
+METRICS = Metrics_Registry()
+
+_current_trace: ContextVar = ContextVar("rag_request_trace", default=None)
+
+
+def current_trace() -> Request_Trace:
+    """
+    Devuelve la traza activa en este contexto (hilo o tarea de asyncio), o None.
+    """
+    return _current_trace.get()
+
+
+@contextmanager
+def activate(trace: Request_Trace):
+    """
+    Activa una traza en el contexto actual. asyncio.create_task y asyncio.to_thread copian el contexto;
+    para un executor hay que pasar la llamada por contextvars.copy_context().run.
+
+    Params:
+        trace (Request_Trace): Traza de la consulta
+    """
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Un generador cerrado desde otro contexto: la variable ya no es de este contexto
+            pass
+
+
+def record(stage: str, seconds: float, trace: Request_Trace = None):
+    """
+    Registra la duracion de una etapa en el histograma rag_stage_seconds y en la traza de la consulta.
+
+    Params:
+        stage (str): Nombre de la etapa
+        seconds (float): Duracion
+        trace (Request_Trace, optional): Traza donde registrarla. Por defecto la activa, si la hay.
+    """
+    METRICS.observe(STAGE_METRIC, seconds, stage=stage)
+
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+@contextmanager
+def span(stage: str, trace: Request_Trace = None):
+    """
+    Mide el bloque como una etapa (ver record). Se registra aunque el bloque lance una excepcion.
+
+    Params:
+        stage (str): Nombre de la etapa
+        trace (Request_Trace, optional): Traza donde registrarla. Por defecto la activa, si la hay.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, trace)
+
+
+def count(name: str, value: float = 1.0, **labels):
+    """
+    Suma value al contador name del registro global.
+
+    Params:
+        name (str): Nombre de la metrica
+        value (float, optional): Cantidad a sumar. Por defecto 1.
+        **labels: Etiquetas de la serie
+    """
+    METRICS.increment(name, value, **labels)
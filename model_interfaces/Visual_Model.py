@@ -13,6 +13,16 @@ class Visual_Model(ABC):
     def image_to_text(self,image):
         pass
 
+    def caption_image(self, image_path: str) -> str:
+        """
+        Describe una imagen sin consulta, para indexar la descripcion al subir documentos.
+
+        Params:
+            image_path(str): Ruta de la imagen
+
+        """
+        return self.image_to_text([image_path])
+
 
 
 class Visual_Ollama(Visual_Model):
@@ -51,4 +61,33 @@ class Visual_Ollama(Visual_Model):
         except Exception as e:
             print(f"Error occured turning images to text: {e}")
 
+    def caption_image(self, image_path: str) -> str:
+
+        """
+        Describe una imagen de un documento tecnico (texto, cotas, tablas, piezas) para indexarla.
+        
+        Params:
+        image_path(str)
+        
+        """
+
+        try:
+
+            result = ollama.chat(
+
+                model= self.model_name,
+                messages=[
+                    {
+                        'role': "user",
+                        'content': 'Describe this image from a technical document. Transcribe any text, numbers, dimensions and table values it contains and name the parts or diagrams shown. ONLY RETURN INFORMATION CONTAINED IN THE IMAGE.',
+                        'images': [image_path]
+                    }
+                ]
+            )
+
+            return result['message']['content']
+        
+        except Exception as e:
+            print(f"Error occured captioning image {image_path}: {e}")
+
     
\ No newline at end of file
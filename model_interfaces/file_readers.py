@@ -1,30 +1,175 @@
 
 import os
+import base64
 import hashlib
-import glob
+import multiprocessing
+import pickle
+import re
+import pymupdf
 import pymupdf4llm
 
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from fnmatch import fnmatch
 from langchain_text_splitters import MarkdownTextSplitter
-from typing import Any, List
+from typing import Any, Iterable, Iterator, List, Tuple
 from PyPDF2 import PdfReader
 from docx import Document 
+from semantic_text_splitter import TextSplitter
 
 
 
-def read_pdf(file_path: str) -> str:
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf', '.docx', '.doc', '.md', '.rtf')
+
+IMAGE_DIR = "images"
+IMAGE_REFERENCE_PATTERN = re.compile(r"!\s*\[\]\s*\((images/[^)]+\.(?:png|jpe?g))\)")
+EMBEDDED_IMAGE_PATTERN = re.compile(r"!\[([^\]]*)\]\(data:image/(\w+);base64,([A-Za-z0-9+/=]+)\)")
+
+
+def is_supported_file(file_path: str) -> bool:
     """
-    Lee y extrae texto de archivos PDF.
+    Indica si la extension de un archivo esta soportada.
+
+    Params:
+        file_path (str): Ruta o nombre del archivo
+
+    """
+    return os.path.splitext(file_path)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def iter_pdf_pages(file_path: str, first_page: int = 1, last_page: int = None) -> Iterator[Tuple[int, str]]:
+    """
+    Lee un PDF pagina a pagina sin construir el texto completo del documento.
 
     Params:
         file_path (str): Ruta al archivo PDF
+        first_page (int, optional): Primera pagina a leer (empezando en 1). Por defecto 1.
+        last_page (int, optional): Ultima pagina a leer, incluida. Por defecto la ultima del documento.
 
+    Yields:
+        Tuple[int, str]: (numero de pagina empezando en 1, texto de la pagina)
     """
-    text = ""
+    with open(file_path, 'rb') as file:
+        reader = PdfReader(file)
+        last_page = min(last_page or len(reader.pages), len(reader.pages))
+
+        for number in range(first_page, last_page + 1):
+            yield number, reader.pages[number - 1].extract_text() or ""
+
+
+def hash_pdf_pages(file_path: str, include_images: bool = False) -> List[str]:
+    """
+    Hash de cada pagina de un PDF calculado sobre su content stream, sin extraer el texto (es mucho mas barato).
+
+    Params:
+        file_path (str): Ruta al archivo PDF
+        include_images (bool, optional): Si True incluye los datos de las imagenes de la pagina (el content stream solo
+            las referencia por nombre). Hace falta cuando las imagenes se exportan con el markdown. Por defecto False.
+
+    """
+    hashes = []
     with open(file_path, 'rb') as file:
         reader = PdfReader(file)
         for page in reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+            contents = page.get_contents()
+            # Segun la version de PyPDF2 una pagina con varios streams devuelve un ArrayObject
+            streams = contents if isinstance(contents, list) else [contents] if contents is not None else []
+
+            if include_images:
+                # Las paginas solo de texto no tienen /Resources o /XObject
+                resources = page.get("/Resources")
+                xobjects = resources.get_object().get("/XObject") if resources is not None else None
+                xobjects = xobjects.get_object() if xobjects is not None else {}
+                streams = streams + [xobjects[name] for name in sorted(xobjects)]
+
+            page_hash = hashlib.md5()
+            for stream in streams:
+                page_hash.update(stream.get_object().get_data())
+            hashes.append(page_hash.hexdigest()[:16])
+    return hashes
+
+
+def store_image(data: bytes, extension: str, image_dir: str = IMAGE_DIR) -> str:
+    """
+    Guarda una imagen con su hash de contenido como nombre, asi los logos y figuras repetidos en
+    varias paginas o documentos se guardan una sola vez. Si ya existe no se vuelve a escribir.
+
+    Params:
+        data (bytes): Contenido de la imagen
+        extension (str): Extension del archivo ("png", "jpeg")
+        image_dir (str, optional): Directorio de imagenes. Por defecto "images".
+
+    Returns:
+        str: Ruta de la imagen para referenciarla en el markdown ("images/<hash>.png")
+    """
+    name = f"{hashlib.sha1(data).hexdigest()[:16]}.{extension}"
+    path = os.path.join(image_dir, name)
+
+    if not os.path.exists(path):
+        os.makedirs(image_dir, exist_ok=True)
+        # Varios procesos pueden exportar la misma imagen a la vez: se escribe a un temporal y se renombra
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    return f"{image_dir}/{name}"
+
+
+def export_images(markdown: str, image_dir: str = IMAGE_DIR) -> str:
+    """
+    Sustituye las imagenes embebidas (base64) de un markdown por referencias a archivos guardados con store_image.
+
+    Params:
+        markdown (str): Markdown generado con embed_images=True
+        image_dir (str, optional): Directorio de imagenes. Por defecto "images".
+
+    """
+    def replace(match):
+        return f"![{match.group(1)}]({store_image(base64.b64decode(match.group(3)), match.group(2), image_dir)})"
+
+    return EMBEDDED_IMAGE_PATTERN.sub(replace, markdown)
+
+
+def iter_markdown_pages(file_path: str,
+                        first_page: int = 1,
+                        last_page: int = None,
+                        batch_pages: int = 8,
+                        image_dir: str = IMAGE_DIR) -> Iterator[Tuple[int, str]]:
+    """
+    Extrae un PDF como markdown con pymupdf4llm por lotes de paginas, para poder dividirlo segun van llegando
+    las paginas en lugar de esperar al documento entero. Las imagenes se piden embebidas y solo se escriben
+    a disco las que no estaban ya guardadas (store_image).
+
+    Params:
+        file_path (str): Ruta al archivo PDF
+        first_page (int, optional): Primera pagina a leer (empezando en 1). Por defecto 1.
+        last_page (int, optional): Ultima pagina a leer, incluida. Por defecto la ultima del documento.
+        batch_pages (int, optional): Paginas por llamada a pymupdf4llm. Por defecto 8.
+        image_dir (str, optional): Directorio de imagenes. Por defecto "images".
+
+    Yields:
+        Tuple[int, str]: (numero de pagina empezando en 1, markdown de la pagina)
+    """
+    with pymupdf.open(file_path) as doc:
+        last_page = min(last_page or doc.page_count, doc.page_count)
+
+        for start in range(first_page - 1, last_page, batch_pages):
+            batch = list(range(start, min(start + batch_pages, last_page)))
+
+            for page in pymupdf4llm.to_markdown(doc, pages=batch, page_chunks=True, embed_images=True):
+                yield page["metadata"]["page_number"], export_images(page["text"], image_dir)
+
+
+def read_pdf(file_path: str) -> str:
+    """
+    Lee y extrae texto de archivos PDF.
+
+    Params:
+        file_path (str): Ruta al archivo PDF
+
+    """
+    return "".join(text + "\n" for _, text in iter_pdf_pages(file_path))
 
 #Rendundante
 def read_docx(file_path: str) -> str:
@@ -57,102 +202,609 @@ def read_txt(file_path: str ) -> str:
     return text
 
 
-def expand_directories(file_paths: List[str]) -> List[str]:
+def matches_patterns(relative_path: str, patterns: Iterable[str]) -> bool:
+    """
+    Indica si una ruta coincide con algun patron glob (fnmatch), comparando la ruta relativa a la raiz
+    (con "/" como separador) y el nombre del archivo o directorio.
+
+    Params:
+        relative_path (str): Ruta relativa a la raiz
+        patterns (Iterable[str]): Patrones, p.ej. "*.pdf", "borradores/*", "~$*"
+
     """
-    Expande directorios en una lista de archivos soportados y filtra por extensiones válidas.
+    relative_path = relative_path.replace(os.sep, "/")
+    name = relative_path.rsplit("/", 1)[-1]
+    return any(fnmatch(relative_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def scan_documents(file_paths: List[str],
+                   include: List[str] = None,
+                   exclude: List[str] = None) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Recorre archivos y directorios (de forma recursiva) en una sola pasada con os.scandir y devuelve los
+    documentos soportados a medida que los encuentra, junto con su stat para compararlo con el manifest
+    sin otra llamada al sistema de archivos (en Windows y shares de red el stat viene con el listado).
 
     Params:
         file_paths (List[str]): Lista de rutas que pueden incluir archivos y directorios
+        include (List[str], optional): Si se da, solo se devuelven archivos que coinciden con algun patron. Por defecto None.
+        exclude (List[str], optional): Patrones de archivos y directorios a ignorar (un directorio excluido no se recorre). Por defecto None.
 
+    Yields:
+        Tuple[str, os.stat_result]: (ruta, stat) de cada documento
     """
-    supported_extensions = ['.txt', '.pdf', '.docx', '.doc', '.md', '.rtf']
-    expanded_paths = []
-    
+    exclude = exclude or []
+
     for path in file_paths:
         if os.path.isdir(path):
-            for ext in supported_extensions:
-                pattern = os.path.join(path, f"*{ext}")
-                expanded_paths.extend(glob.glob(pattern))
-                pattern_upper = os.path.join(path, f"*{ext.upper()}")
-                expanded_paths.extend(glob.glob(pattern_upper))
+            stack = [path]
+
+            while stack:
+                directory = stack.pop()
+                try:
+                    with os.scandir(directory) as listing:
+                        entries = sorted(listing, key=lambda entry: entry.name)
+                except OSError as e:
+                    print(f"Skipping unreadable directory {directory}: {e}")
+                    continue
+
+                subdirectories = []
+                for entry in entries:
+                    relative_path = os.path.relpath(entry.path, path)
+
+                    if exclude and matches_patterns(relative_path, exclude):
+                        continue
+
+                    # Igual que os.walk no se siguen los enlaces simbolicos a directorios (evita ciclos)
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+
+                    elif entry.is_file() and is_supported_file(entry.name):
+                        if include and not matches_patterns(relative_path, include):
+                            continue
+                        yield entry.path, entry.stat()
+
+                stack.extend(reversed(subdirectories))
 
         elif os.path.isfile(path):
-            file_ext = os.path.splitext(path)[1].lower()
-            if file_ext in supported_extensions:
-                expanded_paths.append(path)
-            else:
+            if not is_supported_file(path):
                 print(f"Skipping unsupported file type: {path}")
+                continue
+
+            # Un archivo dado directamente solo se compara por nombre
+            name = os.path.basename(path)
+            if (exclude and matches_patterns(name, exclude)) or (include and not matches_patterns(name, include)):
+                continue
+            yield path, os.stat(path)
+
         else:
             print(f"Path not found: {path}")
-    
-    
-    expanded_paths = sorted(list(set(expanded_paths)))
-    return expanded_paths
 
 
-def smart_doc_processing(text_splitter: Any, file_path: str) -> str:
+def expand_directories(file_paths: List[str], include: List[str] = None, exclude: List[str] = None) -> List[str]:
     """
-    Función ayudante para preparar chunks de un archivo (PDF, DOCX, DOC, TXT, MD, RTF) 
-    para la base de datos de Chroma.
+    Expande directorios (de forma recursiva) en una lista de archivos soportados y filtra por extensiones válidas.
 
     Params:
-        text_splitter (TextSplitter): Divisor de texto para crear chunks
-        file_path (str): Ruta al archivo a procesar
+        file_paths (List[str]): Lista de rutas que pueden incluir archivos y directorios
+        include (List[str], optional): Patrones de archivos a incluir. Por defecto todos.
+        exclude (List[str], optional): Patrones de archivos y directorios a ignorar. Por defecto ninguno.
 
     """
-    chunks = []
+    return sorted({path for path, _ in scan_documents(file_paths, include, exclude)})
 
-    try:
 
-        #Alomejor cambiar para usar una clase unifica para tokenizador en vez usar if statements pero por ahora sirve
+def hash_file_content(file_path: str, block_size: int = 1 << 20) -> str:
+    """
+    Calcula el hash MD5 del contenido de un archivo leyendo por bloques.
 
-        if text_splitter is MarkdownTextSplitter:
-  
-            document= pymupdf4llm.to_markdown(file_path,write_images= True, image_path= "images")
+    Params:
+        file_path (str): Ruta al archivo
+        block_size (int, optional): Tamaño de bloque de lectura en bytes. Por defecto 1MB.
 
-            raw_chunks = text_splitter.create_documents([document])
+    """
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
 
-            for raw_chunk in raw_chunks:
-                chunks.append(raw_chunk.page_content)
 
-        else: 
+def hash_chunk(chunk: str) -> str:
+    """
+    Hash corto del contenido de un chunk, usado como parte de su id en la vdb.
 
-            file_ext = os.path.splitext(file_path)[1].lower()
+    Params:
+        chunk (str): Texto del chunk
 
-            if file_ext == '.pdf':
-                document = read_pdf(file_path)
-            #Remover despues
-            elif file_ext in ['.docx', '.doc']:
-                document = read_docx(file_path)
-            elif file_ext in ['.txt', '.md', '.rtf']:
-                document = read_txt(file_path)
+    """
+    return hashlib.md5(chunk.encode()).hexdigest()[:16]
+
+
+def source_id_for(file_path: str) -> str:
+    """
+    Hash identificador de la ruta de un documento (8 caracteres).
+
+    Params:
+        file_path (str): Ruta al archivo
+
+    """
+    return hashlib.md5(file_path.encode()).hexdigest()[:8]
+
+
+def is_markdown_splitter(text_splitter: Any) -> bool:
+    """
+    Indica si el divisor de texto trabaja sobre markdown (extraccion con pymupdf4llm).
+
+    Params:
+        text_splitter (Any): Divisor de texto
+
+    """
+    return isinstance(text_splitter, MarkdownTextSplitter)
+
+
+class Text_Splitter_Spec:
+    """
+    Divisor de semantic_text_splitter que se puede enviar a los procesos del pool. TextSplitter no se puede
+    serializar, asi que solo se guarda como construirlo (capacity, overlap y modelo de tiktoken) y cada proceso
+    crea el suyo la primera vez que lo usa. Con el, la lectura y el chunking se hacen enteros en el pool.
+
+    Params:
+        capacity (int): Tamaño maximo de cada chunk (tokens si hay model, caracteres si no)
+        overlap (int, optional): Solapamiento entre chunks. Por defecto 0.
+        model (str, optional): Modelo de tiktoken para contar tokens (p.ej. "gpt-3.5-turbo"). Por defecto None.
+
+    """
+
+    def __init__(self, capacity: int, overlap: int = 0, model: str = None):
+
+        self.capacity = capacity
+        self.overlap = overlap
+        self.model = model
+        self._splitter = None
+
+
+    def chunks(self, text: str) -> List[str]:
+
+        if self._splitter is None:
+            if self.model:
+                self._splitter = TextSplitter.from_tiktoken_model(self.model, capacity=self.capacity, overlap=self.overlap)
             else:
-                raise ValueError(f"Unsupported file type: {file_ext}")
+                self._splitter = TextSplitter(self.capacity, self.overlap)
+
+        return self._splitter.chunks(text)
+
+
+    def __getstate__(self) -> dict:
+
+        return {**self.__dict__, "_splitter": None}
+
+
+def read_document(file_path: str, markdown: bool = False) -> str:
+    """
+    Lee el texto completo de un archivo soportado. Es la parte costosa en CPU del procesamiento.
+
+    Params:
+        file_path (str): Ruta al archivo
+        markdown (bool, optional): Si True extrae el documento como markdown con pymupdf4llm. Por defecto False.
+
+    """
+    if markdown:
+        return export_images(pymupdf4llm.to_markdown(file_path, embed_images=True))
+
+    file_ext = os.path.splitext(file_path)[1].lower()
+
+    if file_ext == '.pdf':
+        return read_pdf(file_path)
+    #Remover despues
+    elif file_ext in ['.docx', '.doc']:
+        return read_docx(file_path)
+    elif file_ext in ['.txt', '.md', '.rtf']:
+        return read_txt(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_ext}")
+
+
+def split_document(text_splitter: Any, document: str) -> List[str]:
+    """
+    Divide el texto de un documento en chunks con el divisor dado.
+
+    Params:
+        text_splitter (Any): Divisor de texto
+        document (str): Texto del documento
+
+    """
+    #Alomejor cambiar para usar una clase unifica para tokenizador en vez usar if statements pero por ahora sirve
+
+    if is_markdown_splitter(text_splitter):
+        return [raw_chunk.page_content for raw_chunk in text_splitter.create_documents([document])]
+
+    return text_splitter.chunks(document)
+
+
+def _locate_chunks(buffer: str, chunks: List[str]) -> List[int]:
+    """
+    Devuelve la posicion de cada chunk dentro del texto del que sale, o None si el divisor ha modificado el texto.
+    """
+    offsets = []
+    search = 0
+    for chunk in chunks:
+        start = buffer.find(chunk, search)
+        if start < 0:
+            return None
+        offsets.append(start)
+        search = start + 1
+    return offsets
+
+
+def chunk_pages(text_splitter: Any, pages: Iterable[Tuple[int, str]], window_pages: int = 4) -> Iterator[Tuple[str, int, int]]:
+    """
+    Divide un documento en chunks de forma incremental a partir de sus paginas. Se trabaja sobre una ventana
+    de window_pages paginas: se emiten todos los chunks menos el ultimo, que puede estar cortado por el final de
+    la ventana, y el texto desde el inicio de ese chunk pasa a la siguiente ventana. Asi el solapamiento del
+    divisor se mantiene entre paginas y la memoria depende del tamaño de la ventana, no del documento.
+
+    Params:
+        text_splitter (Any): Divisor de texto
+        pages (Iterable[Tuple[int, str]]): (numero de pagina, texto) en orden, p.ej. iter_pdf_pages
+        window_pages (int, optional): Paginas nuevas que se añaden antes de cada division. Por defecto 4.
+
+    Yields:
+        Tuple[str, int, int]: (chunk, primera pagina, ultima pagina)
+    """
+    buffer = ""
+    offsets = []    # posicion en buffer donde empieza cada pagina
+    numbers = []    # numero de cada pagina
+    n_new = 0
+
+    def page_at(position: int) -> int:
+        return numbers[max(0, bisect_right(offsets, position) - 1)]
+
+    def split(final: bool):
+        chunks = split_document(text_splitter, buffer)
+        starts = _locate_chunks(buffer, chunks)
+
+        if starts is None:
+            # El divisor no devuelve subcadenas del texto: se emite la ventana entera con su rango de paginas
+            return [(chunk, numbers[0], numbers[-1]) for chunk in chunks], len(buffer)
+
+        if final or not chunks:
+            keep = len(chunks)
+            carry_start = len(buffer)
+        else:
+            keep = len(chunks) - 1
+            carry_start = starts[-1]
+
+        emitted = [(chunk, page_at(start), page_at(start + max(len(chunk) - 1, 0))) for chunk, start in zip(chunks[:keep], starts)]
+        return emitted, carry_start
+
+    for number, text in pages:
+        offsets.append(len(buffer))
+        numbers.append(number)
+        buffer += text + "\n"
+        n_new += 1
+
+        if n_new < window_pages:
+            continue
+        n_new = 0
+
+        emitted, carry_start = split(final=False)
+        yield from emitted
+
+        # El texto que pasa a la siguiente ventana conserva la pagina en la que empieza
+        first = max(0, bisect_right(offsets, carry_start) - 1)
+        offsets = [0] + [offset - carry_start for offset in offsets[first + 1:]]
+        numbers = numbers[first:]
+        buffer = buffer[carry_start:]
+
+    if buffer.strip():
+        emitted, _ = split(final=True)
+        yield from emitted
+
+
+def is_paged_pdf(file_path: str) -> bool:
+    """
+    Indica si un archivo se lee y divide por paginas (PDF, con o sin extraccion markdown).
+
+    Params:
+        file_path (str): Ruta al archivo
+
+    """
+    return os.path.splitext(file_path)[1].lower() == '.pdf'
+
+
+def iter_document_pages(file_path: str, markdown: bool, page_range: Tuple[int, int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Paginas de un PDF como texto plano (iter_pdf_pages) o como markdown (iter_markdown_pages).
+
+    Params:
+        file_path (str): Ruta al archivo PDF
+        markdown (bool): Si True extrae markdown con pymupdf4llm
+        page_range (Tuple[int, int], optional): Primera y ultima pagina a leer. Por defecto todo el documento.
+
+    """
+    first_page, last_page = page_range or (1, None)
+
+    if markdown:
+        return iter_markdown_pages(file_path, first_page, last_page)
+
+    return iter_pdf_pages(file_path, first_page, last_page)
+
+
+def chunk_document(text_splitter: Any, file_path: str, page_range: Tuple[int, int] = None):
+    """
+    Lee y divide un archivo. Los PDF se leen y dividen por paginas con chunk_pages.
+
+    Params:
+        text_splitter (Any): Divisor de texto
+        file_path (str): Ruta al archivo
+        page_range (Tuple[int, int], optional): Solo para PDF, primera y ultima pagina a procesar. Por defecto todo el documento.
+
+    Returns:
+        Tuple[List[str], List[Tuple[int, int]]]: (chunks, (primera, ultima) pagina de cada chunk o None si no aplica)
+    """
+    markdown = is_markdown_splitter(text_splitter)
+
+    if is_paged_pdf(file_path):
+        return _collect_page_chunks(chunk_pages(text_splitter, iter_document_pages(file_path, markdown, page_range)))
+
+    return split_document(text_splitter, read_document(file_path, markdown=markdown)), None
+
+
+def _collect_page_chunks(page_chunks: Iterator[Tuple[str, int, int]]):
+
+    chunks = []
+    pages = []
+    for chunk, first, last in page_chunks:
+        chunks.append(chunk)
+        pages.append((first, last))
+    return chunks, pages
+
+
+def build_chunk_documents(chunks: List[str], file_path: str, file_hash: str, pages: List[Tuple[int, int]] = None):
+    """
+    Construye los documentos (contenido y metadata) y los ids de la vdb para los chunks de un archivo.
+
+    Params:
+        chunks (List[str]): Chunks del archivo
+        file_path (str): Ruta al archivo
+        file_hash (str): Hash del contenido del archivo
+        pages (List[Tuple[int, int]], optional): Primera y ultima pagina de cada chunk. Por defecto None.
+
+    """
+    source_id = source_id_for(file_path) # Hash identificador para cada documento
+
+    documents = []
+    ids = []
+    seen = {}
+    for i, chunk in enumerate(chunks, 1):
+        chunk_hash = hash_chunk(chunk)
+
+        # Los ids dependen del contenido, un chunk repetido dentro del mismo archivo lleva sufijo
+        n = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = n + 1
+        chunk_key = chunk_hash if n == 0 else f"{chunk_hash}-{n}"
+
+        document = {
+            "content": chunk,
+            "metadata": {
+                "source": file_path,
+                "source_id": source_id,
+                "file_hash": file_hash,
+                "chunk_hash": chunk_hash,
+                "chunk_id": i
+            }
+        }
 
-            chunks = text_splitter.chunks(document)
+        if pages is not None:
+            document["metadata"]["page"], document["metadata"]["page_end"] = pages[i - 1]
 
-        file_hash = hashlib.md5(file_path.encode()).hexdigest()[:8] # Hash identificador para cada documento
+        documents.append(document)
+        ids.append(f"{source_id}_{chunk_key}")
+
+    return documents, ids
+
+
+def build_caption_documents(documents: List[dict], ids: List[str], captions: dict):
+    """
+    Construye un chunk por cada imagen con descripcion, enlazado al primer chunk del archivo que la referencia.
+    El chunk lleva la referencia a la imagen y su descripcion, asi se puede recuperar por su contenido y el
+    frontend sigue recibiendo la imagen. Copia la metadata del padre (fuente, paginas) para que se borre y
+    actualice junto con el.
+
+    Params:
+        documents (List[dict]): Documentos del archivo (build_chunk_documents)
+        ids (List[str]): Ids de esos documentos
+        captions (dict): Descripcion de cada imagen ("images/<hash>.png")
+
+    """
+    caption_documents = []
+    caption_ids = []
+    seen = set()
 
-        documents = []
-        ids = []
-        for i, chunk in enumerate(chunks, 1):
-            document = {
-                "content": chunk,
+    for document, parent_id in zip(documents, ids):
+        for image in IMAGE_REFERENCE_PATTERN.findall(document["content"]):
+            if image in seen or not captions.get(image):
+                continue
+            seen.add(image)
+
+            content = f"![]({image})\n{captions[image]}"
+            chunk_hash = hash_chunk(content)
+
+            caption_documents.append({
+                "content": content,
                 "metadata": {
-                    "source": file_path,
-                    "file_hash": file_hash,
-                    "chunk_id": i
+                    **document["metadata"],
+                    "chunk_hash": chunk_hash,
+                    "type": "image_caption",
+                    "image": image,
+                    "parent_id": parent_id
                 }
-            }
+            })
+            caption_ids.append(f"{document['metadata']['source_id']}_{chunk_hash}")
+
+    return caption_documents, caption_ids
+
+
+def smart_doc_processing(text_splitter: Any, file_path: str, file_hash: str = None, page_range: Tuple[int, int] = None) -> str:
+    """
+    Función ayudante para preparar chunks de un archivo (PDF, DOCX, DOC, TXT, MD, RTF) 
+    para la base de datos de Chroma.
+
+    Params:
+        text_splitter (TextSplitter): Divisor de texto para crear chunks
+        file_path (str): Ruta al archivo a procesar
+        file_hash (str, optional): Hash del contenido del archivo si ya se ha calculado. Por defecto None.
+        page_range (Tuple[int, int], optional): Solo para PDF, rango de paginas a procesar. Por defecto todo el documento.
+
+    """
+    try:
 
-            documents.append(document)
-            ids.append(f"{file_hash}_{i}")
+        chunks, pages = chunk_document(text_splitter, file_path, page_range=page_range)
 
-        return documents, ids
+        if file_hash is None:
+            file_hash = hash_file_content(file_path)
+
+        return build_chunk_documents(chunks, file_path, file_hash, pages=pages)
 
     except Exception as e:
         print(f"Error creating chunks for file: {e}")
         return None, None
+
+
+_worker_text_splitter = None
+
+
+def _init_worker(text_splitter: Any):
+    """
+    Inicializador de los procesos del pool: guarda el divisor de texto una sola vez por proceso.
+    """
+    global _worker_text_splitter
+    _worker_text_splitter = text_splitter
+
+
+def _process_in_worker(file_path: str, file_hash: str, page_range: Tuple[int, int] = None):
+    """
+    Tarea del pool cuando el divisor se puede serializar: lectura y chunking completos en el proceso hijo.
+    """
+    return smart_doc_processing(_worker_text_splitter, file_path, file_hash=file_hash, page_range=page_range)
+
+
+def _read_in_worker(file_path: str, markdown: bool):
+    """
+    Tarea del pool cuando el divisor no se puede serializar: solo la lectura, el chunking se hace en el proceso principal.
+    """
+    try:
+        return read_document(file_path, markdown=markdown)
+
+    except Exception as e:
+        print(f"Error creating chunks for file: {e}")
+        return None
+
+
+def parallel_doc_processing(text_splitter: Any,
+                            jobs: List[Tuple[str, str]],
+                            max_workers: int = None,
+                            max_pending: int = None) -> Iterator[Tuple[str, Any, Any]]:
+    """
+    Procesa archivos en un pool de procesos y devuelve los resultados segun van terminando.
+    Como mucho hay max_pending archivos enviados al pool a la vez, asi que si el consumidor va lento
+    (p.ej. generando embeddings) el pool deja de leer archivos nuevos.
+
+    Con un divisor serializable (MarkdownTextSplitter o Text_Splitter_Spec) cada proceso lee y divide el archivo
+    entero. Un divisor que no se puede serializar (p.ej. un TextSplitter directamente) solo lee en el pool y
+    el chunking se hace en el proceso principal. En ese caso los PDF no pasan por el pool: se leen y dividen por
+    paginas en el proceso principal con chunk_pages, asi la memoria sigue dependiendo de la ventana de paginas y no
+    del documento entero.
+
+    Los procesos se crean con spawn y no con fork: el pool se abre con los hilos del pipeline, del watcher
+    o del servidor ya en marcha, y un fork puede copiar un lock cogido por otro hilo y bloquear al hijo.
+
+    Params:
+        text_splitter (Any): Divisor de texto
+        jobs (List[Tuple[str, str, Tuple[int, int]]]): Lista de (ruta, hash de contenido, rango de paginas o None) a procesar
+        max_workers (int, optional): Numero de procesos. Por defecto os.cpu_count().
+        max_pending (int, optional): Numero maximo de archivos en vuelo. Por defecto 2 * max_workers.
+
+    Yields:
+        Tuple[str, list, list]: (ruta, documentos, ids). Documentos e ids son None si el archivo falla.
+
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+
+    try:
+        pickle.dumps(text_splitter)
+        picklable = True
+    except Exception:
+        picklable = False
+
+    markdown = is_markdown_splitter(text_splitter)
+    initargs = (text_splitter,) if picklable else (None,)
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=initargs) as pool:
+
+        job_iter = iter(jobs)
+        pending = {}
+        local_jobs = []
+
+        def submit_next() -> bool:
+            try:
+                file_path, file_hash, page_range = next(job_iter)
+            except StopIteration:
+                return False
+
+            if picklable:
+                future = pool.submit(_process_in_worker, file_path, file_hash, page_range)
+            elif is_paged_pdf(file_path):
+                local_jobs.append((file_path, file_hash, page_range))
+                return True
+            else:
+                future = pool.submit(_read_in_worker, file_path, markdown)
+            pending[future] = (file_path, file_hash)
+            return True
+
+        while len(pending) + len(local_jobs) < max_pending and submit_next():
+            pass
+
+        while pending or local_jobs:
+            if local_jobs:
+                # Se divide mientras el pool sigue leyendo los demas archivos
+                file_path, file_hash, page_range = local_jobs.pop(0)
+                documents, ids = smart_doc_processing(text_splitter, file_path, file_hash=file_hash, page_range=page_range)
+                submit_next()
+
+                yield file_path, documents, ids
+                continue
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                file_path, file_hash = pending.pop(future)
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error creating chunks for file: {e}")
+                    result = None if not picklable else (None, None)
+
+                if picklable:
+                    documents, ids = result
+                elif result is None:
+                    documents, ids = None, None
+                else:
+                    try:
+                        documents, ids = build_chunk_documents(split_document(text_splitter, result), file_path, file_hash)
+                    except Exception as e:
+                        print(f"Error creating chunks for file: {e}")
+                        documents, ids = None, None
+
+                submit_next()
+
+                yield file_path, documents, ids
     
     
 
@@ -17,6 +17,19 @@ function App() {
     const chatFeedRef = useRef(null); 
     const [darkMode, setDarkMode] = useState(false);
 
+    // Per-tab session id so the backend keeps a separate conversation memory for each user
+    const sessionIdRef = useRef(null);
+    if (sessionIdRef.current === null) {
+        let storedId = sessionStorage.getItem("ragSessionId");
+        if (!storedId) {
+            storedId = (window.crypto && window.crypto.randomUUID)
+                ? window.crypto.randomUUID()
+                : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+            sessionStorage.setItem("ragSessionId", storedId);
+        }
+        sessionIdRef.current = storedId;
+    }
+
     // Load saved theme preference
     useEffect(() => {
         const savedMode = localStorage.getItem("darkMode") === "true";
@@ -45,7 +58,7 @@ function App() {
             const response = await fetch(`${BACKEND_URL}/query/stream`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ query: question }),
+                body: JSON.stringify({ query: question, session_id: sessionIdRef.current }),
             });
 
             if (!response.ok) {
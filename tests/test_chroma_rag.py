@@ -0,0 +1,29 @@
+import numpy as np
+
+from model_interfaces.Chroma_RAG import Chroma_RAG
+from model_interfaces.ConversationMemory import Session_Memory_Store
+from model_interfaces.Embedding_Model import Embedding_Model
+
+
+
+class Fake_Embedding(Embedding_Model):
+
+    def __init__(self):
+
+        super().__init__("fake-embedding")
+
+
+    def generate_embeddings(self, texts):
+
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+
+def test_empty_memory_store_is_kept(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    store = Session_Memory_Store(max_tokens=1500)
+    assert len(store) == 0
+
+    rag = Chroma_RAG(embedding_model=Fake_Embedding(), text_splitter=None, keep_memory=True, memory_store=store)
+
+    assert rag.memory_store is store
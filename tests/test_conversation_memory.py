@@ -0,0 +1,48 @@
+import threading
+import time
+
+from model_interfaces.ConversationMemory import ConversationMemory, Session_Memory_Store
+
+
+
+def test_summary_runs_off_the_request_path():
+
+    release = threading.Event()
+    calls = []
+
+    def slow_summarizer(previous, text):
+        calls.append((previous, text))
+        release.wait(5)
+        return f"summary {len(calls)}"
+
+    store = Session_Memory_Store(max_history=2, max_tokens=1000, summarizer=slow_summarizer)
+    memory = store.get("session")
+
+    memory.add_message("user", "first question")
+    memory.add_message("system", "first answer")
+
+    start = time.perf_counter()
+    memory.add_message("user", "second question")
+    assert time.perf_counter() - start < 1
+
+    # Mientras se resume se mantiene el resumen anterior y los turnos pendientes siguen en el historial
+    assert memory.summary == ""
+    assert [message["content"] for message in memory.get_full_history()] == ["first question", "first answer", "second question"]
+
+    release.set()
+    memory.wait_for_summary(5)
+
+    assert memory.summary == "summary 1"
+    assert calls == [("", "User: first question")]
+    assert [message["role"] for message in memory.get_full_history()] == ["summary", "system", "user"]
+
+
+def test_summary_inline_without_executor():
+
+    memory = ConversationMemory(max_history=1, max_tokens=1000, summarizer=lambda previous, text: previous + text)
+
+    memory.add_message("user", "hello")
+    memory.add_message("system", "hi")
+
+    assert memory.summary == "User: hello"
+    assert memory.get_full_history()[0] == {"role": "summary", "content": "User: hello"}
@@ -0,0 +1,42 @@
+import numpy as np
+
+from model_interfaces.Embedding_Cache import Cached_Embedding, text_key
+from model_interfaces.Embedding_Model import Embedding_Model
+
+
+
+class Fake_Embedding(Embedding_Model):
+
+    def __init__(self):
+
+        super().__init__("fake-embedding")
+
+
+    def generate_embeddings(self, texts):
+
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+
+def test_restoring_a_key_does_not_grow_the_size(tmp_path):
+
+    cache = Cached_Embedding(Fake_Embedding(), cache_path=str(tmp_path / "embeddings.sqlite"))
+    vectors = {text_key("drill feed"): np.ones(8, dtype=np.float32)}
+
+    cache._store(vectors)
+    cache._store(vectors)
+
+    assert cache.stats()["bytes"] == 32
+
+
+def test_eviction_keeps_size_under_limit(tmp_path):
+
+    cache = Cached_Embedding(Fake_Embedding(), cache_path=str(tmp_path / "embeddings.sqlite"), max_bytes=100)
+
+    cache.generate_embeddings([f"text {i}" for i in range(3)])
+    cache.generate_embeddings([f"text {i}" for i in range(3)])
+    cache.generate_embeddings(["text 3"])
+
+    stored = cache._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+    # 4 vectores de 32 bytes superan los 100: se baja al 90% borrando los dos usados hace mas tiempo
+    assert stored == cache.stats()["bytes"] == 64
+    assert cache.stats()["evictions"] == 2
@@ -0,0 +1,90 @@
+import pickle
+
+import pymupdf
+
+from semantic_text_splitter import TextSplitter
+
+from model_interfaces.file_readers import Text_Splitter_Spec, hash_pdf_pages, parallel_doc_processing
+
+
+
+PNG = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 4, 4), False).tobytes("png")
+
+
+def write_pdf(path, with_image: bool = False, text: str = "Maximum feed 0.12 mm/rev"):
+
+    document = pymupdf.open()
+    page = document.new_page()
+    page.insert_text((72, 72), text)
+    if with_image:
+        page.insert_image(pymupdf.Rect(72, 100, 172, 200), stream=PNG)
+    document.save(path)
+    document.close()
+    return str(path)
+
+
+def write_paged_pdf(path, n_pages: int = 3):
+
+    document = pymupdf.open()
+    for number in range(1, n_pages + 1):
+        document.new_page().insert_text((72, 72), f"Page {number} maximum feed {number} mm/rev")
+    document.save(path)
+    document.close()
+    return str(path)
+
+
+def test_hash_text_only_pdf_with_images(tmp_path):
+
+    path = write_pdf(tmp_path / "text.pdf")
+
+    hashes = hash_pdf_pages(path, include_images=True)
+
+    assert len(hashes) == 1
+    assert hashes == hash_pdf_pages(path, include_images=True)
+
+
+def test_hash_pdf_with_image_changes_with_image(tmp_path):
+
+    plain = write_pdf(tmp_path / "plain.pdf")
+    with_image = write_pdf(tmp_path / "image.pdf", with_image=True)
+
+    assert len(hash_pdf_pages(with_image, include_images=True)) == 1
+    assert hash_pdf_pages(with_image, include_images=True) != hash_pdf_pages(plain, include_images=True)
+
+
+def test_text_splitter_spec_pickles_and_matches_text_splitter():
+
+    text = "Drill the titanium panel at low spindle speed with coolant. " * 200
+    spec = Text_Splitter_Spec(200, 20, model="gpt-3.5-turbo")
+    spec.chunks("warm up")
+
+    restored = pickle.loads(pickle.dumps(spec))
+
+    assert restored.chunks(text) == TextSplitter.from_tiktoken_model("gpt-3.5-turbo", capacity=200, overlap=20).chunks(text)
+
+
+def test_parallel_processing_chunks_pdf_pages_in_workers(tmp_path):
+
+    path = write_paged_pdf(tmp_path / "paged.pdf")
+
+    results = list(parallel_doc_processing(Text_Splitter_Spec(1000), [(path, "hash", None)], max_workers=1))
+
+    [(result_path, documents, ids)] = results
+    assert result_path == path
+    assert documents and len(documents) == len(ids)
+    assert documents[0]["metadata"]["page"] == 1 and documents[-1]["metadata"]["page_end"] == 3
+
+
+def test_parallel_processing_unpicklable_splitter_chunks_pdf_by_pages(tmp_path):
+
+    pdf = write_paged_pdf(tmp_path / "paged.pdf")
+
+    txt = tmp_path / "notes.txt"
+    txt.write_text("Countersink depth 0.4 mm for CFRP laminate.", encoding="utf-8")
+
+    results = {path: (documents, ids) for path, documents, ids in
+               parallel_doc_processing(TextSplitter(1000), [(pdf, "a", None), (str(txt), "b", None)], max_workers=1)}
+
+    documents, _ = results[pdf]
+    assert documents[0]["metadata"]["page"] == 1 and documents[-1]["metadata"]["page_end"] == 3
+    assert results[str(txt)][0][0]["content"].startswith("Countersink depth")
@@ -0,0 +1,47 @@
+import pytest
+
+from model_interfaces.Query_Gate import Query_Rewrite_Gate
+
+
+
+HISTORY = "USER: What is the maximum feed for aluminium 2024?\nSYSTEM: 0.12 mm/rev according to INT_LDX_0001."
+
+
+@pytest.mark.parametrize("query", [
+    "¿Cuál es la velocidad de corte para el aluminio 2024?",
+    "¿Qué par de apriete se usa en los remaches de titanio según la norma?",
+    "Dime la tolerancia de los taladros en las piezas de acero 15-5PH",
+    "What is the spindle speed for countersinking CFRP laminate panels?",
+    "Which other tools are also required to ream titanium Ti6Al4V parts?",
+    "What is the installation torque defined in INT_LDX_BENCH_0003?",
+    "Why does 2024 aluminium corrode in salt spray per ISO 9227?",
+    "Entonces cual es la velocidad de corte del acero inoxidable 316?",
+])
+def test_standalone_queries_skip_rewrite(query):
+
+    assert not Query_Rewrite_Gate().needs_rewrite(query, HISTORY)
+
+
+@pytest.mark.parametrize("query", [
+    "¿Y para el titanio?",
+    "¿Qué par de apriete tiene eso en las piezas de acero?",
+    "Esa broca sirve también para piezas de Inconel 718?",
+    "¿Se aplica lo mismo a las piezas de CFRP laminate?",
+    "What is its spindle speed for steel parts?",
+    "Does the same tolerance apply to Inconel 718 parts?",
+    "Those values are valid for titanium parts too?",
+    "what about steel",
+    "Why is the feed lower there?",
+    "Entonces, ¿qué broca uso?",
+])
+def test_follow_up_queries_are_rewritten(query):
+
+    assert Query_Rewrite_Gate().needs_rewrite(query, HISTORY)
+
+
+def test_no_history_never_rewrites():
+
+    gate = Query_Rewrite_Gate()
+
+    assert not gate.needs_rewrite("¿Y eso?", "")
+    assert gate.stats() == {"rewritten": 0, "skipped": 1}